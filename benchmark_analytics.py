@@ -0,0 +1,150 @@
+import argparse
+import math
+import statistics
+import sys
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+import consumption_analytics
+from generate_raw_data import BASE_ROWS, PERIOD_START
+
+
+# Scaling benchmark for consumption_analytics.py
+#
+# For every scale factor (1 = the 3,500 bills of the sample, 1000 = 3.5
+# million) a bills table is synthesized in memory: every connection gets
+# BILLS_PER_CONNECTION consecutive 30-day bills around its own level of
+# daily use, and ANOMALY_RATE of the bills are multiplied by 0.2 or 3 (a
+# bypassed or a faulty meter). compute_metrics runs on it, and the results
+# are checked against a row-by-row Python implementation of the same metrics
+# on the first --reference-rows bills, which also gives the row-by-row speed.
+# The report shows bills per second for both and how many of the injected
+# anomalies were flagged:
+#
+#   python benchmark_analytics.py --scales 1 100 1000
+#
+# --database additionally runs the full refresh (COPY out, compute, COPY
+# back) against the database in the PG* environment variables.
+
+BILLS_PER_CONNECTION = 12
+ANOMALY_RATE = 0.01
+
+
+def synthetic_bills(scale, seed=0):
+    """(bills DataFrame of consumption_analytics.BILL_COLUMNS, boolean array of the injected anomalies)."""
+    rng = np.random.default_rng(seed)
+    n = int(BASE_ROWS["bills"] * scale)
+    connection = np.arange(n) // BILLS_PER_CONNECTION
+    month = np.arange(n) % BILLS_PER_CONNECTION
+    level = rng.uniform(3, 40, connection[-1] + 1)[connection]
+
+    starts = PERIOD_START + (month * 30 + rng.integers(0, 5, n)).astype("timedelta64[D]")
+    daily = level * rng.normal(1, 0.08, n)
+    anomalies = rng.random(n) < ANOMALY_RATE
+    daily[anomalies] *= rng.choice([0.2, 3.0], anomalies.sum())
+    kwh = np.maximum(np.round(daily * 30), 1)
+
+    bills = pd.DataFrame({
+        "bills_id": np.char.add("B", np.arange(n).astype(str)),
+        "connection_id": np.char.add("CN", connection.astype(str)),
+        "period_starts": starts.astype("datetime64[ns]"),
+        "period_ends": (starts + np.timedelta64(30, "D")).astype("datetime64[ns]"),
+        "kwh_used": kwh,
+        "amount": np.round(kwh * rng.uniform(0.12, 0.2, n), 2),
+    })
+    # bills arrive in no particular order
+    shuffled = rng.permutation(n)
+    return bills.iloc[shuffled].reset_index(drop=True), anomalies[shuffled]
+
+
+def row_by_row(bills, min_history=consumption_analytics.MIN_HISTORY):
+    """{bills_id: (avg_daily_kwh, mom_change, z_score)}, computed one bill at a time in plain Python."""
+    by_connection = defaultdict(list)
+    for row in bills.itertuples(index=False):
+        days = (row.period_ends - row.period_starts).days
+        by_connection[row.connection_id].append((row.period_starts, row.bills_id, row.kwh_used / days))
+
+    results = {}
+    for rows in by_connection.values():
+        rows.sort(key=lambda r: r[0])
+        previous = None
+        for i, (_, bills_id, avg) in enumerate(rows):
+            others = [r[2] for j, r in enumerate(rows) if j != i]
+            z = None
+            if len(others) >= min_history and statistics.stdev(others) > 0:
+                z = (avg - statistics.mean(others)) / statistics.stdev(others)
+            mom = avg / previous - 1 if previous else None
+            results[bills_id] = (avg, mom, z)
+            previous = avg
+    return results
+
+
+def same(a, b):
+    return (a is None and math.isnan(b)) or (a is not None and math.isclose(a, b, rel_tol=1e-6, abs_tol=1e-9))
+
+
+def check(metrics, reference):
+    """Number of bills of `reference` whose metrics differ from compute_metrics'."""
+    rows = metrics.set_index("bills_id").loc[list(reference), ["avg_daily_kwh", "mom_change", "z_score"]]
+    return sum(not all(same(r, v) for r, v in zip(reference[bills_id], values))
+               for bills_id, values in zip(rows.index, rows.itertuples(index=False)))
+
+
+def run_scale(scale, reference_rows, seed):
+    bills, anomalies = synthetic_bills(scale, seed)
+
+    start = time.perf_counter()
+    metrics = consumption_analytics.compute_metrics(bills)
+    vectorized = time.perf_counter() - start
+
+    # the reference needs whole connections, so it takes the first connections' bills
+    sample = bills[bills["connection_id"].isin(bills["connection_id"].unique()[:reference_rows // BILLS_PER_CONNECTION])]
+    start = time.perf_counter()
+    reference = row_by_row(sample)
+    python = time.perf_counter() - start
+    differences = check(metrics, reference) if reference else 0
+
+    flagged = metrics.set_index("bills_id")["flagged"].loc[bills["bills_id"]].to_numpy()
+    return [
+        f"{scale:g}x", f"{len(bills):,}", f"{vectorized:.3f}", f"{len(bills) / vectorized:,.0f}",
+        f"{len(sample) / python:,.0f}" if len(sample) else "-",
+        f"{flagged[anomalies].mean():.1%}", f"{flagged[~anomalies].mean():.2%}", differences,
+    ]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark consumption_analytics.py on synthetic bills.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10, 100, 1000],
+                        help="scale factors (1 = 3,500 bills)")
+    parser.add_argument("--reference-rows", type=int, default=50000,
+                        help="bills checked against the row-by-row implementation")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--database", action="store_true",
+                        help="also refresh Bill_Consumption from the bills in the database")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rows = [run_scale(scale, args.reference_rows, args.seed) for scale in args.scales]
+    print(tabulate(rows, headers=["scale", "bills", "compute s", "bills/s", "row-by-row bills/s",
+                                  "anomalies flagged", "normal flagged", "differences"]))
+
+    if args.database:
+        from db import close_pool, connection
+        try:
+            with connection() as conn:
+                start = time.perf_counter()
+                consumption_analytics.refresh(conn)
+                print(f" Refreshed Bill_Consumption in {time.perf_counter() - start:.3f}s")
+        finally:
+            close_pool()
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import argparse
+import statistics
+import sys
+import time
+from itertools import combinations
+
+from tabulate import tabulate
+
+import dispatch
+from db import close_pool, connection
+
+
+# Benchmark of the dispatch index (dispatch.py) against the SQL join
+#
+# In one transaction on the database in the PG* environment variables,
+# --open-rate of the service orders are reopened (their end_date cleared)
+# so the technicians have open orders to rank by, and the index is built
+# from what that transaction sees. Every region is then asked for every set
+# of up to --max-skills skills, by the index and by dispatch.CANDIDATES, and
+# the two answers are compared. The report shows the time per query of both
+# and what it costs to build the index and to apply a change. The
+# transaction is rolled back at the end, so the database is left as it was:
+#
+#   python benchmark_dispatch.py
+#   python benchmark_dispatch.py --open-rate 0.3 --limit 10 --repeat 2000
+
+OPEN_RATE = 0.1
+MAX_SKILLS = 2
+
+
+def queries(index, max_skills=MAX_SKILLS):
+    """(region, skills) of every region and every set of up to `max_skills` skills."""
+    skill_sets = [list(c) for size in range(max_skills + 1) for c in combinations(index.skills(), size)]
+    return [(region, skills) for region in index.regions() for skills in skill_sets]
+
+
+def per_call(function, repeat):
+    """Seconds per call of function(), the best of 3 rounds of `repeat` calls."""
+    best = float("inf")
+    for _ in range(3):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        best = min(best, (time.perf_counter() - start) / repeat)
+    return best
+
+
+def percentiles(values):
+    values = sorted(values)
+    return values[len(values) // 2], values[int(len(values) * 0.95)], values[-1]
+
+
+def run(cur, open_rate=OPEN_RATE, max_skills=MAX_SKILLS, limit=dispatch.DISPATCH_LIMIT, repeat=1000, sql_repeat=20,
+        seed=0):
+    """Rows of the report: (what, count, p50, p95, max), times in µs."""
+    cur.execute("SELECT setseed(%s);", (seed / 2 ** 31,))
+    cur.execute("UPDATE electrogrid.service_orders SET end_date = NULL WHERE random() < %s;", (open_rate,))
+    cur.execute("ANALYZE electrogrid.service_orders;")
+
+    index = dispatch.DispatchIndex()
+    # the transaction has already written, so it cannot become a snapshot; it sees its own changes anyway
+    builds = [per_call(lambda: index.load(cur, snapshot=False), 1) for _ in range(3)]
+    print(f" Index of {len(index.technicians):,} technicians, {len(index.skills())} skills, "
+          f"{sum(index.open_orders.values()):,} open service orders")
+
+    index_times, sql_times, mismatches = [], [], 0
+    asked = queries(index, max_skills)
+    for region, skills in asked:
+        found = index.candidates(region, skills, limit)
+        expected = dispatch.sql_candidates(cur, region, skills, limit)
+        mismatches += [(p, n) for p, _, n in found] != [(p, n) for p, _, n in expected]
+        index_times.append(per_call(lambda: index.candidates(region, skills, limit), repeat))
+        sql_times.append(per_call(lambda: dispatch.sql_candidates(cur, region, skills, limit), sql_repeat))
+    if mismatches:
+        print(f" {mismatches} of {len(asked)} answers differ between the index and the SQL join")
+
+    # one technician's count read again after a change, and the same change applied in memory only
+    technician = max(index.open_orders, key=index.open_orders.get)
+    count = index.open_orders[technician]
+    refreshes = [per_call(lambda: index.refresh(cur, [technician]), 1) for _ in range(20)]
+    moves = [per_call(lambda: (index.set_open_orders({technician: count + 1}, [technician]),
+                               index.set_open_orders({technician: count}, [technician])), repeat) / 2]
+
+    micro = lambda seconds: [s * 1e6 for s in seconds]
+    return [
+        ["index query", len(asked), *percentiles(micro(index_times))],
+        ["SQL join", len(asked), *percentiles(micro(sql_times))],
+        ["index build", len(builds), *percentiles(micro(builds))],
+        ["count refresh (1 technician)", len(refreshes), *percentiles(micro(refreshes))],
+        ["count update in memory", 1, *percentiles(micro(moves))],
+    ]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark the dispatch index against the SQL join.")
+    parser.add_argument("--open-rate", type=float, default=OPEN_RATE, help="share of service orders to reopen")
+    parser.add_argument("--max-skills", type=int, default=MAX_SKILLS, help="largest set of skills asked for")
+    parser.add_argument("--limit", type=int, default=dispatch.DISPATCH_LIMIT, help="candidates per query")
+    parser.add_argument("--repeat", type=int, default=1000, help="index queries per timing")
+    parser.add_argument("--sql-repeat", type=int, default=20, help="SQL queries per timing")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            try:
+                rows = run(cur, args.open_rate, args.max_skills, args.limit, args.repeat, args.sql_repeat, args.seed)
+            finally:
+                conn.rollback()
+        print(tabulate(rows, headers=["", "n", "p50 µs", "p95 µs", "max µs"], floatfmt=",.1f"))
+        index_p50, sql_p50 = rows[0][2], rows[1][2]
+        print(f" The index answers {sql_p50 / index_p50:,.0f} times faster than the SQL join (p50)")
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
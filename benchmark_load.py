@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from tabulate import tabulate
+
+import generate_raw_data
+import load_electrogrid
+import raw_dataset
+
+
+# Scaling benchmark for load_electrogrid.py
+#
+# For every scale factor a synthetic dataset is generated once (and kept in
+# .cache/bench/), then the loader runs against it in a subprocess, once per
+# loader variant. The database connection comes from the PG* environment
+# variables, which the loader reads as well, so point them at a local server:
+#
+#   PGHOST=localhost python benchmark_load.py --scales 1 10 100 --variant="" --variant="--method copy"
+#
+# Each run reports the loader's own stage times (--timings-json), the total
+# wall time, the peak RSS of the loader process (and of the worker processes
+# it waited for) and the rows in the database afterwards per second of wall
+# time. The raw-data cache is cleared before every run unless --warm-cache is
+# given, so CSV parsing is always part of the measurement.
+
+BENCH_DIR = Path("./.cache/bench")
+REPO_DIR = Path(__file__).resolve().parent
+
+
+def dataset(scale, seed, regenerate):
+    """Directory with the raw CSVs for `scale`, generated on first use."""
+    out_dir = BENCH_DIR / f"raw_{scale:g}x"
+    files = [spec["file"] for spec in raw_dataset.RAW_FILES.values()]
+    if regenerate or not all((out_dir / f).exists() for f in files):
+        start = time.perf_counter()
+        rows = generate_raw_data.generate(scale, out_dir, seed)
+        print(f" Generated {scale:g}x: {sum(rows.values())} raw rows in {time.perf_counter() - start:.1f}s")
+    return out_dir
+
+
+def count_rows():
+    conn = load_electrogrid.connect()
+    try:
+        with conn.cursor() as cur:
+            counts = {}
+            for table in load_electrogrid.LOAD_ORDER:
+                cur.execute(f"SELECT count(*) FROM {load_electrogrid.PGSCHEMA}.{table};")
+                counts[table] = cur.fetchone()[0]
+        return counts
+    finally:
+        conn.close()
+
+
+def run_loader(csv_dir, loader_args):
+    """Run the loader once. Returns (exit ok, wall seconds, peak RSS bytes, stage timings, output)."""
+    with tempfile.TemporaryDirectory() as tmp:
+        timings_file = Path(tmp) / "timings.json"
+        command = [sys.executable, "load_electrogrid.py", "--csv-dir", str(csv_dir.resolve()),
+                   "--timings-json", str(timings_file), *loader_args]
+
+        start = time.perf_counter()
+        proc = subprocess.Popen(command, cwd=REPO_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, text=True)
+        output = proc.stdout.read()
+        # wait4 gives the resource usage of this child alone
+        _, status, usage = os.wait4(proc.pid, 0)
+        elapsed = time.perf_counter() - start
+        proc.returncode = os.waitstatus_to_exitcode(status)
+        proc.stdout.close()
+
+        timings = json.loads(timings_file.read_text()) if timings_file.exists() else {}
+
+    # The loader reports failures on stdout and carries on, so look for them there too
+    ok = proc.returncode == 0 and not any(line.startswith("Error") for line in output.splitlines())
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+    return ok, elapsed, peak_rss, timings, output
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark load_electrogrid.py on synthetic data at several scales.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10],
+                        help="scale factors to run (multiples of the sample data), e.g. 1 10 100 1000")
+    parser.add_argument("--variant", action="append", default=None,
+                        help='loader arguments for one variant, e.g. --variant="--method copy" (repeatable; '
+                             'default runs the loader with no extra arguments)')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--regenerate", action="store_true", help="regenerate the synthetic data even if present")
+    parser.add_argument("--warm-cache", action="store_true", help="keep the parsed raw-data cache between runs")
+    parser.add_argument("--json", type=Path, default=None, help="also write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="print the loader output of every run")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    variants = args.variant or [""]
+
+    results = []
+    for scale in args.scales:
+        csv_dir = dataset(scale, args.seed, args.regenerate)
+        for variant in variants:
+            if not args.warm_cache:
+                shutil.rmtree(REPO_DIR / raw_dataset.CACHE_DIR, ignore_errors=True)
+
+            ok, elapsed, peak_rss, timings, output = run_loader(csv_dir, shlex.split(variant))
+            if args.verbose or not ok:
+                print(output)
+            rows = sum(count_rows().values()) if ok else 0
+
+            results.append({
+                "scale": scale,
+                "variant": variant or "(default)",
+                "ok": ok,
+                "wall_s": elapsed,
+                "peak_rss_mb": peak_rss / 2**20,
+                "rows": rows,
+                "rows_per_s": rows / elapsed if ok else 0.0,
+                "stages": timings,
+            })
+            print(f" {scale:g}x {variant or '(default)'}: {'ok' if ok else 'FAILED'} in {elapsed:.2f}s")
+
+    stages = list(dict.fromkeys(stage for r in results for stage in r["stages"]))
+    table = [
+        [f"{r['scale']:g}x", r["variant"], "yes" if r["ok"] else "NO", f"{r['wall_s']:.2f}",
+         f"{r['peak_rss_mb']:.0f}", r["rows"], f"{r['rows_per_s']:,.0f}"]
+        + [f"{r['stages'][s]:.2f}" if s in r["stages"] else "" for s in stages]
+        for r in results
+    ]
+    headers = ["scale", "variant", "ok", "wall s", "peak RSS MB", "rows", "rows/s"] + [f"{s} s" for s in stages]
+    print(tabulate(table, headers=headers))
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
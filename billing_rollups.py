@@ -0,0 +1,241 @@
+import argparse
+import sys
+import time
+
+from tabulate import tabulate
+
+from db import close_pool, connection
+
+
+# Monthly billing totals per client, connection and region
+#
+# The Bill_Rollup_* tables in electrogrid.sql hold, per month, the kWh used,
+# the amount billed, the amount paid and the number of bills and of unpaid
+# bills (no payment_date), and triggers on Bills keep them up to date as bills
+# are loaded, updated or deleted. The reports below read those few rows by
+# primary key instead of joining and summing the bills, so they take about the
+# same time however many bills there are.
+#
+# From the command line:
+#
+#   python billing_rollups.py --region Porto      monthly totals of a region (all regions without a name)
+#   python billing_rollups.py --client C016       monthly totals and balance of a client
+#   python billing_rollups.py --outstanding 10    clients with the highest unpaid balance
+#   python billing_rollups.py --verify            compare the rollups with the bills
+#   python billing_rollups.py --rebuild           recompute the rollups from the bills
+#
+# --verify and --rebuild cover the months from the first one still in Bills
+# (or --from): the rollups keep the totals of archived months.
+
+ROLLUP_COLUMNS = ["kwh_used", "amount_billed", "amount_paid", "bill_count", "unpaid_count"]
+HEADERS = ["month", "kWh used", "billed", "paid", "bills", "unpaid"]
+
+# Totals of every rollup, computed from the bills as the triggers define them:
+# by month of issue_date, in the region of the connection's technician
+AGGREGATES = {
+    "bill_rollup_client": ("client_id", """
+        SELECT b.client_id, {totals}
+        FROM electrogrid.bills AS b
+        WHERE b.issue_date IS NOT NULL AND b.client_id IS NOT NULL
+        GROUP BY 1, 2
+    """),
+    "bill_rollup_connection": ("connection_id", """
+        SELECT b.connection_id, {totals}
+        FROM electrogrid.bills AS b
+        WHERE b.issue_date IS NOT NULL AND b.connection_id IS NOT NULL
+        GROUP BY 1, 2
+    """),
+    "bill_rollup_region": ("region_name", """
+        SELECT t.region_name, {totals}
+        FROM electrogrid.bills AS b
+        JOIN electrogrid.connections AS c ON c.connection_id = b.connection_id
+        JOIN electrogrid.technician AS t ON t.person_id = c.technician_id
+        WHERE b.issue_date IS NOT NULL AND t.region_name IS NOT NULL
+        GROUP BY 1, 2
+    """),
+}
+TOTALS = """date_trunc('month', b.issue_date)::DATE AS month,
+               sum(coalesce(b.kwh_used, 0)), sum(coalesce(b.amount, 0)),
+               sum(CASE WHEN b.payment_date IS NOT NULL THEN coalesce(b.amount, 0) ELSE 0 END),
+               count(*), count(*) FILTER (WHERE b.payment_date IS NULL)"""
+
+
+#---------------------------------- Reports --------------------------------------------#
+
+def months_between(date_from, date_to):
+    """WHERE clause and parameters for an optional [date_from, date_to] month range."""
+    where, params = [], []
+    if date_from is not None:
+        where.append("month >= date_trunc('month', %s::DATE)")
+        params.append(date_from)
+    if date_to is not None:
+        where.append("month <= %s")
+        params.append(date_to)
+    return "".join(f" AND {w}" for w in where), params
+
+
+def region_months(conn, region=None, date_from=None, date_to=None):
+    """(region_name, month, kwh_used, amount_billed, amount_paid, bill_count, unpaid_count) rows, by region and month."""
+    dates, params = months_between(date_from, date_to)
+    where = "region_name = %s" if region is not None else "TRUE"
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT region_name, month, {', '.join(ROLLUP_COLUMNS)}
+            FROM electrogrid.bill_rollup_region
+            WHERE {where}{dates}
+            ORDER BY region_name, month;
+        """, ([region] if region is not None else []) + params)
+        return cur.fetchall()
+
+
+def client_months(conn, client_id, date_from=None, date_to=None):
+    """(month, kwh_used, amount_billed, amount_paid, bill_count, unpaid_count) rows of a client, by month."""
+    dates, params = months_between(date_from, date_to)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT month, {', '.join(ROLLUP_COLUMNS)}
+            FROM electrogrid.bill_rollup_client
+            WHERE client_id = %s{dates}
+            ORDER BY month;
+        """, [client_id] + params)
+        return cur.fetchall()
+
+
+def connection_months(conn, connection_id, date_from=None, date_to=None):
+    """(month, kwh_used, amount_billed, amount_paid, bill_count, unpaid_count) rows of a connection, by month."""
+    dates, params = months_between(date_from, date_to)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT month, {', '.join(ROLLUP_COLUMNS)}
+            FROM electrogrid.bill_rollup_connection
+            WHERE connection_id = %s{dates}
+            ORDER BY month;
+        """, [connection_id] + params)
+        return cur.fetchall()
+
+
+def client_balance(conn, client_id):
+    """(amount_billed, amount_paid, outstanding, unpaid_count) of a client over all months."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT coalesce(sum(amount_billed), 0), coalesce(sum(amount_paid), 0),
+                   coalesce(sum(amount_billed - amount_paid), 0), coalesce(sum(unpaid_count), 0)
+            FROM electrogrid.bill_rollup_client
+            WHERE client_id = %s;
+        """, (client_id,))
+        return cur.fetchone()
+
+
+def top_outstanding(conn, limit=20):
+    """(client_id, outstanding, unpaid_count) of the `limit` clients with the highest unpaid balance.
+
+    Only the months with unpaid bills are read (bill_rollup_client_unpaid_idx):
+    in every other month the amount paid equals the amount billed.
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT client_id, sum(amount_billed - amount_paid) AS outstanding, sum(unpaid_count)
+            FROM electrogrid.bill_rollup_client
+            WHERE unpaid_count > 0
+            GROUP BY client_id
+            ORDER BY outstanding DESC, client_id
+            LIMIT %s;
+        """, (limit,))
+        return cur.fetchall()
+
+
+#---------------------------------- Maintenance --------------------------------------------#
+
+def first_month(cur):
+    """The first month with bills in Bills (earlier ones may be archived), or None without bills."""
+    cur.execute("SELECT date_trunc('month', min(issue_date))::DATE FROM electrogrid.bills;")
+    return cur.fetchone()[0]
+
+
+def rebuild(cur, date_from=None, date_to=None):
+    """Recompute the rollups of a month range from the bills (for a database loaded before the triggers existed).
+
+    The range starts at the first month in Bills unless `date_from` is given.
+    """
+    dates, params = months_between(date_from or first_month(cur), date_to)
+    for table, (key, query) in AGGREGATES.items():
+        cur.execute(f"DELETE FROM electrogrid.{table} WHERE TRUE{dates};", params)
+        cur.execute(f"INSERT INTO electrogrid.{table} ({key}, month, {', '.join(ROLLUP_COLUMNS)}) "
+                    f"SELECT * FROM ({query.format(totals=TOTALS)}) AS totals WHERE TRUE{dates};", params)
+
+
+def verify(cur, date_from=None, date_to=None):
+    """{rollup table: number of rows that differ from the totals computed from the bills}, over a month range.
+
+    The range starts at the first month in Bills unless `date_from` is given.
+    """
+    dates, params = months_between(date_from or first_month(cur), date_to)
+    differences = {}
+    for table, (key, query) in AGGREGATES.items():
+        cur.execute(f"""
+            WITH expected AS (SELECT * FROM ({query.format(totals=TOTALS)}) AS totals WHERE TRUE{dates}),
+            stored AS (SELECT {key}, month, {', '.join(ROLLUP_COLUMNS)} FROM electrogrid.{table} WHERE TRUE{dates})
+            SELECT count(*) FROM ((TABLE expected EXCEPT ALL TABLE stored)
+                                  UNION ALL (TABLE stored EXCEPT ALL TABLE expected)) AS d;
+        """, params * 2)
+        differences[table] = cur.fetchone()[0]
+    return differences
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Monthly billing totals per client, connection and region.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--region", nargs="?", const="", metavar="NAME",
+                       help="monthly totals of a region, or of every region without a name")
+    group.add_argument("--client", metavar="ID", help="monthly totals and balance of a client")
+    group.add_argument("--connection", metavar="ID", help="monthly totals of a connection")
+    group.add_argument("--outstanding", type=int, metavar="N", help="the N clients with the highest unpaid balance")
+    group.add_argument("--verify", action="store_true", help="compare the rollups with totals computed from the bills")
+    group.add_argument("--rebuild", action="store_true", help="recompute the rollups from the bills")
+    parser.add_argument("--from", dest="date_from", metavar="YYYY-MM-DD", help="first month to report, verify or rebuild")
+    parser.add_argument("--to", dest="date_to", metavar="YYYY-MM-DD", help="last month to report, verify or rebuild")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    try:
+        with connection() as conn:
+            if args.rebuild:
+                with conn.cursor() as cur:
+                    rebuild(cur, args.date_from, args.date_to)
+                conn.commit()
+                print(f" Rebuilt the billing rollups in {time.perf_counter() - start:.3f}s")
+                return 0
+            if args.verify:
+                with conn.cursor() as cur:
+                    differences = verify(cur, args.date_from, args.date_to)
+                print(tabulate(differences.items(), headers=["rollup", "rows that differ"]))
+                return 1 if any(differences.values()) else 0
+
+            if args.region is not None:
+                rows = region_months(conn, args.region or None, args.date_from, args.date_to)
+                print(tabulate(rows, headers=["region"] + HEADERS, tablefmt="grid"))
+            elif args.client is not None:
+                rows = client_months(conn, args.client, args.date_from, args.date_to)
+                print(tabulate(rows, headers=HEADERS, tablefmt="grid"))
+                billed, paid, outstanding, unpaid = client_balance(conn, args.client)
+                print(f" Billed {billed}, paid {paid}, outstanding {outstanding} ({unpaid} unpaid bills)")
+            elif args.connection is not None:
+                rows = connection_months(conn, args.connection, args.date_from, args.date_to)
+                print(tabulate(rows, headers=HEADERS, tablefmt="grid"))
+            else:
+                rows = top_outstanding(conn, args.outstanding)
+                print(tabulate(rows, headers=["client", "outstanding", "unpaid bills"], tablefmt="grid"))
+            conn.rollback()
+        print(f" {len(rows)} rows in {(time.perf_counter() - start) * 1e3:.1f} ms")
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
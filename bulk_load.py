@@ -0,0 +1,118 @@
+import time
+
+from incremental import reset_state
+
+
+# Bulk-load mode: load into bare tables, then build keys and foreign keys
+#
+# Every row inserted into a fully constrained table pays for primary-key and
+# UNIQUE index maintenance and for a foreign-key lookup per reference. For a
+# full rebuild it is much cheaper to load the rows first and build each index
+# once, in bulk, afterwards.
+#
+# The constraints and indexes are read from the catalog (whatever
+# electrogrid.sql created), dropped, and re-created after the load from their
+# own definitions: primary keys, UNIQUE constraints and plain indexes first,
+# then CHECK constraints and foreign keys as NOT VALID, and finally one
+# VALIDATE CONSTRAINT per foreign key and check, which scans the table once
+# instead of checking row by row. Foreign keys of the partitioned tables (Bills,
+# Service_Orders) cannot be NOT VALID and are checked as they are added, and
+# their indexes are re-created on every partition. Everything runs in the caller's
+# transaction, so if any key or reference turns out to be violated the load
+# rolls back with the original tables, constraints included.
+#
+# ALTER TABLE holds an exclusive lock on the tables until the commit, so
+# readers wait for the rebuild to finish.
+
+# Memory for index builds (sorts) and foreign-key validation in this transaction
+MAINTENANCE_WORK_MEM = "256MB"
+
+
+def saved_constraints(cur, schema_name, tables):
+    """Definitions of the PK, UNIQUE, CHECK and FK constraints and plain indexes of `tables`."""
+    cur.execute("""
+        SELECT t.relname, c.conname, c.contype, pg_get_constraintdef(c.oid), t.relkind = 'p'
+        FROM pg_constraint c
+        JOIN pg_class t ON t.oid = c.conrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = %s AND t.relname = ANY(%s) AND c.contype IN ('p', 'u', 'c', 'f')
+        ORDER BY t.relname, c.conname;
+    """, (schema_name, list(tables)))
+    constraints = [
+        {"table": table, "name": name, "type": kind, "definition": definition, "partitioned": partitioned}
+        for table, name, kind, definition, partitioned in cur.fetchall()
+    ]
+
+    cur.execute("""
+        SELECT t.relname, i.relname, pg_get_indexdef(x.indexrelid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN pg_class t ON t.oid = x.indrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = %s AND t.relname = ANY(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = x.indexrelid)
+        ORDER BY t.relname, i.relname;
+    """, (schema_name, list(tables)))
+    # the index of a partitioned table is defined ON ONLY the parent; without
+    # ONLY, re-creating it builds the index of every partition as well
+    indexes = [{"table": table, "name": name, "definition": definition.replace(" ON ONLY ", " ON ", 1)}
+               for table, name, definition in cur.fetchall()]
+    return {"constraints": constraints, "indexes": indexes}
+
+
+def drop_constraints(cur, schema_name, tables):
+    """Drop every constraint and index of `tables` and return their definitions."""
+    saved = saved_constraints(cur, schema_name, tables)
+
+    # foreign keys first: a primary key cannot be dropped while a foreign key uses it
+    for constraint in sorted(saved["constraints"], key=lambda c: c["type"] != "f"):
+        cur.execute(f'ALTER TABLE {schema_name}.{constraint["table"]} DROP CONSTRAINT "{constraint["name"]}";')
+    for index in saved["indexes"]:
+        cur.execute(f'DROP INDEX {schema_name}."{index["name"]}";')
+
+    print(f" Dropped {len(saved['constraints'])} constraints and {len(saved['indexes'])} indexes")
+    return saved
+
+
+def truncate_tables(cur, schema_name, tables):
+    cur.execute(f"TRUNCATE {', '.join(f'{schema_name}.{t}' for t in tables)};")
+    reset_state(cur, schema_name)
+
+
+def restore_constraints(cur, schema_name, saved):
+    """Re-create what drop_constraints removed. Returns the seconds spent in each phase."""
+    phases = {}
+    cur.execute(f"SET LOCAL maintenance_work_mem = '{MAINTENANCE_WORK_MEM}';")
+
+    def add(constraint, suffix=""):
+        cur.execute(f'ALTER TABLE {schema_name}.{constraint["table"]} '
+                    f'ADD CONSTRAINT "{constraint["name"]}" {constraint["definition"]}{suffix};')
+
+    # PostgreSQL cannot add a NOT VALID foreign key to a partitioned table, so
+    # those are checked as they are added, one scan per partition
+    deferred = [c for c in saved["constraints"] if c["type"] in ("c", "f") and not c["partitioned"]]
+    immediate = [c for c in saved["constraints"] if c["type"] in ("c", "f") and c["partitioned"]]
+
+    start = time.perf_counter()
+    for constraint in saved["constraints"]:
+        if constraint["type"] in ("p", "u"):
+            add(constraint)
+    for index in saved["indexes"]:
+        cur.execute(index["definition"] + ";")
+    phases["indexes"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for constraint in deferred:
+        add(constraint, " NOT VALID")
+    for constraint in immediate:
+        add(constraint)
+    phases["constraints"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for constraint in deferred:
+        cur.execute(f'ALTER TABLE {schema_name}.{constraint["table"]} VALIDATE CONSTRAINT "{constraint["name"]}";')
+    phases["validate"] = time.perf_counter() - start
+
+    print(f" Rebuilt keys and indexes in {phases['indexes']:.3f}s, added {len(deferred) + len(immediate)} checks and "
+          f"foreign keys in {phases['constraints']:.3f}s, validated them in {phases['validate']:.3f}s")
+    return phases
@@ -0,0 +1,201 @@
+import pandas as pd
+
+
+# Typed, vectorized cleaning
+#
+# Each table has a spec describing, for every target column, which raw column
+# it comes from and what kind of value it holds. clean() builds the cleaned
+# frame in one pass: every column is converted once with vectorized string /
+# datetime / numeric operations, rows missing a required value are dropped
+# with a single mask, and duplicates are removed on the table's key.
+#
+# Missing values stay missing. Text columns are stripped without astype(str),
+# which would turn NaN into the string "nan" and let it pass the null checks,
+# and an empty string counts as missing.
+#
+# Column kinds:
+#   id        stripped text used as a key
+#   text      stripped free text
+#   category  stripped text with few distinct values, stored as a pandas categorical;
+#             `case` ("title", "upper", "lower") normalizes the spelling
+#   phone     digits only, last 9 kept (drops country codes, spaces and brackets)
+#   date      parsed with `format` (ISO dates by default); unparseable values become NaT
+#   number    parsed as a number, rounded to `decimals` if given; bad values become NaN
+
+DATE_FORMAT = "%Y-%m-%d"
+
+
+def column(source, kind, **options):
+    return {"source": source, "kind": kind, **options}
+
+
+SPECS = {
+    "region": {
+        "columns": {"region_name": column("region", "category", case="title")},
+        "required": ["region_name"],
+        "unique": ["region_name"],
+    },
+    "connection_type": {
+        "columns": {"connection_type": column("connection_type", "category")},
+        "required": ["connection_type"],
+        "unique": ["connection_type"],
+    },
+    "status": {
+        "columns": {"status": column("status", "category", case="title")},
+        "required": ["status"],
+        "unique": ["status"],
+    },
+    "service_type": {
+        "columns": {"service_type": column("service_type", "category")},
+        "required": ["service_type"],
+        "unique": ["service_type"],
+    },
+    "client_person": {
+        "columns": {
+            "person_id": column("client_id", "id"),
+            "name": column("client_name", "text"),
+            "email": column("email", "text"),
+            "phone": column("phone", "phone"),
+        },
+        "required": ["person_id"],
+        "unique": ["person_id"],
+    },
+    "technician_person": {
+        "columns": {
+            "person_id": column("technician_id", "id"),
+            "name": column("technician_name", "text"),
+            "email": column("email", "text"),
+            "phone": column("phone", "phone"),
+        },
+        "required": ["person_id"],
+        "unique": ["person_id"],
+    },
+    "client": {
+        "columns": {
+            "person_id": column("client_id", "id"),
+            "address": column("address", "text"),
+        },
+        "required": ["person_id"],
+        "unique": ["person_id"],
+    },
+    "technician": {
+        "columns": {
+            "person_id": column("technician_id", "id"),
+            "region_name": column("region", "category", case="title"),
+        },
+        "required": ["person_id", "region_name"],
+        "unique": ["person_id"],
+    },
+    "technician_skill": {
+        # applied after the comma-separated skills list is exploded into one row per skill
+        "columns": {
+            "technician_id": column("technician_id", "id"),
+            "skill_name": column("skills", "category", case="title"),
+        },
+        "required": ["technician_id", "skill_name"],
+        "unique": ["technician_id", "skill_name"],
+    },
+    "connections": {
+        "columns": {
+            "connection_id": column("connection_id", "id"),
+            "property_address": column("property_address", "text"),
+            "install_date": column("install_date", "date"),
+            "meter_serial": column("meter_serial", "id"),
+            "connection_type": column("connection_type", "category"),
+            "status": column("status", "category", case="title"),
+            "client_id": column("client_id", "id"),
+            "technician_id": column("technician_id", "id"),
+        },
+        "required": ["connection_id", "client_id", "technician_id"],
+        "unique": ["connection_id"],
+    },
+    "bills": {
+        "columns": {
+            "bills_id": column("bill_id", "id"),
+            "period_starts": column("period_start", "date"),
+            "period_ends": column("period_end", "date"),
+            "kwh_used": column("kwh_used", "number"),
+            "amount": column("amount", "number", decimals=2),
+            "issue_date": column("issue_date", "date"),
+            "payment_date": column("payment_date", "date"),
+            "client_id": column("client_id", "id"),
+            "connection_id": column("connection_id", "id"),
+        },
+        "required": ["bills_id", "issue_date", "client_id", "connection_id"],
+        "unique": ["bills_id"],
+    },
+    "service_orders": {
+        "columns": {
+            "service_order_id": column("service_order_id", "id"),
+            "start_date": column("start_date", "date"),
+            "end_date": column("end_date", "date"),
+            "notes": column("notes", "text"),
+            "client_id": column("client_id", "id"),
+            "technician_id": column("technician_id", "id"),
+            "connection_id": column("connection_id", "id"),
+            "service_type": column("service_type", "category"),
+        },
+        "required": ["service_order_id", "start_date", "client_id", "technician_id", "connection_id", "service_type"],
+        "unique": ["service_order_id"],
+    },
+    "meter_check": {
+        # the rows are hard-coded in transforms.meter_check_data, with the table's own column names
+        "columns": {
+            "check_id": column("check_id", "id"),
+            "meter_serial": column("meter_serial", "id"),
+            "technician_id": column("technician_id", "id"),
+            "check_date": column("check_date", "date"),
+            "meter_read": column("meter_read", "text"),
+        },
+        "required": ["check_id", "check_date"],
+        "unique": ["check_id"],
+    },
+}
+
+
+def strip_text(series):
+    """Strip whitespace and treat empty strings as missing, keeping NaN as NaN."""
+    series = series.str.strip()
+    return series.mask(series == "")
+
+
+def convert(series, spec):
+    """Convert one raw column according to its spec."""
+    kind = spec["kind"]
+
+    if kind in ("id", "text"):
+        return strip_text(series)
+
+    if kind == "category":
+        series = strip_text(series)
+        case = spec.get("case")
+        if case:
+            series = getattr(series.str, case)()
+        return series.astype("category")
+
+    if kind == "phone":
+        digits = series.str.replace(r"\D", "", regex=True).str[-9:]
+        return digits.mask(digits == "")
+
+    if kind == "date":
+        return pd.to_datetime(series, format=spec.get("format", DATE_FORMAT), errors="coerce")
+
+    if kind == "number":
+        numbers = pd.to_numeric(series, errors="coerce")
+        if "decimals" in spec:
+            numbers = numbers.round(spec["decimals"])
+        return numbers
+
+    raise ValueError(f"Unknown column kind: {kind}")
+
+
+def clean(df_raw, table):
+    """Return the cleaned frame for `table`, with its columns in spec order."""
+    spec = SPECS[table]
+    df = pd.DataFrame({name: convert(df_raw[col["source"]], col) for name, col in spec["columns"].items()})
+
+    if spec.get("required"):
+        df = df[df[spec["required"]].notna().all(axis=1)]
+    if spec.get("unique"):
+        df = df.drop_duplicates(subset=spec["unique"], keep="first")
+    return df
@@ -0,0 +1,205 @@
+import argparse
+import io
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from copy_load import copy_dataframe, read_csv_columns
+from db import close_pool, connection
+
+
+# Consumption metrics and anomaly flags for every bill
+#
+# The bills are read in one COPY ... TO STDOUT into columnar arrays, and
+# every metric is computed for all connections at once with array
+# operations: the bills are sorted by connection and period, so each
+# connection's bills are one contiguous run, its previous bill is the row
+# before, and per-connection sums are np.bincount over the connection codes.
+# No Python code runs per bill or per connection. The results go back with
+# one COPY into Bill_Consumption (see electrogrid.sql).
+#
+# Metrics per bill:
+#   days           length of the billing period (period_ends - period_starts)
+#   avg_daily_kwh  kwh_used / days
+#   price_per_kwh  amount / kwh_used
+#   mom_change     relative change of avg_daily_kwh since the connection's previous bill
+#   z_score        (avg_daily_kwh - mean) / std of the connection's *other* bills
+#
+# The z-score leaves the bill itself out of the mean and standard deviation:
+# with a few bills per connection, one outlier inflates the standard deviation
+# so much that it could never be far from a mean it is part of. It needs at
+# least MIN_HISTORY other bills, and bills with |z_score| >= Z_THRESHOLD are
+# flagged (a drop can be theft or a stuck meter, a jump a faulty one).
+#
+#   python consumption_analytics.py                      compute and write the metrics of every bill
+#   python consumption_analytics.py --connection CN1252  time series of one connection
+#   python consumption_analytics.py --flagged 20         the flagged bills furthest from their history
+
+Z_THRESHOLD = float(os.environ.get("ELECTROGRID_Z_THRESHOLD", 3.0))
+MIN_HISTORY = int(os.environ.get("ELECTROGRID_MIN_HISTORY", 3))
+
+BILL_COLUMNS = ["bills_id", "connection_id", "period_starts", "period_ends", "kwh_used", "amount"]
+BILL_TYPES = {"period_starts": "datetime", "period_ends": "datetime", "kwh_used": "float", "amount": "float"}
+METRIC_COLUMNS = ["bills_id", "connection_id", "period_starts", "days", "avg_daily_kwh",
+                  "price_per_kwh", "mom_change", "z_score", "flagged"]
+
+READ_BILLS = f"""
+    COPY (SELECT {', '.join(BILL_COLUMNS)} FROM electrogrid.bills WHERE connection_id IS NOT NULL)
+    TO STDOUT WITH (FORMAT csv)
+"""
+
+SERIES_HEADERS = ["bill", "period start", "days", "kWh/day", "price/kWh", "change", "z-score", "flagged"]
+
+
+#---------------------------------- Metrics --------------------------------------------#
+
+def read_bills(cur):
+    """Every bill with a connection as a DataFrame of BILL_COLUMNS, in one COPY."""
+    buffer = io.BytesIO()
+    cur.copy_expert(READ_BILLS, buffer, size=1 << 20)
+    if not buffer.tell():
+        return pd.DataFrame({column: [] for column in BILL_COLUMNS})
+    buffer.seek(0)
+    return read_csv_columns(buffer, BILL_COLUMNS, BILL_TYPES)
+
+
+def compute_metrics(bills, threshold=Z_THRESHOLD, min_history=MIN_HISTORY):
+    """DataFrame of METRIC_COLUMNS for `bills` (BILL_COLUMNS), sorted by connection and period."""
+    codes, _ = pd.factorize(bills["connection_id"])
+    starts = bills["period_starts"].to_numpy(dtype="datetime64[D]")
+    ends = bills["period_ends"].to_numpy(dtype="datetime64[D]")
+    order = np.lexsort((starts, codes))
+    codes, starts, ends = codes[order], starts[order], ends[order]
+    kwh = bills["kwh_used"].to_numpy(dtype=float)[order]
+    amount = bills["amount"].to_numpy(dtype=float)[order]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        days = (ends - starts).astype(float)  # NaT becomes NaN
+        days[~(days > 0)] = np.nan
+        avg = kwh / days
+        price = np.where(kwh > 0, amount / kwh, np.nan)
+
+        # previous bill of the same connection: the row before, within the same run
+        same = np.zeros(len(codes), dtype=bool)
+        same[1:] = codes[1:] == codes[:-1]
+        previous = np.empty_like(avg)
+        previous[:1] = np.nan
+        previous[1:] = avg[:-1]
+        mom = np.where(same & (previous > 0), avg / previous - 1, np.nan)
+
+        # leave-one-out mean and sample variance from per-connection count, sum and sum of squares
+        valid = ~np.isnan(avg)
+        x = np.where(valid, avg, 0.0)
+        groups = codes.max() + 1 if len(codes) else 0
+        others = np.bincount(codes, weights=valid, minlength=groups)[codes] - valid
+        total = np.bincount(codes, weights=x, minlength=groups)[codes] - x
+        squares = np.bincount(codes, weights=x * x, minlength=groups)[codes] - x * x
+        mean = total / others
+        variance = (squares - others * mean * mean) / (others - 1)
+        # rounding error can leave a tiny variance for identical values
+        usable = valid & (others >= min_history) & (variance > 1e-12 * mean * mean)
+        z = np.where(usable, (x - mean) / np.sqrt(np.where(usable, variance, 1.0)), np.nan)
+
+    return pd.DataFrame({
+        # string columns are reordered as they are stored (Arrow), without a Python object per value
+        "bills_id": bills["bills_id"].take(order).reset_index(drop=True),
+        "connection_id": bills["connection_id"].take(order).reset_index(drop=True),
+        "period_starts": starts,
+        "days": pd.array(days, dtype="Int64"),
+        "avg_daily_kwh": avg,
+        "price_per_kwh": price,
+        "mom_change": mom,
+        "z_score": z,
+        "flagged": np.abs(np.nan_to_num(z)) >= threshold,
+    })
+
+
+def write_metrics(cur, metrics):
+    """Replace the contents of Bill_Consumption with `metrics`, in one COPY."""
+    cur.execute("TRUNCATE electrogrid.bill_consumption;")
+    return copy_dataframe(cur, "electrogrid.bill_consumption", metrics[METRIC_COLUMNS])
+
+
+def refresh(conn, threshold=Z_THRESHOLD, min_history=MIN_HISTORY):
+    """Read the bills, compute their metrics and write them back in one transaction. Returns the metrics."""
+    with conn.cursor() as cur:
+        start = time.perf_counter()
+        bills = read_bills(cur)
+        print(f" Read {len(bills):,} bills in {time.perf_counter() - start:.3f}s")
+
+        start = time.perf_counter()
+        metrics = compute_metrics(bills, threshold, min_history)
+        print(f" Computed the metrics in {time.perf_counter() - start:.3f}s")
+
+        start = time.perf_counter()
+        write_metrics(cur, metrics)
+    conn.commit()
+    print(f" Wrote {len(metrics):,} rows ({int(metrics['flagged'].sum()):,} flagged) "
+          f"in {time.perf_counter() - start:.3f}s")
+    return metrics
+
+
+#---------------------------------- Reports --------------------------------------------#
+
+def connection_series(conn, connection_id):
+    """(bills_id, period_starts, days, avg_daily_kwh, price_per_kwh, mom_change, z_score, flagged) of a connection, by period."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT bills_id, period_starts, days, avg_daily_kwh, price_per_kwh, mom_change, z_score, flagged
+            FROM electrogrid.bill_consumption
+            WHERE connection_id = %s
+            ORDER BY period_starts;
+        """, (connection_id,))
+        return cur.fetchall()
+
+
+def flagged_bills(conn, limit=20):
+    """(bills_id, connection_id, period_starts, avg_daily_kwh, z_score) of flagged bills, furthest from their history first."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT bills_id, connection_id, period_starts, avg_daily_kwh, z_score
+            FROM electrogrid.bill_consumption
+            WHERE flagged
+            ORDER BY abs(z_score) DESC, bills_id
+            LIMIT %s;
+        """, (limit,))
+        return cur.fetchall()
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Consumption metrics and anomaly flags for every bill.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--connection", metavar="ID", help="print the metrics of one connection")
+    group.add_argument("--flagged", type=int, metavar="N", help="print the N flagged bills with the largest |z-score|")
+    parser.add_argument("--threshold", type=float, default=Z_THRESHOLD, help="|z-score| from which a bill is flagged")
+    parser.add_argument("--min-history", type=int, default=MIN_HISTORY,
+                        help="other bills of the connection needed for a z-score")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        with connection() as conn:
+            if args.connection is not None:
+                rows = connection_series(conn, args.connection)
+                print(tabulate(rows, headers=SERIES_HEADERS, tablefmt="grid", floatfmt=".3f"))
+            elif args.flagged is not None:
+                rows = flagged_bills(conn, args.flagged)
+                print(tabulate(rows, headers=["bill", "connection", "period start", "kWh/day", "z-score"],
+                               tablefmt="grid", floatfmt=".3f"))
+            else:
+                refresh(conn, args.threshold, args.min_history)
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import io
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = None
+
+
+# Bulk loading with COPY ... FROM STDIN
+#
+# A DataFrame is serialized straight into a COPY buffer, column by column,
+# and handed to COPY in chunks of rows as the server reads it. No per-row
+# tuple is built and no INSERT statement is parsed by PostgreSQL.
+#
+# With pyarrow installed the columns are converted to Arrow (zero-copy for
+# numeric, datetime and Arrow-backed string columns) and written by Arrow's
+# C++ CSV writer, so no Python object is created per value. Without it every
+# column is formatted with vectorized NumPy/pandas operations into COPY's
+# text format. In both formats NaN, NaT and NA are written as NULL, dates as
+# ISO dates and floats as their shortest exact decimal, so amounts rounded to
+# 2 decimals arrive unchanged in NUMERIC(10,2) columns.
+
+NULL = "\\N"
+ROWS_PER_CHUNK = 65536
+
+# Characters that have a meaning in COPY's text format and must be escaped
+ESCAPES = [("\\", "\\\\"), ("\t", "\\t"), ("\n", "\\n"), ("\r", "\\r")]
+
+
+def format_datetimes(values):
+    """ISO text for a datetime64 array: plain dates when there is no time of day.
+
+    Dates repeat a lot (billing periods, issue dates), so each distinct value
+    is formatted once and the strings are gathered back by position.
+    """
+    present = ~np.isnat(values)
+    days = values.astype("datetime64[D]")
+    if (values[present] == days[present]).all():
+        values = days
+    distinct, positions = np.unique(values, return_inverse=True)
+    if values.dtype == "datetime64[D]":
+        text = distinct.astype(str)
+    else:
+        text = np.datetime_as_string(distinct, unit="us")
+    return text.astype(object)[positions.ravel()]
+
+
+def column_text(series):
+    """Format one column for COPY's text format. Returns an object array of strings."""
+    missing = series.isna().to_numpy()
+    dtype = series.dtype
+
+    if isinstance(dtype, pd.CategoricalDtype):
+        # format the categories once and gather them by code (-1 is missing)
+        categories = column_text(pd.Series(dtype.categories))
+        codes = series.cat.codes.to_numpy()
+        text = categories[np.where(codes < 0, 0, codes)] if len(categories) else np.full(len(codes), NULL, dtype=object)
+    elif isinstance(dtype, pd.DatetimeTZDtype):
+        utc = series.dt.tz_convert("UTC").dt.tz_localize(None).to_numpy()
+        text = format_datetimes(utc) + "+00"
+    elif pd.api.types.is_datetime64_dtype(dtype):
+        text = format_datetimes(series.to_numpy())
+    elif pd.api.types.is_bool_dtype(dtype):
+        text = np.where(series.to_numpy(dtype=bool, na_value=False), "t", "f").astype(object)
+    elif pd.api.types.is_integer_dtype(dtype):
+        text = series.to_numpy(dtype="int64", na_value=0).astype(str).astype(object)
+    elif pd.api.types.is_float_dtype(dtype):
+        # repr of a float is its shortest round-tripping decimal, so an amount
+        # rounded to 2 decimals is written exactly as NUMERIC(10,2) expects
+        text = series.to_numpy(dtype="float64", na_value=np.nan).astype(str).astype(object)
+    else:
+        strings = series.astype(object).where(~missing, "").astype(str)
+        if strings.str.contains(r"[\\\t\n\r]", regex=True).any():
+            for char, escaped in ESCAPES:
+                strings = strings.str.replace(char, escaped, regex=False)
+        text = strings.to_numpy(dtype=object)
+
+    text[missing] = NULL
+    return text
+
+
+def to_arrow(df):
+    """Arrow table for `df`, with datetime columns that hold plain dates sent as dates.
+
+    Time-zone-aware columns are sent as UTC text ending in +00: Arrow's CSV
+    writer formats them through the time zone database, about 30 times slower.
+    """
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for i, field in enumerate(table.schema):
+        if pa.types.is_timestamp(field.type) and field.type.tz is not None:
+            utc = table.column(i).cast(pa.timestamp("us"), safe=False).cast(pa.string())
+            table = table.set_column(i, field.name, pa_compute.binary_join_element_wise(utc, "+00", ""))
+        elif pa.types.is_timestamp(field.type):
+            values = df.iloc[:, i].to_numpy()
+            present = ~np.isnat(values)
+            if (values[present] == values[present].astype("datetime64[D]")).all():
+                table = table.set_column(i, field.name, table.column(i).cast(pa.date32()))
+    return table
+
+
+def copy_csv(df):
+    """Serialize a DataFrame into COPY csv format with Arrow (NULL is an unquoted empty field)."""
+    buffer = io.BytesIO()
+    options = pa_csv.WriteOptions(include_header=False, quoting_style="needed")
+    pa_csv.write_csv(to_arrow(df), buffer, options)
+    return buffer.getvalue()
+
+
+def copy_text(df):
+    """Serialize a DataFrame into COPY text format (one line per row)."""
+    if df.empty:
+        return ""
+
+    # Lay the formatted columns out row by row with the separators in between
+    # ([value, "\t", value, ..., value, "\n"] per row) and join them all at once.
+    width = len(df.columns)
+    grid = np.empty((len(df), 2 * width), dtype=object)
+    for i, name in enumerate(df.columns):
+        grid[:, 2 * i] = column_text(df[name])
+    grid[:, 1::2] = "\t"
+    grid[:, -1] = "\n"
+    return "".join(grid.ravel())
+
+
+class FrameReader:
+    """Read-only file object that serializes a DataFrame chunk by chunk while COPY consumes it."""
+
+    def __init__(self, df, rows_per_chunk=ROWS_PER_CHUNK):
+        self.df = df
+        self.rows_per_chunk = rows_per_chunk
+        self.position = 0
+        self.current = io.BytesIO()
+
+    def read(self, size=-1):
+        data = self.current.read(size)
+        while not data and self.position < len(self.df):
+            chunk = self.df.iloc[self.position:self.position + self.rows_per_chunk]
+            self.position += self.rows_per_chunk
+            self.current = io.BytesIO(serialize(chunk))
+            data = self.current.read(size)
+        return data
+
+
+if pa is not None:
+    COPY_FORMAT = "WITH (FORMAT csv)"
+
+    def serialize(df):
+        return copy_csv(df)
+else:
+    COPY_FORMAT = ""
+
+    def serialize(df):
+        return copy_text(df).encode("utf-8")
+
+
+def read_csv_columns(source, columns, types=None):
+    """The headerless CSV in a binary file object as a DataFrame of `columns`.
+
+    `types` maps columns to "float" or "datetime"; the others are read as text,
+    and empty fields as missing values.
+    """
+    types = types or {}
+    if pa is None:
+        return pd.read_csv(source, header=None, names=columns,
+                           dtype={c: float if types.get(c) == "float" else str
+                                  for c in columns if types.get(c) != "datetime"},
+                           parse_dates=[c for c in columns if types.get(c) == "datetime"])
+    # Arrow's reader directly: pandas' pyarrow engine is several times slower with dtype=str
+    arrow_types = {"float": pa.float64(), "datetime": pa.timestamp("s")}
+    options = pa_csv.ConvertOptions(column_types={c: arrow_types.get(types.get(c), pa.string()) for c in columns},
+                                    strings_can_be_null=True)
+    return pa_csv.read_csv(source, read_options=pa_csv.ReadOptions(column_names=columns),
+                           convert_options=options).to_pandas()
+
+
+def copy_dataframe(cur, table, df):
+    """Stream a DataFrame into `table` with COPY. Columns must match the table's column names."""
+    columns = ', '.join(df.columns)
+    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN {COPY_FORMAT}", FrameReader(df), size=1 << 16)
+    return len(df)
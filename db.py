@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions, pool
+
+from instrumentation import InstrumentedCursor
+
+
+# Pooled connections for the user interface and other long-running entry points
+#
+# Opening a connection (TCP, TLS and authentication) costs more than a quick
+# lookup, so connections are opened once, kept in a pool and lent out for one
+# piece of work at a time:
+#
+#   with connection() as conn:
+#       ...
+#
+# Nothing connects at import time; the shared pool is created on first use.
+# A borrowed connection is checked before it is handed out: closed or broken
+# connections are replaced by new ones, and a connection that sat idle for
+# more than HEALTH_CHECK_AFTER seconds is pinged first, since the server or a
+# firewall may have dropped it in the meantime. When all connections are lent
+# out, callers wait for one to come back (up to CHECKOUT_TIMEOUT seconds).
+#
+# All settings come from the environment. The standard PG* variables select
+# the database, as for the loader, and ELECTROGRID_POOL_* size the pool.
+# Every statement on a pooled connection is timed (instrumentation.py).
+
+PGHOST = os.environ.get("PGHOST", "dbm.fe.up.pt")
+PGPORT = int(os.environ.get("PGPORT", 5433))
+PGDATABASE = os.environ.get("PGDATABASE", "fced01")
+PGUSER = os.environ.get("PGUSER", "fced01")
+PGPASSWORD = os.environ.get("PGPASSWORD", "GROUP1")
+PGSCHEMA = "electrogrid"
+CONNECT_TIMEOUT = int(os.environ.get("PGCONNECT_TIMEOUT", 10))
+
+POOL_MIN = int(os.environ.get("ELECTROGRID_POOL_MIN", 1))
+POOL_MAX = int(os.environ.get("ELECTROGRID_POOL_MAX", 10))
+HEALTH_CHECK_AFTER = float(os.environ.get("ELECTROGRID_POOL_CHECK_AFTER", 30))
+CHECKOUT_TIMEOUT = float(os.environ.get("ELECTROGRID_POOL_TIMEOUT", 30))
+
+# Errors after which a connection is not trusted anymore
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+
+def connect_args():
+    return {
+        "host": PGHOST,
+        "port": PGPORT,
+        "dbname": PGDATABASE,
+        "user": PGUSER,
+        "password": PGPASSWORD,
+        "connect_timeout": CONNECT_TIMEOUT,
+        "application_name": "electrogrid",
+    }
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections with health checks on checkout."""
+
+    def __init__(self, minconn=POOL_MIN, maxconn=POOL_MAX, health_check_after=HEALTH_CHECK_AFTER, **kwargs):
+        self.maxconn = maxconn
+        self.health_check_after = health_check_after
+        self._pool = pool.ThreadedConnectionPool(minconn, maxconn, cursor_factory=InstrumentedCursor,
+                                                 **(kwargs or connect_args()))
+        self._free = threading.BoundedSemaphore(maxconn)
+        self._returned_at = {}
+
+    def healthy(self, conn):
+        """False if the connection is closed or does not answer a ping."""
+        if conn.closed or conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        if time.monotonic() - self._returned_at.get(id(conn), 0) < self.health_check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except CONNECTION_ERRORS:
+            return False
+
+    def getconn(self, timeout=CHECKOUT_TIMEOUT):
+        if not self._free.acquire(timeout=timeout):
+            raise pool.PoolError(f"no connection available after {timeout}s ({self.maxconn} in use)")
+        try:
+            # a dead connection is discarded and the pool opens a new one in its place
+            for _ in range(self.maxconn + 1):
+                conn = self._pool.getconn()
+                if self.healthy(conn):
+                    return conn
+                self._discard(conn)
+            raise psycopg2.OperationalError("could not get a working database connection")
+        except Exception:
+            self._free.release()
+            raise
+
+    def putconn(self, conn, broken=False):
+        try:
+            if not broken and not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                # never lend out a connection in the middle of someone else's transaction
+                try:
+                    conn.rollback()
+                except CONNECTION_ERRORS:
+                    broken = True
+            if broken or conn.closed:
+                self._discard(conn)
+            else:
+                self._returned_at[id(conn)] = time.monotonic()
+                self._pool.putconn(conn)
+        finally:
+            self._free.release()
+
+    def _discard(self, conn):
+        self._returned_at.pop(id(conn), None)
+        self._pool.putconn(conn, close=True)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except CONNECTION_ERRORS:
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, broken=broken)
+
+    def close(self):
+        self._pool.closeall()
+
+
+# Names of the statements prepared on each connection (forgotten with the connection)
+_prepared = weakref.WeakKeyDictionary()
+
+
+def execute_prepared(cur, name, statement, params, types=()):
+    """Run `statement` as the server-side prepared statement `name`.
+
+    The statement (written with $1, $2, ... placeholders, whose types are
+    given in `types`) is prepared the first time a connection runs it. After
+    that only EXECUTE and the parameters are sent, and the server reuses the
+    parsed statement and, once it has settled on a generic plan, the plan.
+    """
+    names = _prepared.setdefault(cur.connection, set())
+    if name not in names:
+        arguments = f"({', '.join(types)})" if types else ""
+        cur.execute(f"PREPARE {name} {arguments} AS {statement}")
+        names.add(name)
+    placeholders = f"({', '.join(['%s'] * len(params))})" if params else ""
+    cur.execute(f"EXECUTE {name} {placeholders};", params)
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def get_pool():
+    """The process-wide pool, created on first use."""
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = ConnectionPool()
+        return _shared_pool
+
+
+def connection():
+    """Borrow a connection from the shared pool: `with connection() as conn: ...`."""
+    return get_pool().connection()
+
+
+def close_pool():
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is not None:
+            _shared_pool.close()
+            _shared_pool = None
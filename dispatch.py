@@ -0,0 +1,297 @@
+import argparse
+import heapq
+import sys
+import threading
+import time
+from bisect import bisect_left, insort
+from itertools import islice
+
+from tabulate import tabulate
+
+import refcache
+from db import CHECKOUT_TIMEOUT, close_pool, connection
+
+
+# Technician dispatch index
+#
+# Dispatch asks "who in region X has skills {Repair, Installation} and the
+# fewest open service orders" (orders without an end_date). Instead of
+# joining Technician, Technician_Skill, Service_Orders and Person on every
+# request, the index answers from memory:
+#
+#   * every skill is a bit, and a technician's skills are one integer (the OR
+#     of their bits), so "has every skill asked for" is one AND;
+#   * technicians are grouped by region and, within a region, by skill set,
+#     and each group is a list of (open orders, person_id) kept sorted;
+#   * a query keeps the region's skill sets (at most 2^skills) that contain
+#     the skills asked for, and merges their lists up to `limit` candidates.
+#
+# The counts are kept current with LISTEN/NOTIFY (electrogrid.sql, "Change
+# notifications for the dispatch index"): a statement on service orders
+# names the technicians whose open orders it touched, and their counts are
+# read again. They are absolute counts, so a change seen twice does no harm.
+# A change to the technicians, their skills or names rebuilds the index, as
+# does a reconnect of the listener, since notifications may have been missed.
+#
+#   python dispatch.py --region Porto --skills Repair Installation
+#   python dispatch.py --region Porto --skills Repair --sql      the same question as one SQL join
+#
+# benchmark_dispatch.py compares the two.
+
+DISPATCH_LIMIT = 5
+CHANNEL = "electrogrid_dispatch"
+
+SKILLS = "SELECT skill_name FROM electrogrid.skills ORDER BY skill_name;"
+
+# (person_id, name, region_name, [skill names]) of every technician
+ROSTER = """
+    SELECT t.person_id, p.name, t.region_name,
+           array_remove(array_agg(ts.skill_name ORDER BY ts.skill_name), NULL)
+    FROM electrogrid.technician AS t
+    JOIN electrogrid.person AS p
+      ON p.person_id = t.person_id
+    LEFT JOIN electrogrid.technician_skill AS ts
+      ON ts.technician_id = t.person_id
+    GROUP BY t.person_id, p.name, t.region_name;
+"""
+
+OPEN_ORDERS = """
+    SELECT technician_id, count(*)
+    FROM electrogrid.service_orders
+    WHERE end_date IS NULL AND technician_id IS NOT NULL
+    GROUP BY technician_id;
+"""
+
+OPEN_ORDERS_OF = """
+    SELECT technician_id, count(*)
+    FROM electrogrid.service_orders
+    WHERE end_date IS NULL AND technician_id = ANY(%s)
+    GROUP BY technician_id;
+"""
+
+# The same question as one query: technicians of a region that have every
+# skill asked for, with their open service orders
+CANDIDATES = """
+    SELECT t.person_id, p.name, count(so.service_order_id) AS open_orders
+    FROM electrogrid.technician AS t
+    JOIN electrogrid.person AS p
+      ON p.person_id = t.person_id
+    LEFT JOIN electrogrid.service_orders AS so
+      ON so.technician_id = t.person_id AND so.end_date IS NULL
+    WHERE t.region_name = %(region)s
+      AND NOT EXISTS (
+          SELECT 1 FROM unnest(%(skills)s::TEXT[]) AS s (skill_name)
+          WHERE NOT EXISTS (
+              SELECT 1 FROM electrogrid.technician_skill AS ts
+              WHERE ts.technician_id = t.person_id AND ts.skill_name = s.skill_name))
+    GROUP BY t.person_id, p.name
+    ORDER BY open_orders, t.person_id
+    LIMIT %(limit)s;
+"""
+
+CANDIDATE_HEADERS = ["person_id", "name", "open orders"]
+
+
+class DispatchIndex:
+    """Technicians by region and skill set, each set's technicians sorted by open service orders."""
+
+    def __init__(self):
+        self.bits = {}          # skill name -> bit
+        self.technicians = {}   # person_id -> (name, region_name, skill bits)
+        self.open_orders = {}   # person_id -> open service orders
+        self.groups = {}        # region_name -> {skill bits: sorted [(open orders, person_id)]}
+        self.loaded = threading.Event()
+        self._lock = threading.Lock()
+
+    def build(self, skills, roster, open_orders):
+        """Replace the contents with `skills` (names), `roster` rows as read by ROSTER and {person_id: open orders}.
+
+        Skills of the roster that are not in `skills` are left out.
+        """
+        bits = {name: 1 << i for i, name in enumerate(skills)}
+        technicians, counts, groups = {}, {}, {}
+        for person_id, name, region_name, skill_names in roster:
+            mask = 0
+            for skill in skill_names:
+                mask |= bits.get(skill, 0)
+            technicians[person_id] = (name, region_name, mask)
+            counts[person_id] = open_orders.get(person_id, 0)
+            groups.setdefault(region_name, {}).setdefault(mask, []).append((counts[person_id], person_id))
+        for by_skills in groups.values():
+            for entries in by_skills.values():
+                entries.sort()
+        with self._lock:
+            self.bits, self.technicians, self.open_orders, self.groups = bits, technicians, counts, groups
+        self.loaded.set()
+
+    def set_open_orders(self, counts, technicians=None):
+        """Set the open orders of `technicians` (all if None) from {person_id: count}; those not in it have none."""
+        with self._lock:
+            for person_id in list(self.technicians) if technicians is None else technicians:
+                known = self.technicians.get(person_id)
+                new = counts.get(person_id, 0)
+                if known is None or self.open_orders[person_id] == new:
+                    continue
+                # move the technician to its new place in its group
+                entries = self.groups[known[1]][known[2]]
+                del entries[bisect_left(entries, (self.open_orders[person_id], person_id))]
+                insort(entries, (new, person_id))
+                self.open_orders[person_id] = new
+
+    def candidates(self, region_name, skills=(), limit=DISPATCH_LIMIT):
+        """[(person_id, name, open orders)] of the technicians of a region with all of `skills`, fewest open orders first.
+
+        Ties are broken by person_id. A skill that is not in Skills matches nobody.
+        """
+        with self._lock:
+            required = 0
+            for skill in skills:
+                if skill not in self.bits:
+                    return []
+                required |= self.bits[skill]
+            lists = [entries for mask, entries in self.groups.get(region_name, {}).items()
+                     if mask & required == required]
+            ranked = lists[0][:limit] if len(lists) == 1 else islice(heapq.merge(*lists), limit)
+            return [(person_id, self.technicians[person_id][0], count) for count, person_id in ranked]
+
+    def regions(self):
+        return sorted(region for region in self.groups if region is not None)
+
+    def skills(self):
+        return list(self.bits)
+
+    def load(self, cur, snapshot=True):
+        """Build the index from the database.
+
+        With `snapshot`, `cur` must be at the start of a transaction, and the skills,
+        roster and counts are read in one REPEATABLE READ snapshot of it.
+        """
+        if snapshot:
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+        cur.execute(SKILLS)
+        skills = [row[0] for row in cur.fetchall()]
+        cur.execute(ROSTER)
+        roster = cur.fetchall()
+        cur.execute(OPEN_ORDERS)
+        self.build(skills, roster, dict(cur.fetchall()))
+
+    def refresh(self, cur, technicians=None):
+        """Read the open orders of `technicians` (all if None) again."""
+        if technicians is None:
+            cur.execute(OPEN_ORDERS)
+        else:
+            cur.execute(OPEN_ORDERS_OF, (list(technicians),))
+        self.set_open_orders(dict(cur.fetchall()), technicians)
+
+
+def changes(payloads):
+    """(rebuild, technicians) for notification payloads: whether to rebuild, and whose counts to read (None for all)."""
+    rebuild, technicians = False, set()
+    for payload in payloads:
+        if payload == "roster":
+            rebuild = True
+        elif payload == "orders:*":
+            technicians = None
+        elif payload.startswith("orders:") and technicians is not None:
+            technicians.update(payload[len("orders:"):].split(","))
+    return rebuild, technicians
+
+
+def sql_candidates(cur, region_name, skills=(), limit=DISPATCH_LIMIT):
+    """The rows of DispatchIndex.candidates, from CANDIDATES."""
+    cur.execute(CANDIDATES, {"region": region_name, "skills": list(skills), "limit": limit})
+    return cur.fetchall()
+
+
+class DispatchListener(refcache.ChangeListener):
+    """Background thread that keeps a DispatchIndex current from the notifications on CHANNEL."""
+
+    channel = CHANNEL
+    description = "Dispatch index"
+
+    def __init__(self, index, poll_interval=1.0):
+        super().__init__(index, poll_interval, name="dispatch-listener")
+
+    def changed(self, payloads):
+        rebuild, technicians = changes(payloads)
+        if not rebuild and technicians is not None and not technicians:
+            return
+        with connection() as conn, conn.cursor() as cur:
+            if rebuild:
+                self.cache.load(cur)
+            else:
+                self.cache.refresh(cur, technicians)
+
+    def reset(self):
+        with connection() as conn, conn.cursor() as cur:
+            self.cache.load(cur)
+
+    def disconnected(self):
+        # the index keeps answering with the counts it has until it is rebuilt
+        pass
+
+
+_shared_index = None
+_shared_listener = None
+_shared_lock = threading.Lock()
+
+
+def get_dispatch_index(timeout=CHECKOUT_TIMEOUT):
+    """The process-wide index, kept current by its listener; waits up to `timeout` seconds for the first build."""
+    global _shared_index, _shared_listener
+    with _shared_lock:
+        if _shared_index is None:
+            _shared_index = DispatchIndex()
+            _shared_listener = DispatchListener(_shared_index)
+            _shared_listener.start()
+        index = _shared_index
+    if not index.loaded.wait(timeout):
+        raise TimeoutError(f"the dispatch index was not loaded after {timeout}s")
+    return index
+
+
+def close_dispatch_index():
+    global _shared_index, _shared_listener
+    with _shared_lock:
+        if _shared_listener is not None:
+            _shared_listener.stop()
+        _shared_index = _shared_listener = None
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Technicians of a region with given skills, fewest open orders first.")
+    parser.add_argument("--region", required=True)
+    parser.add_argument("--skills", nargs="*", default=[], metavar="SKILL", help='e.g. Repair "Meter Replacement"')
+    parser.add_argument("--limit", type=int, default=DISPATCH_LIMIT)
+    parser.add_argument("--sql", action="store_true", help="answer with the SQL join instead of the index")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            start = time.perf_counter()
+            if args.sql:
+                rows = sql_candidates(cur, args.region, args.skills, args.limit)
+                how = "with the SQL join"
+            else:
+                index = DispatchIndex()
+                index.load(cur)
+                print(f" Built the index of {len(index.technicians):,} technicians "
+                      f"in {(time.perf_counter() - start) * 1000:.1f} ms")
+                start = time.perf_counter()
+                rows = index.candidates(args.region, args.skills, args.limit)
+                how = "from the index"
+            elapsed = time.perf_counter() - start
+        print(tabulate(rows, headers=CANDIDATE_HEADERS, tablefmt="grid") if rows else "(none)")
+        print(f" Answered {how} in {elapsed * 1e6:,.0f} µs")
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
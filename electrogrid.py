@@ -1,117 +1,237 @@
-import psycopg2
-from psycopg2 import sql
-from getpass import getpass
+import re
+from datetime import date
+
 from tabulate import tabulate
 
-#Establish the connection 
+from db import close_pool, connection, execute_prepared
+from dispatch import CANDIDATE_HEADERS, DISPATCH_LIMIT, close_dispatch_index, get_dispatch_index
+from instrumentation import start_from_environment
+from refcache import close_reference_cache, get_reference_cache
+
+# Database access goes through the connection pool in db.py: every action
+# borrows a connection for its queries only (not while waiting for input),
+# and the connection settings come from the PG* environment variables. Every
+# query is timed (instrumentation.py); ELECTROGRID_METRICS_PORT serves the
+# numbers while the menu runs.
+
+
+#---------------------------------- Queries --------------------------------------------#
+# The lookups behind the menu. Each one is written so its filter and sort can
+# be served by an index from electrogrid.sql (explain_check.py verifies this):
+# columns are compared as they are stored, never through a cast or function.
+
+# The whole client profile in one round-trip: the client, their active
+# connections and the service orders on those connections, newest first, as
+# JSON arrays of table rows. It runs as a prepared statement (see
+# db.execute_prepared), so a lookup is parsed and planned once per connection.
+CLIENT_PROFILE = """
+    WITH found AS (
+        SELECT p.person_id, p.name, p.phone, p.email, c.address
+        FROM electrogrid.person p
+        JOIN electrogrid.client c ON p.person_id = c.person_id
+        WHERE p.phone = $1
+    ), active AS (
+        SELECT con.connection_id, con.property_address, con.install_date, con.meter_serial,
+               con.connection_type, con.status
+        FROM electrogrid.connections con
+        JOIN found ON con.client_id = found.person_id
+        WHERE con.status = 'Active'
+    )
+    SELECT
+        json_build_array(found.person_id, found.name, found.phone, found.email, found.address),
+        (SELECT COALESCE(json_agg(json_build_array(a.connection_id, a.property_address, a.install_date,
+                                                   a.meter_serial, a.connection_type, a.status)
+                                  ORDER BY a.connection_id), '[]')
+         FROM active a),
+        (SELECT COALESCE(json_agg(json_build_array(so.service_order_id, so.connection_id, so.service_type,
+                                                   so.start_date, so.end_date, so.notes, so.technician_id)
+                                  ORDER BY so.start_date DESC), '[]')
+         FROM active a
+         JOIN electrogrid.service_orders so ON so.connection_id = a.connection_id)
+    FROM found
+"""
+
+# Meter checks, most recent first, ordered by (check_date, check_id) so every
+# row has a unique position. Pages are read with keyset pagination: the next
+# page starts after the last (check_date, check_id) seen, which the index on
+# those columns finds directly, however deep into the list the page is.
+METER_CHECK_ROWS = """
+    SELECT
+        mc.check_id,
+        c.person_id AS client_id,
+        mc.meter_serial,
+        mc.check_date,
+        mc.meter_read,
+        con.property_address
+    FROM electrogrid.meter_check AS mc
+    JOIN electrogrid.connections AS con
+        ON mc.meter_serial = con.meter_serial
+    JOIN electrogrid.client AS c
+        ON con.client_id = c.person_id
+"""
+
+METER_CHECK_HEADERS = ["check_id", "client_id", "meter_serial", "check_date", "meter_read", "property_address"]
+
+# Rows per page in the menu, and rows per round-trip when streaming
+PAGE_SIZE = 25
+FETCH_SIZE = 2000
+
+
+def meter_checks_query(date_from=None, date_to=None, technician_id=None, region=None, after=None, limit=None):
+    """SQL and parameters for the meter checks matching the filters, most recent first.
+
+    `after` is the (check_date, check_id) of the last row already shown; only
+    rows after it are returned. Every filter is a plain comparison on an
+    indexed column: check_date, technician_id, or the technician's region.
+    """
+    conditions, params = [], []
+    if date_from is not None:
+        conditions.append("mc.check_date >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        conditions.append("mc.check_date <= %s")
+        params.append(date_to)
+    if technician_id is not None:
+        conditions.append("mc.technician_id = %s")
+        params.append(technician_id)
+    if region is not None:
+        conditions.append("mc.technician_id IN (SELECT person_id FROM electrogrid.technician WHERE region_name = %s)")
+        params.append(region)
+    if after is not None:
+        conditions.append("(mc.check_date, mc.check_id) < (%s, %s)")
+        params.extend(after)
+
+    query = METER_CHECK_ROWS
+    if conditions:
+        query += "    WHERE " + "\n      AND ".join(conditions) + "\n"
+    query += "    ORDER BY mc.check_date DESC, mc.check_id DESC"
+    if limit is not None:
+        query += f"\n    LIMIT {int(limit)}"
+    return query + ";", params
+
+
+def meter_checks_page(conn, after=None, page_size=PAGE_SIZE, **filters):
+    """One page of meter checks: the `page_size` rows after `after` (see meter_checks_query)."""
+    query, params = meter_checks_query(after=after, limit=page_size, **filters)
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        return cur.fetchall()
+
+
+def stream_meter_checks(conn, fetch_size=FETCH_SIZE, **filters):
+    """Yield the matching meter checks as they arrive, `fetch_size` rows per round-trip.
+
+    The rows are read through a named (server-side) cursor, so only one batch
+    is held in memory at a time. The cursor lives in the connection's current
+    transaction, which stays open until the generator is exhausted or closed.
+    """
+    query, params = meter_checks_query(**filters)
+    with conn.cursor(name="stream_meter_checks") as cur:
+        cur.itersize = fetch_size
+        cur.execute(query, params)
+        yield from cur
+
+
+def phone_number(text):
+    """The phone as stored in person.phone (digits only, last 9), or None if it has no digits."""
+    digits = re.sub(r"\D", "", text)[-9:]
+    return int(digits) if digits else None
 
 
-PGHOST = "dbm.fe.up.pt"
-PGPORT = 5433
-PGDATABASE = "fced01"
-PGUSER = "fced01"
-PGPASSWORD = "GROUP1"
-PGSCHEMA = "electrogrid"
+#---------------------Insert new client to database-------------------------------------#
+# New client IDs come from the electrogrid.client_id_seq sequence ('C' and the
+# number, zero-padded to 3 digits like the loaded IDs). nextval never hands out
+# the same number twice, so operators inserting at the same time cannot collide.
+
+INSERT_CLIENTS = """
+    WITH new_client AS (
+        SELECT 'C' || CASE WHEN id < 100 THEN lpad(id::TEXT, 3, '0') ELSE id::TEXT END AS person_id,
+               name, email, phone, address, n
+        FROM (
+            -- ORDER BY keeps this subquery separate, so nextval runs once per client, in input order
+            SELECT nextval('electrogrid.client_id_seq') AS id, t.*
+            FROM unnest(%s::TEXT[], %s::TEXT[], %s::BIGINT[], %s::TEXT[])
+                 WITH ORDINALITY AS t(name, email, phone, address, n)
+            ORDER BY n
+        ) AS numbered
+    ), new_person AS (
+        INSERT INTO electrogrid.person (person_id, name, email, phone)
+        SELECT person_id, name, email, phone FROM new_client
+    ), new_client_row AS (
+        INSERT INTO electrogrid.client (person_id, address)
+        SELECT person_id, address FROM new_client
+    )
+    SELECT person_id FROM new_client ORDER BY n;
+"""
 
 
-# Connect to the database
+def insert_clients(clients, conn=None):
+    """Insert many clients in one round-trip and commit. Returns their new IDs, in order.
 
-conn = psycopg2.connect(
-        host=PGHOST,
-        port=PGPORT,
-        dbname=PGDATABASE,
-        user=PGUSER,
-        password=PGPASSWORD
-    )
-cursor = conn.cursor()
+    `clients` is a list of (name, email, phone, address) tuples. The person and
+    client rows of all of them are written by a single statement, so either
+    every client is inserted or, on any error, none is (the error is raised).
+    Without `conn`, a connection is borrowed from the pool.
+    """
+    if not clients:
+        return []
+    if conn is None:
+        with connection() as conn:
+            return insert_clients(clients, conn)
 
-#---------------------Insert new client to database-------------------------------------#
-def insert_client(conn):
+    names, emails, phones, addresses = (list(column) for column in zip(*clients))
+    phones = [phone_number(str(p)) if p is not None else None for p in phones]
+
+    cur = conn.cursor()
+    try:
+        cur.execute(INSERT_CLIENTS, (names, emails, phones, addresses))
+        new_ids = [row[0] for row in cur.fetchall()]
+        conn.commit()
+        return new_ids
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+
+def insert_client():
     print("\n== Insert New Client ==")
     name = input("Client name: ").strip()
     email = input("Email: ").strip() 
     phone = input("Phone: ").strip() 
     address = input("Address: ").strip()
 
-    cur = conn.cursor()
     try:
-        # Get the last client ID
-        cur.execute("""
-            SELECT person_id
-            FROM electrogrid.person
-            WHERE person_id LIKE 'C%'
-            ORDER BY CAST(SUBSTRING(person_id FROM 2) AS INTEGER) DESC
-            LIMIT 1;
-        """)
-        last_id = cur.fetchone()
-        if last_id:
-            last_num = int(last_id[0][1:])
-        else:
-            last_num = 0
-        new_id = f"C{last_num + 1}"
-
-        # Insert into person
-        cur.execute("""
-            INSERT INTO electrogrid.person (person_id, name, email, phone)
-            VALUES (%s, %s, %s, %s);
-        """, (new_id, name, email, phone))
-
-        # Insert into client
-        cur.execute("""
-            INSERT INTO electrogrid.client (person_id, address)
-            VALUES (%s, %s);
-        """, (new_id, address))
-
-        # Commit
-        conn.commit()
+        [new_id] = insert_clients([(name, email, phone, address)])
         print(f"Client inserted successfully with ID {new_id}")
 
     except Exception as e:
-        conn.rollback()
         print(" Error inserting client:", e)
 
-    finally:
-        cur.close()
-
 #--------------------------- SEARCH FOR A CLIENT ---------------------------------------#
 
 
-def search_client(conn):
+def search_client():
     print("\n== Search for a client's information ==")
     phone = input("Phone: ").strip()
 
-    cur = conn.cursor()
-
     try:
-        # Get client personal information
-        cur.execute("""
-            SELECT p.person_id, p.name, p.phone, p.email, c.address
-            FROM electrogrid.person p
-            JOIN electrogrid.client c ON p.person_id = c.person_id
-            WHERE CAST(p.phone AS TEXT) = %s;
-        """, (phone,))   
+        with connection() as conn, conn.cursor() as cur:
+            # Get the client's profile (person.phone is a BIGINT, so compare it as a number)
+            execute_prepared(cur, "client_profile", CLIENT_PROFILE, (phone_number(phone),), types=("BIGINT",))
+            profile = cur.fetchone()
 
-        client = cur.fetchone()
-
-        if not client:
+        if not profile:
             print("No client found with that phone number.")
             return
-        
+        client, connections, service_orders = profile
+
         # Print tabulated client personal information
         headers = ["person_id", "name", "phone", "email", "address"]
         print("\n-- Client Info --")
         print(tabulate([client], headers=headers, tablefmt="grid"))
 
-        # Get connection information for that client
-        cur.execute("""
-            SELECT connection_id, property_address, install_date, meter_serial,
-                   connection_type, status
-            FROM electrogrid.connections
-            WHERE client_id = %s AND status = 'Active';
-        """, (client[0],))
-        
-        connections = cur.fetchall()
-
         # Print active connections for that client
         print("\n-- Active Connections --")
         if not connections:
@@ -120,20 +240,7 @@ def search_client(conn):
             headers = ["connection_id", "property_address", "install_date", "meter_serial", "connection_type", "status"]
             print(tabulate(connections, headers=headers, tablefmt="grid"))
 
-    # Get service orders related to this client
-        cur.execute("""
-            SELECT so.service_order_id, so.connection_id, so.service_type,
-           so.start_date, so.end_date, so.notes, so.technician_id
-            FROM electrogrid.service_orders AS so
-            JOIN electrogrid.connections AS con
-            ON so.connection_id = con.connection_id
-            WHERE con.client_id = %s
-            AND con.status = 'Active'
-            ORDER BY so.start_date DESC;
-            """, (client[0],))
-        
-        service_orders = cur.fetchall()
-
+        # Print service orders related to this client
         print("\n-- Service Orders for this Client's Connections --")
         if not service_orders:
             print("(none)")
@@ -144,45 +251,33 @@ def search_client(conn):
     
     except Exception as e:
         print("Error:", e)
-    finally:
-        cur.close()
 
 #----------------------------SEARCH FOR TECHNICIAN INFO BASED ON REGION--------------------#
-def search_technician(conn):
+def search_technician():
     print("\n== Search for a technician by region ==")
+
+    # Regions and rosters come from the reference cache (refcache.py)
+    try:
+        regions = get_reference_cache().regions()
+    except Exception as e:
+        print("Error:", e)
+        return
+
     print("Select region:")
-    print(" 1) Coimbra")
-    print(" 2) Faro")
-    print(" 3) Lisboa")
-    print(" 4) Porto")
+    for number, region in enumerate(regions, start=1):
+        print(f" {number}) {region}")
 
     choice = input("Enter your choice: ").strip()
 
-    region_map = {
-        "1": "Coimbra",
-        "2": "Faro",
-        "3": "Lisboa",
-        "4": "Porto"
-    }
+    region_map = {str(number): region for number, region in enumerate(regions, start=1)}
 
     region_name = region_map.get(choice)
     if not region_name:
         print("Invalid choice.")
         return
 
-    cur = conn.cursor()
-
     try:
-        cur.execute("""
-            SELECT t.person_id, p.name, p.email, p.phone, t.region_name
-            FROM electrogrid.technician AS t
-            JOIN electrogrid.person AS p
-              ON t.person_id = p.person_id
-            WHERE t.region_name = %s
-            ORDER BY p.name;
-        """, (region_name,))
-
-        technicians = cur.fetchall()
+        technicians = get_reference_cache().technicians(region_name)
 
         print(f"\n-- Technicians in region: {region_name} --")
         if not technicians:
@@ -195,73 +290,159 @@ def search_technician(conn):
 
     except Exception as e:
         print("Error:", e)
-    finally:
-        cur.close()
+
+
+#---------------------- FIND TECHNICIANS FOR A JOB BY REGION AND SKILLS -------------------#
+def find_technicians():
+    print("\n== Find technicians for a job ==")
+
+    # Answered from the dispatch index (dispatch.py), which is kept current by NOTIFY
+    try:
+        index = get_dispatch_index()
+    except Exception as e:
+        print("Error:", e)
+        return
+
+    regions = index.regions()
+    print("Select region:")
+    for number, region in enumerate(regions, start=1):
+        print(f" {number}) {region}")
+    choice = input("Enter your choice: ").strip()
+    region_map = {str(number): region for number, region in enumerate(regions, start=1)}
+    region_name = region_map.get(choice)
+    if not region_name:
+        print("Invalid choice.")
+        return
+
+    skills = index.skills()
+    print("Skills needed:")
+    for number, skill in enumerate(skills, start=1):
+        print(f" {number}) {skill}")
+    choices = input("Enter their numbers separated by commas (blank for any): ").replace(",", " ").split()
+    skill_map = {str(number): skill for number, skill in enumerate(skills, start=1)}
+    if not all(choice in skill_map for choice in choices):
+        print("Invalid choice.")
+        return
+    needed = [skill_map[choice] for choice in choices]
+
+    candidates = index.candidates(region_name, needed, DISPATCH_LIMIT)
+    print(f"\n-- Technicians in {region_name} with {', '.join(needed) or 'any skills'}, fewest open orders first --")
+    if not candidates:
+        print("(none)")
+    else:
+        print(tabulate(candidates, headers=CANDIDATE_HEADERS, tablefmt="grid"))
 
 
 #--------------------------- Show meter cheks by client phone number -------------------#
-def list_meter_checks(conn):
-    print("\n== List of all meter checks (most recent first) ==")
+def ask_date(prompt):
+    """A date typed as YYYY-MM-DD, or None if left blank."""
+    while True:
+        text = input(prompt).strip()
+        if not text:
+            return None
+        try:
+            return date.fromisoformat(text)
+        except ValueError:
+            print("Please type the date as YYYY-MM-DD.")
+
+
+def list_meter_checks():
+    print("\n== List of meter checks (most recent first) ==")
+    print("Filters (leave blank for all):")
+    filters = {
+        "date_from": ask_date("From date (YYYY-MM-DD): "),
+        "date_to": ask_date("To date (YYYY-MM-DD): "),
+        "technician_id": input("Technician ID: ").strip().upper() or None,
+        "region": input("Region: ").strip().title() or None,
+    }
+    show_all = input("Show all at once (a) or one page at a time (Enter)? ").strip().lower() == "a"
 
-    cur = conn.cursor()
     try:
-        cur.execute("""
-            SELECT 
-                c.person_id AS client_id,
-                mc.meter_serial,
-                mc.check_date,
-                mc.meter_read,
-                con.property_address
-            FROM electrogrid.meter_check AS mc
-            JOIN electrogrid.connections AS con 
-                ON mc.meter_serial = con.meter_serial
-            JOIN electrogrid.client AS c 
-                ON con.client_id = c.person_id
-            JOIN electrogrid.person AS p_client 
-                ON c.person_id = p_client.person_id
-            ORDER BY mc.check_date DESC;
-        """)
-
-        rows = cur.fetchall()
-
-        print("\n-- Meter Checks (sorted by most recent date) --")
-        if not rows:
-            print("(none found)")
-        else:
-            headers = ["client_id", "meter_serial", 
-                       "check_date", "meter_read", "property_address"]
-            print(tabulate(rows, headers=headers, tablefmt="grid"))
+        with connection() as conn:
+            print("\n-- Meter Checks (sorted by most recent date) --")
+            if show_all:
+                shown = print_all_meter_checks(conn, filters)
+            else:
+                shown = page_meter_checks(conn, filters)
+
+            if not shown:
+                print("(none found)")
 
     except Exception as e:
         print("Error:", e)
-    finally:
-        cur.close()
 
-#------------------------------MENU ----------------------------------------------------#
-print("\n========= ELECTROGRID MENU =========")
-print("1) Insert new client")
-print("2) Search for a client's information")
-print("3) Search for a technician based on region")
-print("4) List all meter checks (most recent on top)")
-print("5) Exit")
-choice = input("Enter your choice: ").strip()
 
-if choice == "1":
-        insert_client(conn)
+def print_all_meter_checks(conn, filters):
+    """Print every matching meter check, one table per batch as the rows arrive."""
+    shown, batch = 0, []
+    for row in stream_meter_checks(conn, **filters):
+        batch.append(row)
+        if len(batch) == FETCH_SIZE:
+            print(tabulate(batch, headers=METER_CHECK_HEADERS, tablefmt="grid"))
+            shown, batch = shown + len(batch), []
+    if batch:
+        print(tabulate(batch, headers=METER_CHECK_HEADERS, tablefmt="grid"))
+    return shown + len(batch)
+
+
+def page_meter_checks(conn, filters):
+    """Print the matching meter checks PAGE_SIZE at a time until the user stops."""
+    shown, after = 0, None
+    while True:
+        rows = meter_checks_page(conn, after=after, **filters)
+        if not rows:
+            return shown
+        print(tabulate(rows, headers=METER_CHECK_HEADERS, tablefmt="grid"))
+        shown += len(rows)
+        if len(rows) < PAGE_SIZE:
+            return shown
 
-elif choice == "2":
-        search_client(conn)
+        # the next page starts after the last row of this one
+        after = (rows[-1][3], rows[-1][0])
+        if input(f"Shown {shown}. Enter for the next page, q to stop: ").strip().lower() == "q":
+            return shown
 
-elif choice == "3":
-        search_technician(conn)
+#------------------------------MENU ----------------------------------------------------#
+def menu():
+    """Show the menu until the user exits. Connections stay open in the pool between actions."""
+    while True:
+        print("\n========= ELECTROGRID MENU =========")
+        print("1) Insert new client")
+        print("2) Search for a client's information")
+        print("3) Search for a technician based on region")
+        print("4) List all meter checks (most recent on top)")
+        print("5) Find technicians for a job (region, skills, fewest open orders)")
+        print("6) Exit")
+        choice = input("Enter your choice: ").strip()
+
+        if choice == "1":
+            insert_client()
+
+        elif choice == "2":
+            search_client()
+
+        elif choice == "3":
+            search_technician()
+
+        elif choice == "4":
+            list_meter_checks()
+
+        elif choice == "5":
+            find_technicians()
+
+        elif choice == "6":
+            print("Exiting program.")
+            return
 
-elif choice == "4":
-    list_meter_checks(conn)
+        else:
+            print("Invalid option. Try again.")
 
-elif choice == "5":
-    print("Exiting program.")
-    conn.close()
-    
-else:
-    print("Invalid option. Try again.")
 
+if __name__ == "__main__":
+    start_from_environment()
+    try:
+        menu()
+    finally:
+        close_dispatch_index()
+        close_reference_cache()
+        close_pool()
@@ -16,6 +16,14 @@ DROP TABLE IF EXISTS Connection_Type CASCADE;
 DROP TABLE IF EXISTS Status CASCADE;
 DROP TABLE IF EXISTS Service_Type CASCADE;
 DROP TABLE IF EXISTS Meter_Check CASCADE;
+DROP TABLE IF EXISTS Bill_Rollup_Client CASCADE;
+DROP TABLE IF EXISTS Bill_Rollup_Connection CASCADE;
+DROP TABLE IF EXISTS Bill_Rollup_Region CASCADE;
+DROP TABLE IF EXISTS Bill_Consumption CASCADE;
+DROP TABLE IF EXISTS Meter_Reading CASCADE;
+DROP TABLE IF EXISTS Meter_Event CASCADE;
+DROP SEQUENCE IF EXISTS Client_Id_Seq;
+DROP SCHEMA IF EXISTS electrogrid_archive CASCADE;
 
 
 
@@ -48,6 +56,10 @@ CREATE TABLE Client (
     address TEXT NOT NULL
 );
 
+-- Number of the next new client ID ('C' followed by the number, at least 3 digits).
+-- The loader moves it past the highest loaded ID after every load.
+CREATE SEQUENCE Client_Id_Seq;
+
 CREATE TABLE Technician (
     person_id VARCHAR(50) PRIMARY KEY REFERENCES Person(person_id) ON DELETE CASCADE,
     region_name VARCHAR(100) REFERENCES Region(region_name)
@@ -74,34 +86,500 @@ CREATE TABLE Connections (
     technician_id VARCHAR(50) REFERENCES Technician(person_id)
 );
 
+-- Bills and Service_Orders are partitioned by month of issue_date and
+-- start_date (see Partitions below), so their primary keys include those
+-- columns (see Partitions below for where bills_id and service_order_id
+-- are kept unique).
 CREATE TABLE Bills (
-    bills_id VARCHAR(50) PRIMARY KEY,
+    bills_id VARCHAR(50),
     period_starts DATE,
     period_ends DATE,
     kwh_used NUMERIC,
     amount NUMERIC(10,2),
-    issue_date DATE,
+    issue_date DATE NOT NULL,
     payment_date DATE,
     client_id VARCHAR(50) REFERENCES Client(person_id),
-    connection_id VARCHAR(50) REFERENCES Connections(connection_id)
-);
+    connection_id VARCHAR(50) REFERENCES Connections(connection_id),
+    PRIMARY KEY (bills_id, issue_date)
+) PARTITION BY RANGE (issue_date);
 
 CREATE TABLE Service_Orders (
-    service_order_id VARCHAR(50) PRIMARY KEY,
+    service_order_id VARCHAR(50),
     service_type VARCHAR(50) REFERENCES Service_Type(service_type),
-    start_date DATE,
+    start_date DATE NOT NULL,
     end_date DATE,
     notes TEXT,
     client_id VARCHAR(50) REFERENCES Client(person_id),
     technician_id VARCHAR(50) REFERENCES Technician(person_id),
-    connection_id VARCHAR(50) REFERENCES Connections(connection_id)
-);
+    connection_id VARCHAR(50) REFERENCES Connections(connection_id),
+    PRIMARY KEY (service_order_id, start_date)
+) PARTITION BY RANGE (start_date);
 
 CREATE TABLE Meter_Check (
     check_id VARCHAR(50) PRIMARY KEY,
     meter_serial VARCHAR(100) REFERENCES Connections(meter_serial),
     technician_id VARCHAR(50) REFERENCES Technician(person_id),
-    check_date DATE,
+    check_date DATE NOT NULL,
     meter_read TEXT
 );
 
+
+
+-- Partitions
+--
+-- Bills and Service_Orders have one partition per month, named
+-- <table>_yYYYYmMM (bills_y2025m03 holds the bills issued in March 2025).
+-- Queries that filter on issue_date or start_date only read the partitions
+-- of those months, and old months are archived by detaching their partitions
+-- instead of deleting rows (partitions.py).
+--
+-- Rows of a month without a partition go to the default partition, so a load
+-- never fails for a missing month. create_month_partitions creates the
+-- partitions of a range of months; the loader calls it for the months in the
+-- CSVs before loading, and partitions.py --ahead for the coming months. Rows
+-- of a new month that are already in the default partition are moved into it.
+--
+-- The primary keys only make (bills_id, issue_date) and (service_order_id,
+-- start_date) unique: PostgreSQL cannot enforce a unique id across the
+-- partitions of a table. The loaders keep the ids unique across months
+-- instead: every load path drops repeated ids over the whole file (cleaning,
+-- --chunksize across chunks, --staging in SQL) before writing. Rows written
+-- by hand must not reuse an id from another month.
+
+CREATE TABLE Bills_Default PARTITION OF Bills DEFAULT;
+CREATE TABLE Service_Orders_Default PARTITION OF Service_Orders DEFAULT;
+
+CREATE OR REPLACE FUNCTION create_month_partitions(parent TEXT, first_month DATE, last_month DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    key TEXT;
+    month DATE := date_trunc('month', first_month);
+    next_month DATE;
+    partition TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT a.attname INTO key
+    FROM pg_partitioned_table AS p
+    JOIN pg_attribute AS a ON a.attrelid = p.partrelid AND a.attnum = p.partattrs[0]
+    WHERE p.partrelid = format('electrogrid.%I', parent)::REGCLASS;
+
+    WHILE month <= last_month LOOP
+        next_month := month + INTERVAL '1 month';
+        partition := format('%s_y%sm%s', parent, to_char(month, 'YYYY'), to_char(month, 'MM'));
+        IF to_regclass(format('electrogrid.%I', partition)) IS NULL THEN
+            EXECUTE format('CREATE TABLE electrogrid.%I (LIKE electrogrid.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+                           partition, parent);
+            EXECUTE format('WITH moved AS (DELETE FROM electrogrid.%I WHERE %I >= %L AND %I < %L RETURNING *) '
+                           'INSERT INTO electrogrid.%I SELECT * FROM moved',
+                           parent || '_default', key, month, key, next_month, partition);
+            EXECUTE format('ALTER TABLE electrogrid.%I ATTACH PARTITION electrogrid.%I FOR VALUES FROM (%L) TO (%L)',
+                           parent, partition, month, next_month);
+            created := created + 1;
+        END IF;
+        month := next_month;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Indexes
+--
+-- Primary keys and the UNIQUE columns (person.email, person.phone,
+-- connections.meter_serial) are already indexed by their constraints. The
+-- indexes below serve the lookups in electrogrid.py and the foreign-key
+-- columns, which are searched from the parent side whenever a referenced row
+-- is deleted (ON DELETE CASCADE) or its key is changed.
+
+-- Active connections of a client (search_client)
+CREATE INDEX connections_active_client_idx ON Connections (client_id) WHERE status = 'Active';
+
+-- Service orders of a connection, most recent first (search_client)
+CREATE INDEX service_orders_connection_start_idx ON Service_Orders (connection_id, start_date DESC);
+
+-- Technicians of a region (search_technician)
+CREATE INDEX technician_region_idx ON Technician (region_name);
+
+-- Meter checks, most recent first, by date range and keyset page (list_meter_checks)
+CREATE INDEX meter_check_date_idx ON Meter_Check (check_date DESC, check_id DESC);
+
+-- Meter checks of a technician, or of the technicians of a region, most recent first
+CREATE INDEX meter_check_technician_idx ON Meter_Check (technician_id, check_date DESC, check_id DESC);
+
+-- Open service orders of a technician (dispatch.py and its SQL equivalent)
+CREATE INDEX service_orders_open_technician_idx ON Service_Orders (technician_id) WHERE end_date IS NULL;
+
+-- Remaining foreign-key columns
+CREATE INDEX connections_client_idx ON Connections (client_id);
+CREATE INDEX connections_technician_idx ON Connections (technician_id);
+CREATE INDEX bills_client_idx ON Bills (client_id);
+CREATE INDEX bills_connection_idx ON Bills (connection_id);
+CREATE INDEX service_orders_client_idx ON Service_Orders (client_id);
+CREATE INDEX service_orders_technician_idx ON Service_Orders (technician_id);
+CREATE INDEX technician_skill_skill_idx ON Technician_Skill (skill_name);
+CREATE INDEX meter_check_serial_idx ON Meter_Check (meter_serial);
+
+
+-- Change notifications for cached reference data
+--
+-- refcache.py caches the reference tables and the technician roster of each
+-- region, and LISTENs on the electrogrid_reference channel. These triggers
+-- send the name of the changed table on that channel; the notification is
+-- delivered when the transaction commits, once per table and transaction.
+
+CREATE OR REPLACE FUNCTION notify_reference_change() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('electrogrid_reference', TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- A technician's name, email or phone is part of the roster (and the name
+-- of the dispatch index, see below)
+CREATE OR REPLACE FUNCTION notify_technician_person_change() RETURNS trigger AS $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM electrogrid.technician WHERE person_id = NEW.person_id) THEN
+        PERFORM pg_notify('electrogrid_reference', 'technician');
+        PERFORM pg_notify('electrogrid_dispatch', 'roster');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER region_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Region
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+CREATE TRIGGER status_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Status
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+CREATE TRIGGER connection_type_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Connection_Type
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+CREATE TRIGGER service_type_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Service_Type
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+CREATE TRIGGER technician_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Technician
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_reference_change();
+CREATE TRIGGER technician_person_changed AFTER UPDATE ON Person
+    FOR EACH ROW EXECUTE FUNCTION notify_technician_person_change();
+
+
+-- Change notifications for the dispatch index
+--
+-- dispatch.py keeps every technician's region, skills and number of open
+-- service orders (those without an end_date) in memory, and LISTENs on the
+-- electrogrid_dispatch channel. A change to technicians, their skills or
+-- the skills sends 'roster', and the index is rebuilt. A statement on
+-- service orders sends 'orders:' followed by the technicians whose open
+-- orders it inserted, changed or deleted, comma-separated, and only their
+-- counts are read again; 'orders:*' (after a TRUNCATE, or when the list is
+-- too long for a notification) has every count read again.
+
+CREATE OR REPLACE FUNCTION notify_dispatch_roster() RETURNS trigger AS $$
+BEGIN
+    PERFORM pg_notify('electrogrid_dispatch', 'roster');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION notify_dispatch_orders() RETURNS trigger AS $$
+DECLARE
+    touched TEXT := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT technician_id FROM new_orders WHERE end_date IS NULL'
+        WHEN 'DELETE' THEN 'SELECT technician_id FROM old_orders WHERE end_date IS NULL'
+        ELSE 'SELECT technician_id FROM new_orders WHERE end_date IS NULL
+              UNION SELECT technician_id FROM old_orders WHERE end_date IS NULL'
+    END;
+    technicians TEXT;
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        PERFORM pg_notify('electrogrid_dispatch', 'orders:*');
+        RETURN NULL;
+    END IF;
+    EXECUTE format('SELECT string_agg(DISTINCT technician_id, '','') FROM (%s) AS t', touched) INTO technicians;
+    IF technicians IS NOT NULL THEN
+        -- a notification payload must stay under 8000 bytes
+        PERFORM pg_notify('electrogrid_dispatch',
+                          'orders:' || CASE WHEN length(technicians) > 7900 THEN '*' ELSE technicians END);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER service_orders_dispatch_inserted AFTER INSERT ON Service_Orders REFERENCING NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_orders();
+CREATE TRIGGER service_orders_dispatch_updated AFTER UPDATE ON Service_Orders
+    REFERENCING OLD TABLE AS old_orders NEW TABLE AS new_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_orders();
+CREATE TRIGGER service_orders_dispatch_deleted AFTER DELETE ON Service_Orders REFERENCING OLD TABLE AS old_orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_orders();
+CREATE TRIGGER service_orders_dispatch_truncated AFTER TRUNCATE ON Service_Orders
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_orders();
+CREATE TRIGGER technician_dispatch_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Technician
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_roster();
+CREATE TRIGGER technician_skill_dispatch_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Technician_Skill
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_roster();
+CREATE TRIGGER skills_dispatch_changed AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON Skills
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_dispatch_roster();
+
+
+-- Billing rollups
+--
+-- Monthly totals of the bills per client, per connection and per region, for
+-- the reports in billing_rollups.py. A bill counts in the month of its
+-- issue_date and in the region of its connection's technician; bills without
+-- an issue date (or without a client, connection or region, for that table)
+-- are left out. unpaid_count counts the bills without a payment_date.
+--
+-- The triggers below keep the totals up to date as bills are inserted,
+-- updated or deleted: each statement adds the totals of its new rows and
+-- subtracts those of its old rows, and months whose last bill is gone are
+-- removed. A connection moving to a technician of another region, or a
+-- technician to another region, moves that connection's totals with it.
+-- billing_rollups.py --rebuild recomputes everything from the bills.
+
+CREATE TABLE Bill_Rollup_Client (
+    client_id VARCHAR(50),
+    month DATE,
+    kwh_used NUMERIC NOT NULL,
+    amount_billed NUMERIC NOT NULL,
+    amount_paid NUMERIC NOT NULL,
+    bill_count BIGINT NOT NULL,
+    unpaid_count BIGINT NOT NULL,
+    PRIMARY KEY (client_id, month)
+);
+
+CREATE TABLE Bill_Rollup_Connection (
+    connection_id VARCHAR(50),
+    month DATE,
+    kwh_used NUMERIC NOT NULL,
+    amount_billed NUMERIC NOT NULL,
+    amount_paid NUMERIC NOT NULL,
+    bill_count BIGINT NOT NULL,
+    unpaid_count BIGINT NOT NULL,
+    PRIMARY KEY (connection_id, month)
+);
+
+CREATE TABLE Bill_Rollup_Region (
+    region_name VARCHAR(100),
+    month DATE,
+    kwh_used NUMERIC NOT NULL,
+    amount_billed NUMERIC NOT NULL,
+    amount_paid NUMERIC NOT NULL,
+    bill_count BIGINT NOT NULL,
+    unpaid_count BIGINT NOT NULL,
+    PRIMARY KEY (region_name, month)
+);
+
+-- Outstanding balance of every client (billing_rollups.top_outstanding)
+CREATE INDEX bill_rollup_client_unpaid_idx ON Bill_Rollup_Client (client_id) WHERE unpaid_count > 0;
+
+-- Adds the signed totals of the changed bills to the three rollups. The
+-- changed rows are read from the statement's transition tables (new_bills
+-- and/or old_bills), which EXECUTE can see, so one function serves all three
+-- triggers.
+CREATE OR REPLACE FUNCTION bill_rollup_apply() RETURNS trigger AS $$
+DECLARE
+    changes TEXT := CASE TG_OP
+        WHEN 'INSERT' THEN 'SELECT 1 AS sign, * FROM new_bills'
+        WHEN 'DELETE' THEN 'SELECT -1 AS sign, * FROM old_bills'
+        ELSE 'SELECT 1 AS sign, * FROM new_bills UNION ALL SELECT -1 AS sign, * FROM old_bills'
+    END;
+BEGIN
+    EXECUTE format($sql$
+        WITH changes AS (%s),
+        delta AS MATERIALIZED (
+            SELECT b.client_id, b.connection_id, date_trunc('month', b.issue_date)::DATE AS month,
+                   sum(b.sign * coalesce(b.kwh_used, 0)) AS kwh_used,
+                   sum(b.sign * coalesce(b.amount, 0)) AS amount_billed,
+                   sum(b.sign * CASE WHEN b.payment_date IS NOT NULL THEN coalesce(b.amount, 0) ELSE 0 END) AS amount_paid,
+                   sum(b.sign) AS bill_count,
+                   sum(b.sign * (b.payment_date IS NULL)::INT) AS unpaid_count
+            FROM changes AS b
+            WHERE b.issue_date IS NOT NULL
+            GROUP BY 1, 2, 3
+        ),
+        by_client AS (
+            INSERT INTO electrogrid.bill_rollup_client AS r
+            SELECT client_id, month, sum(kwh_used), sum(amount_billed), sum(amount_paid), sum(bill_count), sum(unpaid_count)
+            FROM delta WHERE client_id IS NOT NULL GROUP BY client_id, month
+            ON CONFLICT (client_id, month) DO UPDATE SET
+                kwh_used = r.kwh_used + EXCLUDED.kwh_used, amount_billed = r.amount_billed + EXCLUDED.amount_billed,
+                amount_paid = r.amount_paid + EXCLUDED.amount_paid, bill_count = r.bill_count + EXCLUDED.bill_count,
+                unpaid_count = r.unpaid_count + EXCLUDED.unpaid_count
+        ),
+        by_connection AS (
+            INSERT INTO electrogrid.bill_rollup_connection AS r
+            SELECT connection_id, month, sum(kwh_used), sum(amount_billed), sum(amount_paid), sum(bill_count), sum(unpaid_count)
+            FROM delta WHERE connection_id IS NOT NULL GROUP BY connection_id, month
+            ON CONFLICT (connection_id, month) DO UPDATE SET
+                kwh_used = r.kwh_used + EXCLUDED.kwh_used, amount_billed = r.amount_billed + EXCLUDED.amount_billed,
+                amount_paid = r.amount_paid + EXCLUDED.amount_paid, bill_count = r.bill_count + EXCLUDED.bill_count,
+                unpaid_count = r.unpaid_count + EXCLUDED.unpaid_count
+        )
+        INSERT INTO electrogrid.bill_rollup_region AS r
+        SELECT t.region_name, d.month, sum(d.kwh_used), sum(d.amount_billed), sum(d.amount_paid), sum(d.bill_count), sum(d.unpaid_count)
+        FROM delta AS d
+        JOIN electrogrid.connections AS c ON c.connection_id = d.connection_id
+        JOIN electrogrid.technician AS t ON t.person_id = c.technician_id
+        WHERE t.region_name IS NOT NULL
+        GROUP BY t.region_name, d.month
+        ON CONFLICT (region_name, month) DO UPDATE SET
+            kwh_used = r.kwh_used + EXCLUDED.kwh_used, amount_billed = r.amount_billed + EXCLUDED.amount_billed,
+            amount_paid = r.amount_paid + EXCLUDED.amount_paid, bill_count = r.bill_count + EXCLUDED.bill_count,
+            unpaid_count = r.unpaid_count + EXCLUDED.unpaid_count;
+    $sql$, changes);
+
+    -- Only the keys of removed bills can drop to zero; probe those through the
+    -- primary keys instead of scanning the rollups on every statement.
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM electrogrid.bill_rollup_client AS r
+        USING (SELECT DISTINCT client_id, date_trunc('month', issue_date)::DATE AS month FROM old_bills) AS o
+        WHERE r.client_id = o.client_id AND r.month = o.month AND r.bill_count = 0;
+        DELETE FROM electrogrid.bill_rollup_connection AS r
+        USING (SELECT DISTINCT connection_id, date_trunc('month', issue_date)::DATE AS month FROM old_bills) AS o
+        WHERE r.connection_id = o.connection_id AND r.month = o.month AND r.bill_count = 0;
+        DELETE FROM electrogrid.bill_rollup_region AS r
+        USING (SELECT DISTINCT t.region_name, date_trunc('month', b.issue_date)::DATE AS month
+               FROM old_bills AS b
+               JOIN electrogrid.connections AS c ON c.connection_id = b.connection_id
+               JOIN electrogrid.technician AS t ON t.person_id = c.technician_id) AS o
+        WHERE r.region_name = o.region_name AND r.month = o.month AND r.bill_count = 0;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bill_rollup_truncate() RETURNS trigger AS $$
+BEGIN
+    TRUNCATE electrogrid.bill_rollup_client, electrogrid.bill_rollup_connection, electrogrid.bill_rollup_region;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Moves the region totals of connections whose region changed: connections
+-- updated to a technician of another region, or all connections of a
+-- technician updated to another region.
+CREATE OR REPLACE FUNCTION bill_rollup_move_region() RETURNS trigger AS $$
+DECLARE
+    moved TEXT := CASE TG_TABLE_NAME
+        WHEN 'connections' THEN
+            'SELECT n.connection_id, ot.region_name AS old_region, nt.region_name AS new_region
+             FROM old_rows AS o
+             JOIN new_rows AS n ON n.connection_id = o.connection_id
+             LEFT JOIN electrogrid.technician AS ot ON ot.person_id = o.technician_id
+             LEFT JOIN electrogrid.technician AS nt ON nt.person_id = n.technician_id
+             WHERE ot.region_name IS DISTINCT FROM nt.region_name'
+        ELSE
+            'SELECT c.connection_id, o.region_name AS old_region, n.region_name AS new_region
+             FROM old_rows AS o
+             JOIN new_rows AS n ON n.person_id = o.person_id
+             JOIN electrogrid.connections AS c ON c.technician_id = n.person_id
+             WHERE o.region_name IS DISTINCT FROM n.region_name'
+    END;
+BEGIN
+    EXECUTE format($sql$
+        WITH moved AS (%s)
+        INSERT INTO electrogrid.bill_rollup_region AS r
+        SELECT v.region_name, r.month, sum(v.sign * r.kwh_used), sum(v.sign * r.amount_billed),
+               sum(v.sign * r.amount_paid), sum(v.sign * r.bill_count), sum(v.sign * r.unpaid_count)
+        FROM moved AS m
+        JOIN electrogrid.bill_rollup_connection AS r ON r.connection_id = m.connection_id
+        CROSS JOIN LATERAL (VALUES (m.old_region, -1), (m.new_region, 1)) AS v (region_name, sign)
+        WHERE v.region_name IS NOT NULL
+        GROUP BY v.region_name, r.month
+        ON CONFLICT (region_name, month) DO UPDATE SET
+            kwh_used = r.kwh_used + EXCLUDED.kwh_used, amount_billed = r.amount_billed + EXCLUDED.amount_billed,
+            amount_paid = r.amount_paid + EXCLUDED.amount_paid, bill_count = r.bill_count + EXCLUDED.bill_count,
+            unpaid_count = r.unpaid_count + EXCLUDED.unpaid_count;
+    $sql$, moved);
+    DELETE FROM electrogrid.bill_rollup_region WHERE bill_count = 0;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER bills_inserted AFTER INSERT ON Bills REFERENCING NEW TABLE AS new_bills
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollup_apply();
+CREATE TRIGGER bills_updated AFTER UPDATE ON Bills REFERENCING OLD TABLE AS old_bills NEW TABLE AS new_bills
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollup_apply();
+CREATE TRIGGER bills_deleted AFTER DELETE ON Bills REFERENCING OLD TABLE AS old_bills
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollup_apply();
+CREATE TRIGGER bills_truncated AFTER TRUNCATE ON Bills
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollup_truncate();
+CREATE TRIGGER connections_region_moved AFTER UPDATE ON Connections REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollup_move_region();
+CREATE TRIGGER technician_region_moved AFTER UPDATE ON Technician REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION bill_rollup_move_region();
+
+
+-- Consumption metrics
+--
+-- Written by consumption_analytics.py for every bill with a connection: the
+-- length of the billing period, the average daily kWh, the price per kWh,
+-- the change in daily kWh since the connection's previous bill, and how many
+-- standard deviations the daily kWh is from the connection's other bills.
+-- flagged marks the bills to look at for theft or meter faults. The table is
+-- rewritten as a whole on every run, so it has no foreign key to Bills (which
+-- the loader truncates).
+
+CREATE TABLE Bill_Consumption (
+    bills_id VARCHAR(50) PRIMARY KEY,
+    connection_id VARCHAR(50) NOT NULL,
+    period_starts DATE,
+    days INTEGER,
+    avg_daily_kwh DOUBLE PRECISION,
+    price_per_kwh DOUBLE PRECISION,
+    mom_change DOUBLE PRECISION,
+    z_score DOUBLE PRECISION,
+    flagged BOOLEAN NOT NULL
+);
+
+-- Time series of a connection (consumption_analytics.connection_series)
+CREATE INDEX bill_consumption_connection_idx ON Bill_Consumption (connection_id, period_starts);
+
+
+-- Smart-meter readings
+--
+-- Every meter sends a reading every 15 minutes: the kWh used since its
+-- previous reading and, when something happened, an event code (the faults
+-- technicians note in Meter_Check.meter_read, as codes). A reading may carry
+-- only an event, with no kWh. meter_readings.py streams them in with COPY
+-- from files or a local socket.
+--
+-- The table is append-only and rows arrive in read_at order, so a BRIN index
+-- (the min and max read_at of every block range) finds a time window at a
+-- tiny fraction of a B-tree's size and insert cost. Per-meter queries always
+-- take a time window and filter the meter within it. There are no foreign
+-- keys, which would cost a lookup per reading: the ingester checks
+-- meter_serial against Connections and event_code against Meter_Event for
+-- each batch, and the readings outlive reloads of Connections.
+
+CREATE TABLE Meter_Event (
+    event_code VARCHAR(30) PRIMARY KEY,
+    description TEXT NOT NULL
+);
+
+INSERT INTO Meter_Event (event_code, description) VALUES
+    ('overload', 'Overload detected'),
+    ('voltage_spike', 'Voltage spike'),
+    ('power_outage', 'Supply lost'),
+    ('power_restored', 'Supply restored'),
+    ('communication_error', 'Communication error'),
+    ('calibration_needed', 'Calibration needed'),
+    ('display_fault', 'Display faulty'),
+    ('sensor_failure', 'Sensor failure'),
+    ('battery_low', 'Battery low'),
+    ('wiring_issue', 'Wiring issue'),
+    ('tamper', 'Tamper or bypass suspected'),
+    ('reset', 'Meter reset');
+
+CREATE TABLE Meter_Reading (
+    meter_serial VARCHAR(100) NOT NULL,
+    read_at TIMESTAMPTZ NOT NULL,
+    kwh NUMERIC(12,3) CHECK (kwh >= 0),
+    event_code VARCHAR(30),
+    CHECK (kwh IS NOT NULL OR event_code IS NOT NULL)
+);
+
+-- Block ranges written after the last summary match every query until they
+-- are summarized: autosummarize has autovacuum do it, and meter_readings.py
+-- summarizes after each batch so new readings are found at once.
+CREATE INDEX meter_reading_read_at_brin ON Meter_Reading USING BRIN (read_at)
+    WITH (pages_per_range = 32, autosummarize = on);
+
@@ -0,0 +1,140 @@
+import argparse
+import json
+import sys
+
+from tabulate import tabulate
+
+import dispatch
+import electrogrid
+import refcache
+from load_electrogrid import connect
+
+
+# Index usage check for the electrogrid.py menu queries
+#
+# Runs EXPLAIN on every lookup in electrogrid.py, with parameters taken from
+# the data in the database, and checks that the plan reads the indexes from
+# electrogrid.sql that the query was written for.
+#
+# On the small sample data a sequential scan followed by a sort is cheaper
+# than any index, so by default both are disabled for the check (SET LOCAL
+# enable_seqscan / enable_sort = off). The planner still falls back to them
+# when no index can serve the filter or the order, for example when the column
+# is wrapped in a cast, so the check shows whether each query *can* use its
+# indexes. Pass --as-is on realistic volumes to check the plans the planner
+# picks by itself.
+
+# Prepared statements run by electrogrid.py, checked through EXPLAIN EXECUTE
+PREPARED = [("client_profile", "BIGINT", electrogrid.CLIENT_PROFILE)]
+
+# (name, SQL, query returning the parameters, indexes the plan must use).
+# A tuple of indexes means any one of them: a region filter can walk the
+# checks by date and look up each technician, or start from the region's
+# technicians, depending on the data.
+CHECKS = [
+    ("client profile", "EXECUTE client_profile (%s)",
+     "SELECT p.phone FROM electrogrid.person p JOIN electrogrid.client c USING (person_id) "
+     "WHERE p.phone IS NOT NULL LIMIT 1;",
+     ["person_phone_key", "connections_active_client_idx", "service_orders_connection_start_idx"]),
+    ("technicians by region", refcache.TECHNICIANS_BY_REGION,
+     "SELECT region_name FROM electrogrid.region LIMIT 1;",
+     ["technician_region_idx"]),
+    ("open orders of technicians (dispatch)", dispatch.OPEN_ORDERS_OF,
+     "SELECT array_agg(person_id) FROM (SELECT person_id FROM electrogrid.technician LIMIT 5) AS t;",
+     ["service_orders_open_technician_idx"]),
+    ("meter checks, first page", electrogrid.meter_checks_query(limit=electrogrid.PAGE_SIZE)[0], None,
+     ["meter_check_date_idx"]),
+    ("meter checks, next page", electrogrid.meter_checks_query(after=("", ""), limit=electrogrid.PAGE_SIZE)[0],
+     "SELECT check_date, check_id FROM electrogrid.meter_check LIMIT 1;",
+     ["meter_check_date_idx"]),
+    ("meter checks, date range",
+     electrogrid.meter_checks_query(date_from="", date_to="", limit=electrogrid.PAGE_SIZE)[0],
+     "SELECT min(check_date), max(check_date) FROM electrogrid.meter_check;",
+     ["meter_check_date_idx"]),
+    ("meter checks, technician", electrogrid.meter_checks_query(technician_id="", limit=electrogrid.PAGE_SIZE)[0],
+     "SELECT technician_id FROM electrogrid.meter_check LIMIT 1;",
+     ["meter_check_technician_idx"]),
+    ("meter checks, region", electrogrid.meter_checks_query(region="", limit=electrogrid.PAGE_SIZE)[0],
+     "SELECT region_name FROM electrogrid.region LIMIT 1;",
+     [("meter_check_date_idx", "meter_check_technician_idx"), ("technician_region_idx", "technician_pkey")]),
+]
+
+
+def plan_nodes(node):
+    """Every node of an EXPLAIN (FORMAT JSON) plan tree."""
+    yield node
+    for child in node.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def root_indexes(cur, names):
+    """`names` with each index of a partition replaced by the index of its partitioned table."""
+    if not names:
+        return []
+    cur.execute("""
+        SELECT coalesce(pg_partition_root(c.oid), c.oid)::REGCLASS::TEXT
+        FROM pg_class AS c
+        JOIN pg_namespace AS n ON n.oid = c.relnamespace
+        WHERE n.nspname = 'electrogrid' AND c.relname = ANY(%s);
+    """, (list(names),))
+    return [row[0].removeprefix("electrogrid.") for row in cur.fetchall()]
+
+
+def explain(cur, query, params):
+    """(indexes read, tables read sequentially) by the plan of `query`."""
+    cur.execute("EXPLAIN (FORMAT JSON) " + query, params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = list(plan_nodes(plan[0]["Plan"]))
+    indexes = sorted(set(root_indexes(cur, {n["Index Name"] for n in nodes if "Index Name" in n})))
+    seq_scans = sorted({n["Relation Name"] for n in nodes if n["Node Type"] == "Seq Scan"})
+    return indexes, seq_scans
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check that the electrogrid.py queries use their indexes.")
+    parser.add_argument("--as-is", action="store_true",
+                        help="keep sequential scans and sorts enabled and check the planner's own choice")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    conn = connect()
+    rows, failed = [], 0
+    try:
+        with conn.cursor() as cur:
+            if not args.as_is:
+                cur.execute("SET LOCAL enable_seqscan = off; SET LOCAL enable_sort = off;")
+            for name, types, statement in PREPARED:
+                cur.execute(f"PREPARE {name} ({types}) AS {statement}")
+
+            for name, query, params_query, expected in CHECKS:
+                params = None
+                if params_query:
+                    cur.execute(params_query)
+                    params = cur.fetchone()
+                    if params is None:
+                        print(f" Skipped {name}: no data to take parameters from")
+                        continue
+
+                indexes, seq_scans = explain(cur, query, params)
+                missing = [" or ".join(i) if isinstance(i, tuple) else i for i in expected
+                           if not set(i if isinstance(i, tuple) else [i]) & set(indexes)]
+                failed += bool(missing)
+                rows.append([name, "ok" if not missing else "MISSING " + ", ".join(missing),
+                             ", ".join(indexes), ", ".join(seq_scans)])
+    finally:
+        conn.rollback()
+        conn.close()
+
+    print(tabulate(rows, headers=["query", "result", "indexes used", "sequential scans"]))
+    if failed:
+        print(f"\n{failed} of {len(rows)} queries do not use their indexes.")
+        sys.exit(1)
+    print(f"\nAll {len(rows)} queries use their indexes.")
+
+
+if __name__ == "__main__":
+    main()
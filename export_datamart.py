@@ -0,0 +1,447 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import psycopg2
+from tabulate import tabulate
+
+import schema
+from db import close_pool, connection
+from partitions import PARTITIONED, add_months, partitions
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pa_compute
+    import pyarrow.csv as pa_csv
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pa_parquet
+except ImportError:
+    pa = None
+
+
+# Columnar export of the datamart to Parquet or Arrow files
+#
+#   python export_datamart.py exports/                      every table, as Parquet
+#   python export_datamart.py exports/ --format arrow       as Arrow IPC files
+#   python export_datamart.py exports/ --from 2025-01-01 --to 2025-04-01
+#                                                           bills and service orders of [--from, --to)
+#   python export_datamart.py exports/ --incremental        only the rows changed since the last export
+#   python export_datamart.py exports/ --tables bills connections
+#
+# Each table goes to its own directory. Bills, service orders and meter
+# readings are split into one directory per month (bills/month=2025-03/), so
+# pyarrow.dataset and pandas.read_parquet read the month back as a column and
+# skip the months a filter leaves out:
+#
+#   pd.read_parquet("exports/bills", filters=[("month", ">=", "2025-01")])
+#
+# Columns get the types declared in electrogrid.sql: dates as dates, NUMERIC
+# as decimals (NUMERIC without a scale as decimal(38, NUMERIC_SCALE)), and
+# statuses, types, regions, skills and event codes as dictionaries of their
+# lookup table's values (pandas categoricals), the same in every file.
+#
+# Rows are streamed out with COPY ... TO STDOUT, one month at a time (a
+# partition, or a range of read_at found through its BRIN index): COPY writes
+# into a pipe from a worker thread, and Arrow's CSV reader parses EXPORT_BLOCK
+# bytes at a time into typed columns on the other end. A full pipe holds COPY
+# back until the reader catches up, and a month's file is complete before the
+# next month is read, so memory stays at a few blocks whatever the size of
+# the table. Each block is written as a row group (Parquet) or record batch
+# (Arrow).
+#
+# Parquet files can be opened with memory_map=True; Arrow files are written
+# uncompressed, so pyarrow.ipc.open_file(pyarrow.memory_map(path)) reads
+# their columns in place, without copying them into memory.
+#
+# All tables are read in one REPEATABLE READ transaction, so the export is a
+# consistent snapshot. The oldest transaction still running when it started
+# is recorded as each table's watermark in _export.json. --incremental
+# exports, as new part files, the rows written by that transaction or any
+# later one (their xmin, compared modulo 2^32). Rows may come out again in a
+# later part; the last part holds their latest version. Deleted rows are not
+# seen: a full export replaces the table's directory, as does any export of a
+# table without a watermark. An export with --from/--to records none.
+
+EXPORT_BLOCK = int(os.environ.get("ELECTROGRID_EXPORT_BLOCK", 8 << 20))
+NUMERIC_SCALE = 9
+
+FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+MANIFEST = "_export.json"
+
+# Tables written in one directory per month of a date column
+MONTH_COLUMNS = {**PARTITIONED, "meter_reading": "read_at"}
+
+# Columns exported as dictionaries of the values of a lookup table
+CATEGORIES = {
+    "region_name": "region",
+    "connection_type": "connection_type",
+    "status": "status",
+    "service_type": "service_type",
+    "skill_name": "skills",
+    "event_code": "meter_event",
+}
+
+XID_RANGE = 1 << 32
+
+
+#---------------------------------- Types --------------------------------------------#
+
+def arrow_type(declared):
+    """Arrow type of a column declared as `declared` (upper case, from schema.TABLES)."""
+    name, _, arguments = declared.partition("(")
+    if name == "NUMERIC":
+        if not arguments:
+            return pa.decimal128(38, NUMERIC_SCALE)
+        precision, _, scale = arguments.rstrip(")").partition(",")
+        return pa.decimal128(int(precision), int(scale or 0))
+    return {
+        "VARCHAR": pa.string(),
+        "TEXT": pa.string(),
+        "DATE": pa.date32(),
+        "TIMESTAMPTZ": pa.timestamp("us", tz="UTC"),
+        "BIGINT": pa.int64(),
+        "INTEGER": pa.int32(),
+        "DOUBLE": pa.float64(),
+        "BOOLEAN": pa.bool_(),
+    }[name]
+
+
+def table_schema(table):
+    """Arrow schema of the files of `table`."""
+    types = schema.TABLES[table]["types"]
+    return pa.schema([
+        (column, pa.dictionary(pa.int32(), pa.string()) if column in CATEGORIES else arrow_type(types[column]))
+        for column in schema.TABLES[table]["columns"]
+    ])
+
+
+def select_list(table):
+    """The columns of `table` as selected for COPY; NUMERIC without a scale is rounded to NUMERIC_SCALE."""
+    types = schema.TABLES[table]["types"]
+    return ", ".join(f"round({column}, {NUMERIC_SCALE})" if types[column] == "NUMERIC" else column
+                     for column in schema.TABLES[table]["columns"])
+
+
+def read_categories(cur):
+    """{column: Arrow array of its lookup table's values} for every column of CATEGORIES."""
+    dictionaries = {}
+    for column, lookup in CATEGORIES.items():
+        cur.execute(f"SELECT {column} FROM electrogrid.{lookup} ORDER BY {column};")
+        dictionaries[column] = pa.array([row[0] for row in cur.fetchall()], pa.string())
+    return dictionaries
+
+
+def encode(batch, target, dictionaries):
+    """`batch` with its category columns dictionary-encoded, as a batch of `target` schema."""
+    arrays = []
+    for field, values in zip(target, batch.columns):
+        if pa.types.is_dictionary(field.type):
+            indices = pa_compute.index_in(values, value_set=dictionaries[field.name])
+            if indices.null_count != values.null_count:
+                raise ValueError(f"{field.name} has values that are not in {CATEGORIES[field.name]}")
+            values = pa.DictionaryArray.from_arrays(indices, dictionaries[field.name])
+        arrays.append(values)
+    return pa.RecordBatch.from_arrays(arrays, schema=target)
+
+
+#---------------------------------- Reading --------------------------------------------#
+
+def csv_options(table, block_size):
+    """Arrow CSV options for COPY's csv output of `table` (NULL is an unquoted empty field)."""
+    types = schema.TABLES[table]["types"]
+    columns = schema.TABLES[table]["columns"]
+    return {
+        "read_options": pa_csv.ReadOptions(column_names=columns, block_size=block_size),
+        "parse_options": pa_csv.ParseOptions(newlines_in_values=True),
+        "convert_options": pa_csv.ConvertOptions(
+            column_types={column: arrow_type(types[column]) for column in columns},
+            null_values=[""], strings_can_be_null=True, quoted_strings_can_be_null=False,
+            true_values=["t"], false_values=["f"],
+        ),
+    }
+
+
+def copy_batches(conn, table, query, block_size=EXPORT_BLOCK):
+    """Record batches of the rows of `query` (the columns of `table`), parsed while COPY streams them."""
+    read_end, write_end = os.pipe()
+
+    def copy():
+        with os.fdopen(write_end, "wb") as sink, conn.cursor() as cur:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", sink, size=1 << 16)
+
+    with ThreadPoolExecutor(max_workers=1) as pool, os.fdopen(read_end, "rb") as source:
+        copying = pool.submit(copy)
+        try:
+            if source.peek(1):
+                yield from pa_csv.open_csv(source, **csv_options(table, block_size))
+        except BaseException:
+            # COPY fails on the closed pipe instead of waiting for a reader
+            source.close()
+            failure = copying.exception()
+            if isinstance(failure, psycopg2.Error):
+                raise failure
+            raise
+        copying.result()
+
+
+def sources(cur, table, date_from=None, date_to=None):
+    """[(relation, conditions)] to COPY `table` from, one month at a time for the tables with months.
+
+    Partitioned tables are read partition by partition, skipping those outside
+    the period; the other tables with months are read one month range at a time.
+    """
+    if table in PARTITIONED:
+        return [(name, []) for name, lower, upper in partitions(cur, table)
+                if lower is None or ((date_to is None or lower < date_to) and (date_from is None or upper > date_from))]
+    if table not in MONTH_COLUMNS:
+        return [(table, [])]
+    column = MONTH_COLUMNS[table]
+    cur.execute(f"SELECT min({column})::DATE, max({column})::DATE FROM electrogrid.{table};")
+    first, last = cur.fetchone()
+    if first is None:
+        return []
+    found, month = [], first.replace(day=1)
+    while month <= last:
+        upper = add_months(month, 1)
+        if (date_to is None or month < date_to) and (date_from is None or upper > date_from):
+            found.append((table, [cur.mogrify(f"{column} >= %s AND {column} < %s", (month, upper)).decode()]))
+        month = upper
+    return found
+
+
+def conditions(cur, table, date_from=None, date_to=None, since=None):
+    """WHERE conditions for the period and the rows written since the `since` transaction."""
+    where = []
+    if date_from is not None:
+        where.append(cur.mogrify(f"{MONTH_COLUMNS[table]} >= %s", (date_from,)).decode())
+    if date_to is not None:
+        where.append(cur.mogrify(f"{MONTH_COLUMNS[table]} < %s", (date_to,)).decode())
+    if since is not None:
+        # xmin is the 32-bit transaction ID, which wraps around: compare it as a distance
+        where.append(f"(xmin::TEXT::BIGINT - {since % XID_RANGE} + {XID_RANGE}) % {XID_RANGE} < {XID_RANGE // 2}")
+    return where
+
+
+#---------------------------------- Writing --------------------------------------------#
+
+class PartWriter:
+    """Writes the batches of one table as part `part`: one file, or one per month of `month_column`.
+
+    Files are written under a temporary name and renamed when complete.
+    """
+
+    def __init__(self, directory, target, file_format, part, month_column=None):
+        self.directory = Path(directory)
+        self.target = target
+        self.file_format = file_format
+        self.part = part
+        self.name = f"part-{part:05d}{FORMATS[file_format]}"
+        self.month_column = month_column
+        self.writers = {}
+        self.rows = 0
+
+    def _writer(self, month):
+        if month not in self.writers:
+            directory = self.directory / f"month={month}" if month is not None else self.directory
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / self.name
+            temporary = path.with_name(path.name + ".tmp")
+            if self.file_format == "parquet":
+                writer = pa_parquet.ParquetWriter(temporary, self.target)
+            else:
+                writer = pa_ipc.new_file(temporary, self.target)
+            self.writers[month] = (writer, temporary, path)
+        return self.writers[month][0]
+
+    def write(self, batch):
+        self.rows += batch.num_rows
+        if self.month_column is None:
+            self._writer(None).write_batch(batch)
+            return
+        months = pa_compute.strftime(batch.column(self.month_column), format="%Y-%m")
+        distinct = pa_compute.unique(months)
+        if len(distinct) == 1:
+            self._writer(distinct[0].as_py()).write_batch(batch)
+            return
+        for month in distinct.to_pylist():
+            self._writer(month).write_batch(batch.filter(pa_compute.equal(months, month)))
+
+    def close(self):
+        """Complete the files. Returns [(path, bytes)]."""
+        if not self.writers and self.month_column is None and self.part == 0:
+            # a table without rows still gets a file, so its columns can be read
+            self._writer(None)
+        written = []
+        for writer, temporary, path in self.writers.values():
+            writer.close()
+            temporary.replace(path)
+            written.append((path, path.stat().st_size))
+        self.writers = {}
+        return written
+
+    def abort(self):
+        for writer, temporary, _ in self.writers.values():
+            writer.close()
+            temporary.unlink(missing_ok=True)
+        self.writers = {}
+
+
+#---------------------------------- Export --------------------------------------------#
+
+def begin_snapshot(cur):
+    """Start the read-only snapshot every table is read in. Returns its watermark (a 64-bit transaction ID)."""
+    cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+    cur.execute("SET LOCAL TimeZone = 'UTC';")
+    cur.execute("SET LOCAL DateStyle = 'ISO, YMD';")
+    cur.execute("SELECT pg_snapshot_xmin(pg_current_snapshot())::TEXT::BIGINT;")
+    return cur.fetchone()[0]
+
+
+def export_table(conn, table, directory, file_format, part, dictionaries,
+                 date_from=None, date_to=None, since=None, block_size=EXPORT_BLOCK):
+    """Write the rows of `table` as part `part` in `directory`. Returns (rows, [(path, bytes)])."""
+    target = table_schema(table)
+    month_column = MONTH_COLUMNS.get(table)
+    rows, written = 0, []
+    with conn.cursor() as cur:
+        where = conditions(cur, table, date_from, date_to, since)
+        relations = sources(cur, table, date_from, date_to)
+    for relation, slice_where in relations:
+        # one writer per relation: a month's rows are all in one partition or range, so its file is done after it
+        writer = PartWriter(directory, target, file_format, part, month_column)
+        query = f"SELECT {select_list(table)} FROM electrogrid.{relation}"
+        if where + slice_where:
+            query += " WHERE " + " AND ".join(where + slice_where)
+        try:
+            for batch in copy_batches(conn, table, query, block_size):
+                writer.write(encode(batch, target, dictionaries))
+        except BaseException:
+            writer.abort()
+            raise
+        rows += writer.rows
+        written += writer.close()
+    return rows, written
+
+
+def read_manifest(out):
+    path = Path(out) / MANIFEST
+    return json.loads(path.read_text()) if path.exists() else {"tables": {}}
+
+
+def write_manifest(out, manifest):
+    path = Path(out) / MANIFEST
+    temporary = path.with_name(path.name + ".tmp")
+    temporary.write_text(json.dumps(manifest, indent=2, default=str))
+    temporary.replace(path)
+
+
+def export(conn, out, tables, file_format="parquet", date_from=None, date_to=None, incremental=False,
+           block_size=EXPORT_BLOCK):
+    """Export `tables` to `out` in one snapshot. Returns rows of (table, since, rows, files, bytes, seconds)."""
+    out = Path(out)
+    out.mkdir(parents=True, exist_ok=True)
+    manifest = read_manifest(out)
+    report = []
+    with conn.cursor() as cur:
+        watermark = begin_snapshot(cur)
+        dictionaries = read_categories(cur)
+    try:
+        for table in tables:
+            start = time.perf_counter()
+            previous = manifest["tables"].get(table)
+            since = None
+            if incremental and previous is not None and previous["watermark"] is not None \
+                    and previous["format"] == file_format:
+                since = previous["watermark"]
+
+            if since is not None:
+                part = previous["parts"]
+                rows, written = export_table(conn, table, out / table, file_format, part, dictionaries,
+                                             since=since, block_size=block_size)
+            else:
+                # written next to the old files, which it replaces once complete
+                part = 0
+                staging = out / f".{table}.tmp"
+                shutil.rmtree(staging, ignore_errors=True)
+                staging.mkdir()
+                try:
+                    rows, written = export_table(conn, table, staging, file_format, part, dictionaries,
+                                                 date_from, date_to, block_size=block_size)
+                except BaseException:
+                    shutil.rmtree(staging, ignore_errors=True)
+                    raise
+                shutil.rmtree(out / table, ignore_errors=True)
+                staging.rename(out / table)
+                written = [(out / table / path.relative_to(staging), size) for path, size in written]
+
+            manifest["tables"][table] = {
+                "format": file_format,
+                "watermark": watermark if date_from is None and date_to is None else None,
+                "parts": part + 1,
+                "from": date_from,
+                "to": date_to,
+                "exported_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            write_manifest(out, manifest)
+            report.append([table, since if since is not None else "full", rows, len(written),
+                           sum(size for _, size in written), time.perf_counter() - start])
+    finally:
+        conn.rollback()
+    return report
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the datamart to Parquet or Arrow files.")
+    parser.add_argument("out", type=Path, help="directory to write to (one subdirectory per table)")
+    parser.add_argument("--format", choices=list(FORMATS), default="parquet", help="file format")
+    parser.add_argument("--tables", nargs="+", choices=list(schema.TABLES), metavar="TABLE",
+                        help="tables to export (default: every table, or those with months for --from/--to)")
+    parser.add_argument("--from", dest="date_from", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="first day of the exported period")
+    parser.add_argument("--to", dest="date_to", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                        help="end of the exported period, excluded")
+    parser.add_argument("--incremental", action="store_true",
+                        help="export only the rows changed since each table's last export")
+    parser.add_argument("--block-size", type=int, default=EXPORT_BLOCK, help="bytes of COPY output parsed at a time")
+    args = parser.parse_args()
+
+    dated = args.date_from is not None or args.date_to is not None
+    if dated and args.incremental:
+        parser.error("--incremental exports whole tables; it cannot be combined with --from/--to")
+    if args.tables is None:
+        args.tables = [t for t in schema.TABLES if t in MONTH_COLUMNS] if dated else list(schema.TABLES)
+    elif dated and set(args.tables) - set(MONTH_COLUMNS):
+        parser.error(f"--from/--to only apply to {', '.join(MONTH_COLUMNS)}")
+    return args
+
+
+def main():
+    if pa is None:
+        print(" The export needs pyarrow (pip install pyarrow)")
+        return 1
+    args = parse_args()
+    start = time.perf_counter()
+    try:
+        with connection() as conn:
+            report = export(conn, args.out, args.tables, args.format, args.date_from, args.date_to,
+                            args.incremental, args.block_size)
+        print(tabulate([[table, since, rows, files, f"{size / 1e6:.2f}", f"{seconds:.3f}"]
+                        for table, since, rows, files, size, seconds in report],
+                       headers=["table", "since", "rows", "files", "MB", "s"]))
+        print(f" Exported {sum(row[2] for row in report):,} rows to {args.out} "
+              f"in {time.perf_counter() - start:.3f}s")
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,309 @@
+import argparse
+import unicodedata
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+
+# Synthetic raw data at a chosen scale
+#
+# Writes the five raw CSVs with the same columns, ID formats and value ranges
+# as the sample files in raw_data/, multiplied by a scale factor (1 gives the
+# sample sizes: 100 client rows, 120 technicians, 1,200 connections, 3,500
+# bills and 2,500 service orders). The quirks the loader has to clean up are
+# kept at roughly the sample's rates:
+#
+#   - phones in five formats ("913 009 792", "(351) 928945590", "+351922321941", ...)
+#   - status and region values in mixed case ("active", "PORTO")
+#   - comma-separated skill lists, with and without a space after the comma
+#   - clients listed twice (one row per connection) and duplicated bill rows
+#   - client IDs in connections, bills and service orders that are not in clients_raw.csv
+#
+# Every bill and service order takes its client from its connection, and the
+# first connections belong to the clients in clients_raw.csv, so the rows that
+# survive cleaning satisfy every foreign key, including meter_check's
+# references to MTR1000-MTR1019 and T001-T020.
+#
+# Generation is vectorized and seeded: the same scale and seed always give the
+# same files.
+
+# Row counts at scale 1, taken from the sample files
+BASE_ROWS = {
+    "client_ids": 600,        # size of the client ID space (C000-C599)
+    "clients": 86,            # distinct clients in clients_raw.csv
+    "client_duplicates": 14,  # extra rows for clients with a second connection
+    "technicians": 120,
+    "connections": 1200,
+    "bills": 3500,
+    "service_orders": 2500,
+}
+
+BILL_DUPLICATE_RATE = 0.005
+MIXED_CASE_RATE = 0.05
+
+PERIOD_START = np.datetime64("2024-10-27")
+INSTALL_START = np.datetime64("2022-01-01")
+
+FIRST_NAMES = [
+    "Ana", "Andreia", "Beatriz", "Camila", "Carlos", "Daniel", "Denis", "Diogo", "Francisca", "Gabriela",
+    "Henrique", "Iara", "Inês", "Isabela", "Ismael", "Ivan", "João", "Leonor", "Letícia", "Luana",
+    "Lúcia", "Manuel", "Mariana", "Miguel", "Noa", "Nuno", "Pedro", "Rafael", "Rita", "Sandro",
+    "Sofia", "Tatiana", "Tomás", "Vasco",
+]
+LAST_NAMES = [
+    "Almeida", "Alves", "Amaral", "Araújo", "Baptista", "Campos", "Castro", "Cruz", "Faria", "Fernandes",
+    "Fonseca", "Garcia", "Guerreiro", "Jesus", "Lima", "Macedo", "Machado", "Melo", "Nunes", "Pacheco",
+    "Pinheiro", "Pinto", "Pires", "Ramos", "Reis", "Rodrigues", "Simões", "Soares", "Teixeira", "Tomé",
+]
+TOWNS = [
+    "Abrantes", "Almeirim", "Chaves", "Elvas", "Fiães", "Freamunde", "Lourosa", "Montijo", "Pinhel",
+    "Póvoa de Santa Iria", "Queluz", "Rio Tinto", "Vila Nova de Santo André", "Vizela", "Reguengos de Monsaraz",
+]
+STREETS = ["Rua", "R.", "Av", "Avenida", "Alameda", "Travessa", "Largo"]
+EMAIL_DOMAINS = ["example.org", "example.net", "example.com"]
+
+REGIONS = ["Porto", "Coimbra", "Lisboa", "Faro"]
+STATUSES = ["Active", "Suspended", "Disconnected"]
+CONNECTION_TYPES = ["Single-phase", "Three-phase"]
+SKILLS = ["Installation", "Repair", "Inspection", "Meter Replacement", "Connection Setup"]
+SERVICE_NOTES = {
+    "Disconnection": ["Disconnection request fulfilled", "Disconnection requested by client",
+                      "Equipment powered down for maintenance", "Temporary connection removed"],
+    "Inspection": ["Underground cable inspection completed", "Inspection revealed faulty wiring",
+                   "Continuity test completed", "Electrical safety check completed"],
+    "Installation": ["Partial installation completed, pending approval", "Installation completed successfully",
+                     "Temporary connection installed for testing", "Main switch installed"],
+    "Maintenance": ["Protection equipment updated", "Maintenance visit completed",
+                    "Routine maintenance performed", "Meter firmware updated"],
+    "Repair": ["Intermittent fault fixed", "Circuit breaker fault corrected",
+               "Damaged cables replaced", "Repair of connection after outage"],
+}
+
+
+def scaled(name, scale):
+    return max(1, round(BASE_ROWS[name] * scale))
+
+
+def ids(prefix, numbers, width):
+    """IDs such as C040 or B0001: `numbers` zero-padded to at least `width` digits."""
+    return prefix + pd.Series(numbers).astype(str).str.zfill(width)
+
+
+def pick(rng, values, n):
+    return pd.Series(np.asarray(values, dtype=object)[rng.integers(0, len(values), n)])
+
+
+def dates(start, offsets):
+    return pd.Series(np.datetime_as_string(start + np.asarray(offsets).astype("timedelta64[D]"), unit="D"))
+
+
+def ascii_lower(words):
+    return [unicodedata.normalize("NFKD", w).encode("ascii", "ignore").decode().lower() for w in words]
+
+
+def names(rng, n):
+    """Full names, about one in ten with a double-barrelled surname."""
+    first = rng.integers(0, len(FIRST_NAMES), n)
+    last = rng.integers(0, len(LAST_NAMES), n)
+    full = pd.Series(np.array(FIRST_NAMES, dtype=object)[first]) + " " + np.array(LAST_NAMES, dtype=object)[last]
+    double = rng.random(n) < 0.1
+    full[double] += "-" + pick(rng, LAST_NAMES, double.sum()).to_numpy()
+    return full, first, last
+
+
+def emails(rng, first, last, serial):
+    """Unique e-mail addresses (the serial number keeps them unique, Person.email is UNIQUE)."""
+    first_ascii = np.array(ascii_lower(FIRST_NAMES), dtype=object)[first]
+    last_ascii = np.array(ascii_lower(LAST_NAMES), dtype=object)[last]
+    return (pd.Series(last_ascii) + first_ascii + pd.Series(serial).astype(str)
+            + "@" + pick(rng, EMAIL_DOMAINS, len(serial)).to_numpy())
+
+
+def phones(rng, numbers):
+    """Format 9-digit phone numbers the five ways they appear in the raw files."""
+    digits = pd.Series(numbers).astype(str)
+    spaced = digits.str[:3] + " " + digits.str[3:6] + " " + digits.str[6:]
+    formats = rng.integers(0, 5, len(digits))
+    return pd.Series(np.select(
+        [formats == 0, formats == 1, formats == 2, formats == 3],
+        [digits, spaced, "(351) " + digits, "(351) " + spaced],
+        "+351" + digits,
+    ), dtype=object)
+
+
+def addresses(rng, n):
+    street = pick(rng, STREETS, n) + " " + pick(rng, ["", "de ", "dos "], n) + pick(rng, LAST_NAMES, n).to_numpy()
+    postcode = (pd.Series(rng.integers(1000, 10000, n)).astype(str) + "-"
+                + pd.Series(rng.integers(0, 1000, n)).astype(str).str.zfill(3))
+    return (street + ", " + pd.Series(rng.integers(1, 700, n)).astype(str) + ", "
+            + postcode + " " + pick(rng, TOWNS, n).to_numpy())
+
+
+def mixed_case(rng, values):
+    """Lower- or upper-case a small share of the values, as some raw exports do."""
+    values = values.copy()
+    lower = rng.random(len(values)) < MIXED_CASE_RATE / 2
+    upper = rng.random(len(values)) < MIXED_CASE_RATE / 2
+    values[lower] = values[lower].str.lower()
+    values[upper] = values[upper].str.upper()
+    return values
+
+
+def skill_lists(rng, n):
+    """One to three distinct skills per technician, comma-separated."""
+    order = np.argsort(rng.random((n, len(SKILLS))), axis=1)
+    counts = rng.choice([1, 1, 2, 3], n)
+    skills = np.array(SKILLS, dtype=object)[order]
+    separator = pick(rng, [", ", ", ", ","], n)
+    lists = pd.Series(skills[:, 0])
+    for k in (1, 2):
+        more = counts > k
+        lists[more] += separator[more] + skills[more, k]
+    return lists
+
+
+def generate(scale, out_dir, seed=0):
+    """Write the five raw CSVs for `scale` into `out_dir`. Returns {file name: row count}."""
+    rng = np.random.default_rng(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    n_ids = scaled("client_ids", scale)
+    n_clients = min(scaled("clients", scale), n_ids)
+    n_client_rows = n_clients + scaled("client_duplicates", scale)
+    n_techs = scaled("technicians", scale)
+    n_connections = max(scaled("connections", scale), n_client_rows, 20)
+
+    # People: every ID in the client ID space has one identity, so a client's
+    # name is the same in every file. Phone numbers are unique across clients
+    # and technicians (Person.phone is UNIQUE).
+    phone_numbers = rng.choice(200_000_000, n_ids + n_techs, replace=False)
+    phone_numbers = np.where(phone_numbers < 100_000_000, 200_000_000, 800_000_000) + phone_numbers
+    person_name, first, last = names(rng, n_ids + n_techs)
+    person_email = emails(rng, first, last, np.arange(n_ids + n_techs))
+    person_phone = phones(rng, phone_numbers)
+
+    client_ids = ids("C", np.arange(n_ids), 3)
+    client_name = person_name[:n_ids].reset_index(drop=True)
+    client_address = addresses(rng, n_ids)
+
+    # Technicians
+    tech_ids = ids("T", np.arange(1, n_techs + 1), 3)
+    tech_names = person_name[n_ids:].reset_index(drop=True)
+    tech_region = pick(rng, REGIONS, n_techs)
+    technicians = pd.DataFrame({
+        "technician_id": tech_ids,
+        "technician_name": tech_names,
+        "email": person_email[n_ids:].to_numpy(),
+        "phone": person_phone[n_ids:].to_numpy(),
+        "center": tech_region + " Center",
+        "region": mixed_case(rng, tech_region),
+        "skills": skill_lists(rng, n_techs),
+    })
+
+    # Clients: one row per (client, connection); some clients appear twice
+    listed = rng.choice(n_ids, n_clients, replace=False)
+    rows = np.concatenate([listed, rng.choice(listed, n_client_rows - n_clients)])
+    rng.shuffle(rows)
+    property_address = addresses(rng, n_connections)
+    connection_status = pick(rng, STATUSES, n_connections)
+    clients = pd.DataFrame({
+        "client_id": client_ids[rows].to_numpy(),
+        "client_name": client_name[rows].to_numpy(),
+        "email": person_email[rows].to_numpy(),
+        "phone": person_phone[rows].to_numpy(),
+        "address": client_address[rows].to_numpy(),
+        "property_address": property_address[:n_client_rows].to_numpy(),
+        "connection_id": ids("CN", np.arange(1000, 1000 + n_client_rows), 4).to_numpy(),
+        "status": mixed_case(rng, connection_status[:n_client_rows]).to_numpy(),
+    })
+
+    # Connections: the first ones belong to the listed clients, the rest to any
+    # ID in the client ID space, most of which are not in clients_raw.csv
+    owner = np.concatenate([rows, rng.integers(0, n_ids, n_connections - n_client_rows)])
+    installer = rng.integers(0, n_techs, n_connections)
+    connections = pd.DataFrame({
+        "connection_id": ids("CN", np.arange(1000, 1000 + n_connections), 4),
+        "client_id": client_ids[owner].to_numpy(),
+        "client_name": client_name[owner].to_numpy(),
+        "property_address": property_address,
+        "city": pick(rng, TOWNS, n_connections),
+        "connection_type": pick(rng, CONNECTION_TYPES, n_connections),
+        "install_date": dates(INSTALL_START, rng.integers(0, 1275, n_connections)),
+        "meter_serial": ids("MTR", np.arange(1000, 1000 + n_connections), 4),
+        "status": mixed_case(rng, connection_status),
+        "technician_id": tech_ids[installer].to_numpy(),
+        "technician_name": tech_names[installer].to_numpy(),
+    })
+
+    # Bills: monthly periods, billed two days after the period ends
+    n_bills = scaled("bills", scale)
+    billed = rng.integers(0, n_connections, n_bills)
+    start = rng.integers(0, 365, n_bills)
+    kwh = rng.integers(80, 1201, n_bills)
+    rate = np.clip(np.exp(rng.normal(np.log(0.18), 0.8, n_bills)), 0.0175, 2.45)
+    bills = pd.DataFrame({
+        "bill_id": ids("B", np.arange(1, n_bills + 1), 4),
+        "connection_id": connections["connection_id"].to_numpy()[billed],
+        "client_id": connections["client_id"].to_numpy()[billed],
+        "client_name": connections["client_name"].to_numpy()[billed],
+        "period_start": dates(PERIOD_START, start),
+        "period_end": dates(PERIOD_START, start + 30),
+        "kwh_used": kwh,
+        "amount": np.round(kwh * rate, 2),
+        "issue_date": dates(PERIOD_START, start + 32),
+        "payment_date": dates(PERIOD_START, start + 32 + rng.integers(5, 21, n_bills)),
+    })
+    repeated = rng.choice(n_bills, int(n_bills * BILL_DUPLICATE_RATE))
+    bills = pd.concat([bills, bills.iloc[repeated]]).sort_index(kind="stable")
+
+    # Service orders
+    n_orders = scaled("service_orders", scale)
+    served = rng.integers(0, n_connections, n_orders)
+    worker = rng.integers(0, n_techs, n_orders)
+    service_type = pick(rng, list(SERVICE_NOTES), n_orders)
+    notes = pd.Series(index=service_type.index, dtype=object)
+    for kind, options in SERVICE_NOTES.items():
+        of_kind = service_type == kind
+        notes[of_kind] = pick(rng, options, of_kind.sum()).to_numpy()
+    start = rng.integers(0, 365, n_orders)
+    service_orders = pd.DataFrame({
+        "service_order_id": ids("SO", np.arange(1, n_orders + 1), 4),
+        "connection_id": connections["connection_id"].to_numpy()[served],
+        "client_id": connections["client_id"].to_numpy()[served],
+        "client_name": connections["client_name"].to_numpy()[served],
+        "technician_id": tech_ids[worker].to_numpy(),
+        "technician_name": tech_names[worker].to_numpy(),
+        "service_type": service_type,
+        "start_date": dates(PERIOD_START, start),
+        "end_date": dates(PERIOD_START, start + rng.integers(0, 60, n_orders)),
+        "notes": notes,
+    })
+
+    files = {
+        "clients_raw.csv": clients,
+        "technicians_raw.csv": technicians,
+        "connections_raw.csv": connections,
+        "bills_raw.csv": bills,
+        "service_orders_raw.csv": service_orders,
+    }
+    for file, df in files.items():
+        df.to_csv(out_dir / file, index=False)
+    return {file: len(df) for file, df in files.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic electrogrid raw CSVs at a chosen scale.")
+    parser.add_argument("--scale", type=float, default=1, help="multiple of the sample sizes (1, 10, 100, 1000, ...)")
+    parser.add_argument("--out", type=Path, default=None, help="output directory (default ./raw_data_<scale>x)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    out_dir = args.out or Path(f"./raw_data_{args.scale:g}x")
+    for file, rows in generate(args.scale, out_dir, args.seed).items():
+        print(f" Wrote {out_dir / file}: {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
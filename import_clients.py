@@ -0,0 +1,202 @@
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+import psycopg2
+from tabulate import tabulate
+
+from cleaning import column, convert
+from db import close_pool, connection
+from electrogrid import insert_clients
+
+
+# Bulk import of new clients from a CSV or JSON Lines file
+#
+#   python import_clients.py partner_clients.csv --rejects rejects.csv
+#
+# The file needs name, email, phone and address columns or keys (client_name
+# is accepted for name, as in clients_raw.csv); other columns are ignored.
+# Every value is normalized as the loader normalizes clients_raw.csv
+# (cleaning.py): text is stripped, empty values count as missing, and phones
+# keep their last 9 digits. All of it is done column by column for the whole
+# file at once.
+#
+# A row is rejected, with its reason, when
+#   - it has no name or no address (both are required by the schema),
+#   - its email or phone appears on an earlier row of the file, or
+#   - its email or phone already belongs to someone in the database
+#     (checked for all rows in one query per column).
+#
+# The remaining rows are inserted in batches of BATCH_SIZE, --jobs batches at
+# a time, each on its own pooled connection and in its own transaction,
+# through the same statement as the menu's insert (electrogrid.INSERT_CLIENTS):
+# each batch takes its block of client IDs from client_id_seq as it inserts.
+# If someone else takes an email or phone while the import runs, the batch
+# rolls back, its conflicting rows are rejected and the rest is retried.
+
+BATCH_SIZE = 5000
+JOBS = 4
+
+COLUMNS = {
+    "name": column("name", "text"),
+    "email": column("email", "text"),
+    "phone": column("phone", "phone"),
+    "address": column("address", "text"),
+}
+REQUIRED = ["name", "address"]
+UNIQUE = ["email", "phone"]
+ALIASES = {"client_name": "name"}
+
+# Values of a column that are already taken, from a list of candidates
+TAKEN = {
+    "email": """
+        SELECT p.email FROM electrogrid.person AS p
+        JOIN unnest(%s::TEXT[]) AS c(email) ON p.email = c.email;
+    """,
+    "phone": """
+        SELECT p.phone FROM electrogrid.person AS p
+        JOIN unnest(%s::BIGINT[]) AS c(phone) ON p.phone = c.phone;
+    """,
+}
+
+
+#---------------------------------- Validation --------------------------------------------#
+
+def read_clients(path):
+    """The raw rows of a .csv or .jsonl file, every value as text."""
+    path = Path(path)
+    if path.suffix.lower() in (".jsonl", ".ndjson", ".json"):
+        raw = pd.read_json(path, lines=True, dtype=str)
+    else:
+        raw = pd.read_csv(path, dtype=str, keep_default_na=False)
+    raw = raw.rename(columns=ALIASES)
+    missing = [name for name in COLUMNS if name not in raw.columns]
+    if missing:
+        raise ValueError(f"{path} has no {', '.join(missing)} column")
+    # rows are numbered as in the file: the first data row is row 1
+    raw.index = pd.RangeIndex(1, len(raw) + 1, name="row")
+    return raw
+
+
+def normalize(raw):
+    """The rows normalized like the loader's client_person and client tables, phones as integers."""
+    clients = pd.DataFrame({name: convert(raw[spec["source"]], spec) for name, spec in COLUMNS.items()})
+    clients["phone"] = pd.to_numeric(clients["phone"]).astype("Int64")
+    return clients
+
+
+def reject(reasons, mask, reason):
+    """Record `reason` for the rows of `mask` that have no reason yet."""
+    reasons[mask & reasons.isna()] = reason
+
+
+def validate(cur, clients):
+    """Reason each row is rejected (missing for the rows to insert), for all rows at once."""
+    reasons = pd.Series(pd.NA, index=clients.index, dtype="string")
+    for name in REQUIRED:
+        reject(reasons, clients[name].isna(), f"missing {name}")
+    for name in UNIQUE:
+        # the first row that passed the checks so far keeps the value
+        candidates = clients.loc[reasons.isna(), name].dropna()
+        repeated = candidates.index[candidates.duplicated(keep="first")]
+        reasons[repeated] = f"{name} repeated in the file"
+        taken = taken_values(cur, name, candidates.unique().tolist())
+        reject(reasons, clients[name].isin(taken), f"{name} already in the database")
+    return reasons
+
+
+def taken_values(cur, name, candidates):
+    if not candidates:
+        return []
+    cur.execute(TAKEN[name], ([int(v) for v in candidates] if name == "phone" else candidates,))
+    return [row[0] for row in cur.fetchall()]
+
+
+#---------------------------------- Import --------------------------------------------#
+
+def import_batch(batch):
+    """Insert one batch of clients. Returns (new IDs by row, reasons for the rows rejected on the way)."""
+    rejected = {}
+    with connection() as conn:
+        while len(batch):
+            rows = list(zip(batch["name"], batch["email"].astype(object).where(batch["email"].notna(), None),
+                            batch["phone"].astype(object).where(batch["phone"].notna(), None), batch["address"]))
+            try:
+                return dict(zip(batch.index, insert_clients(rows, conn))), rejected
+            except psycopg2.errors.UniqueViolation:
+                # taken by someone else since validation: reject those rows and insert the rest
+                with conn.cursor() as cur:
+                    reasons = validate(cur, batch)
+                conn.rollback()
+                if reasons.isna().all():
+                    raise
+                rejected.update(reasons.dropna().to_dict())
+                batch = batch[reasons.isna()]
+    return {}, rejected
+
+
+def import_clients(clients, reasons, batch_size=BATCH_SIZE, jobs=JOBS):
+    """Insert the rows without a reason in parallel batches. Returns {row: new client ID}; updates `reasons`."""
+    accepted = clients[reasons.isna()]
+    batches = [accepted.iloc[i:i + batch_size] for i in range(0, len(accepted), batch_size)]
+    new_ids = {}
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for ids, rejected in pool.map(import_batch, batches):
+            new_ids.update(ids)
+            for row, reason in rejected.items():
+                reasons[row] = reason
+    return new_ids
+
+
+def report(raw, reasons, rejects_path):
+    rejected = reasons.dropna()
+    if rejected.empty:
+        return
+    counts = rejected.value_counts()
+    print(tabulate(counts.items(), headers=["reason", "rows"]))
+    if rejects_path is not None:
+        out = raw.loc[rejected.index].assign(reason=rejected)
+        out.to_csv(rejects_path)
+        print(f" Rejected rows written to {rejects_path}")
+    else:
+        print(tabulate(rejected.head(10).items(), headers=["row", "reason"]))
+        if len(rejected) > 10:
+            print(f" ... and {len(rejected) - 10} more (write them all with --rejects)")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import new clients from a CSV or JSON Lines file.")
+    parser.add_argument("path", help="client file (.csv, or .jsonl with one client object per line)")
+    parser.add_argument("--rejects", metavar="CSV", help="write the rejected rows and their reasons to this file")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="clients per insert transaction")
+    parser.add_argument("--jobs", type=int, default=JOBS, help="batches inserted at the same time")
+    parser.add_argument("--check", action="store_true", help="validate only, insert nothing")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    raw = read_clients(args.path)
+    clients = normalize(raw)
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            reasons = validate(cur, clients)
+        print(f" Read and validated {len(raw):,} rows in {time.perf_counter() - start:.3f}s: "
+              f"{int(reasons.isna().sum()):,} to insert, {int(reasons.notna().sum()):,} rejected")
+
+        if not args.check:
+            start = time.perf_counter()
+            new_ids = import_clients(clients, reasons, args.batch_size, args.jobs)
+            print(f" Imported {len(new_ids):,} clients in {time.perf_counter() - start:.3f}s")
+        report(raw, reasons, args.rejects)
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
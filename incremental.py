@@ -0,0 +1,181 @@
+import io
+import time
+
+import pandas as pd
+
+from copy_load import copy_dataframe
+from schema import TABLES
+
+
+# Incremental (delta) loading
+#
+# Instead of clearing every table and reinserting everything, the cleaned
+# DataFrames are compared with what is already in the database:
+#
+#   * every row gets a content hash, and the hash of each loaded row is kept
+#     in <schema>.load_state, keyed by table and primary key;
+#   * rows whose key is new or whose hash changed are upserted with
+#     INSERT ... ON CONFLICT;
+#   * keys that are in the table but no longer in the CSVs are deleted.
+#
+# The keys and hashes of the incoming rows are copied into a temporary table
+# and compared with load_state and the table in the database, so only the
+# keys of changed, new and deleted rows come back and only changed rows are
+# written: the work in Python and on the wire follows the size of the
+# change, not of the table. (Finding the deleted keys is still an anti-join
+# over the table's keys, on the server.)
+
+KEY_SEPARATOR = "\x1f"
+
+
+def ensure_state_table(cur, schema):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema}.load_state (
+            table_name VARCHAR(50),
+            row_key TEXT,
+            row_hash BIGINT NOT NULL,
+            PRIMARY KEY (table_name, row_key)
+        );
+    """)
+
+
+def reset_state(cur, schema):
+    """Forget all stored hashes, e.g. after a full reload."""
+    ensure_state_table(cur, schema)
+    cur.execute(f"DELETE FROM {schema}.load_state;")
+
+
+def key_text(series):
+    """A key column as text, with dates written as PostgreSQL writes them (2025-03-01)."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series.dt.strftime("%Y-%m-%d")
+    return series.astype(str)
+
+
+def row_keys(df, key_columns):
+    """Primary key of every row as one string (composite keys are joined)."""
+    keys = key_text(df[key_columns[0]])
+    if len(key_columns) > 1:
+        keys = keys.str.cat([key_text(df[c]) for c in key_columns[1:]], sep=KEY_SEPARATOR)
+    return keys.reset_index(drop=True)
+
+
+def row_hashes(df):
+    """64-bit content hash of every row, as signed integers so they fit in BIGINT."""
+    return pd.Series(pd.util.hash_pandas_object(df, index=False).to_numpy().view("int64"))
+
+
+def read_query(cur, query):
+    """Run a SELECT through COPY ... TO STDOUT and return it as a DataFrame of strings."""
+    buffer = io.StringIO()
+    cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER)", buffer)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=str, keep_default_na=False)
+
+
+def compute_delta(cur, schema, table, df):
+    """Return (rows to upsert, number of them that are new, keys to delete, hashes) for one table."""
+    key_columns = TABLES[table]["primary_key"]
+    df = df.reset_index(drop=True)
+    keys = row_keys(df, key_columns)
+    hashes = row_hashes(df)
+
+    incoming = f"incoming_{table}"
+    cur.execute(f"CREATE TEMP TABLE {incoming} ON COMMIT DROP AS "
+                f"SELECT {', '.join(key_columns)} FROM {schema}.{table} WITH NO DATA;")
+    cur.execute(f"ALTER TABLE {incoming} ADD COLUMN row_key TEXT, ADD COLUMN row_hash BIGINT;")
+    copy_dataframe(cur, incoming, pd.concat([df[key_columns], pd.DataFrame({"row_key": keys, "row_hash": hashes})],
+                                            axis=1))
+    cur.execute(f"ANALYZE {incoming};")
+
+    match = " AND ".join(f"t.{c} = i.{c}" for c in key_columns)
+    # new rows, and rows whose hash changed or was never stored
+    changed_keys = read_query(cur, cur.mogrify(f"""
+        SELECT i.row_key, t.{key_columns[0]} IS NOT NULL AS in_table
+        FROM {incoming} AS i
+        LEFT JOIN {schema}.load_state AS s ON s.table_name = %s AND s.row_key = i.row_key
+        LEFT JOIN {schema}.{table} AS t ON {match}
+        WHERE t.{key_columns[0]} IS NULL OR s.row_hash IS DISTINCT FROM i.row_hash
+    """, (table,)).decode())
+    deleted = read_query(cur, f"""
+        SELECT {', '.join(f't.{c}' for c in key_columns)} FROM {schema}.{table} AS t
+        WHERE NOT EXISTS (SELECT 1 FROM {incoming} AS i WHERE {match})
+    """)
+
+    changed = keys.isin(set(changed_keys["row_key"]))
+    return df[changed], int((changed_keys["in_table"] == "f").sum()), deleted, pd.DataFrame({
+        "row_key": keys[changed], "row_hash": hashes[changed]
+    })
+
+
+def upsert(cur, schema, table, df):
+    """COPY the rows into a temporary table, then merge them with INSERT ... ON CONFLICT."""
+    key_columns = TABLES[table]["primary_key"]
+    columns = list(df.columns)
+    updates = [c for c in columns if c not in key_columns]
+    staging = f"delta_{table}"
+
+    cur.execute(f"CREATE TEMP TABLE {staging} (LIKE {schema}.{table}) ON COMMIT DROP;")
+    copy_dataframe(cur, staging, df)
+
+    if updates:
+        action = "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in updates)
+    else:
+        action = "DO NOTHING"
+    cur.execute(f"""
+        INSERT INTO {schema}.{table} ({', '.join(columns)})
+        SELECT {', '.join(columns)} FROM {staging}
+        ON CONFLICT ({', '.join(key_columns)}) {action};
+    """)
+
+
+def delete_keys(cur, schema, table, keys):
+    """Delete the rows whose primary key is in `keys` (a DataFrame of key columns)."""
+    key_columns = list(keys.columns)
+    staging = f"gone_{table}"
+
+    cur.execute(f"CREATE TEMP TABLE {staging} ON COMMIT DROP AS "
+                f"SELECT {', '.join(key_columns)} FROM {schema}.{table} WITH NO DATA;")
+    copy_dataframe(cur, staging, keys)
+    match = " AND ".join(f"t.{c} = g.{c}" for c in key_columns)
+    cur.execute(f"DELETE FROM {schema}.{table} AS t USING {staging} AS g WHERE {match};")
+
+
+def save_state(cur, schema, table, state, deleted_keys):
+    cur.execute(f"CREATE TEMP TABLE state_{table} (row_key TEXT, row_hash BIGINT) ON COMMIT DROP;")
+    copy_dataframe(cur, f"state_{table}", state)
+    cur.execute(f"""
+        INSERT INTO {schema}.load_state (table_name, row_key, row_hash)
+        SELECT %s, row_key, row_hash FROM state_{table}
+        ON CONFLICT (table_name, row_key) DO UPDATE SET row_hash = EXCLUDED.row_hash;
+    """, (table,))
+    if deleted_keys:
+        cur.execute(f"DELETE FROM {schema}.load_state WHERE table_name = %s AND row_key = ANY(%s);",
+                    (table, deleted_keys))
+
+
+def apply_delta(cur, schema, load_order):
+    """Bring every table in `load_order` ([(table, df), ...] in FK order) in line with its DataFrame.
+
+    Runs on the caller's transaction; nothing is committed here.
+    """
+    ensure_state_table(cur, schema)
+
+    deltas = []
+    for table, df in load_order:
+        deltas.append((table, *compute_delta(cur, schema, table, df)))
+
+    # Deletes run children first, upserts parents first
+    for table, changed, inserted, deleted, state in reversed(deltas):
+        if len(deleted):
+            delete_keys(cur, schema, table, deleted)
+
+    for table, changed, inserted, deleted, state in deltas:
+        start = time.perf_counter()
+        if len(changed):
+            upsert(cur, schema, table, changed)
+        save_state(cur, schema, table, state,
+                   list(row_keys(deleted, TABLES[table]["primary_key"])) if len(deleted) else [])
+        elapsed = time.perf_counter() - start
+        print(f" {table}: {inserted} inserted, {len(changed) - inserted} updated, "
+              f"{len(deleted)} deleted ({elapsed:.3f}s)")
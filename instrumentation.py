@@ -0,0 +1,502 @@
+import argparse
+import atexit
+import bisect
+import ctypes
+import importlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.request import urlopen
+
+from psycopg2 import extensions
+from tabulate import tabulate
+
+
+# Query instrumentation: latency histograms per statement and a slow-query log
+#
+# Connections made with cursor_factory=InstrumentedCursor (the pool in db.py,
+# load_electrogrid.connect), and the service's psycopg 3 connections
+# (service.InstrumentedAsyncCursor), time every execute, executemany and COPY
+# and record, per normalized statement (literals and placeholders replaced by ?,
+# VALUES lists folded to one row):
+#
+#   calls, errors, total/min/max time and a latency histogram (p50/p95/p99)
+#   rows returned or affected
+#   bytes out: the statement text sent, or the data sent by COPY FROM
+#   bytes in: the memory libpq holds for the result (at least about 3 KB), or
+#             the data received by COPY TO
+#
+# The histogram has fixed buckets growing by 2^(1/4) (19%) from 10 us, so a
+# percentile is exact to within one bucket and recording is one bisect.
+#
+# A statement slower than ELECTROGRID_SLOW_QUERY_MS goes into the slow-query
+# log (the last SLOW_LOG_SIZE in memory, and every one appended as a JSON line
+# to ELECTROGRID_SLOW_LOG if set) with its text and its plan. A read (SELECT,
+# VALUES, TABLE, or WITH without a data-modifying part or a sequence call) is
+# captured with EXPLAIN (ANALYZE, BUFFERS), which runs it a second time inside
+# a savepoint (or BEGIN in autocommit) that is rolled back; this doubles the
+# cost of the slow reads only, and is off unless the threshold is set. Writes
+# and EXECUTE get a plain EXPLAIN, without actual times, since running them
+# again would fire their triggers and consume sequence values.
+#
+# The metrics are exposed as JSON:
+#   - ELECTROGRID_METRICS_PORT serves GET /metrics (?format=text for a table)
+#     from a background thread of electrogrid.py or load_electrogrid.py;
+#     service.py serves the same JSON on its own port
+#   - ELECTROGRID_METRICS_FILE is written when the process exits
+#   - load_electrogrid.py --metrics-json PATH writes them after the load
+#
+#   python instrumentation.py metrics.json             statements by total time
+#   python instrumentation.py http://127.0.0.1:9464/metrics --slow
+
+INSTRUMENT = os.environ.get("ELECTROGRID_INSTRUMENT", "1") != "0"
+SLOW_QUERY_MS = float(os.environ["ELECTROGRID_SLOW_QUERY_MS"]) if os.environ.get("ELECTROGRID_SLOW_QUERY_MS") else None
+SLOW_LOG = os.environ.get("ELECTROGRID_SLOW_LOG")
+METRICS_PORT = int(os.environ["ELECTROGRID_METRICS_PORT"]) if os.environ.get("ELECTROGRID_METRICS_PORT") else None
+METRICS_HOST = os.environ.get("ELECTROGRID_METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.environ.get("ELECTROGRID_METRICS_FILE")
+
+SLOW_LOG_SIZE = 100
+# Distinct statements kept; any further ones are counted together as OTHER
+MAX_STATEMENTS = 2000
+OTHER = "(other statements)"
+# Longest query text kept in the slow-query log
+MAX_QUERY_TEXT = 4000
+
+# Upper bounds of the latency buckets, in seconds (10 us to about 170 s)
+BUCKET_BOUNDS = [1e-5 * 2 ** (i / 4) for i in range(97)]
+PERCENTILES = [0.5, 0.95, 0.99]
+
+# Statements EXPLAIN accepts, and those of them that may run again under EXPLAIN ANALYZE
+EXPLAINABLE = {"select", "with", "insert", "update", "delete", "merge", "values", "table", "execute"}
+READ_ONLY = {"select", "with", "values", "table"}
+# A statement that writes, in a WITH or through a sequence, is only EXPLAINed
+WRITES = re.compile(r"\b(?:insert|update|delete|merge|nextval|setval)\b", re.IGNORECASE)
+
+
+#---------------------------------- Metrics --------------------------------------------#
+
+class LatencyHistogram:
+    """Counts of latencies in BUCKET_BOUNDS buckets (the last one is unbounded)."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    def percentile(self, q, largest=None):
+        """Upper bound of the bucket holding the q-th latency (at most `largest`, the largest seen)."""
+        total = sum(self.counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = BUCKET_BOUNDS[i] if i < len(BUCKET_BOUNDS) else float("inf")
+                return min(bound, largest) if largest is not None else bound
+        return largest
+
+
+class StatementStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.rows = 0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.histogram = LatencyHistogram()
+
+    def record(self, seconds, rows, bytes_out, bytes_in, error):
+        self.calls += 1
+        self.errors += error
+        self.seconds += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.rows += rows
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+        self.histogram.record(seconds)
+
+    def to_dict(self, statement):
+        ms = {f"p{round(q * 100)}_ms": self.histogram.percentile(q, self.max) * 1e3 for q in PERCENTILES}
+        return {
+            "statement": statement, "calls": self.calls, "errors": self.errors,
+            "total_ms": self.seconds * 1e3, "mean_ms": self.seconds / self.calls * 1e3,
+            "min_ms": self.min * 1e3, **ms, "max_ms": self.max * 1e3,
+            "rows": self.rows, "bytes_out": self.bytes_out, "bytes_in": self.bytes_in,
+            "buckets": {f"{BUCKET_BOUNDS[i] * 1e3:.4g}" if i < len(BUCKET_BOUNDS) else "inf": count
+                        for i, count in enumerate(self.histogram.counts) if count},
+        }
+
+
+class Metrics:
+    """Thread-safe statistics per normalized statement and the slow-query log of a process."""
+
+    def __init__(self, slow_log_size=SLOW_LOG_SIZE):
+        self.lock = threading.Lock()
+        self.statements = {}
+        self.slow = deque(maxlen=slow_log_size)
+        self.started_at = datetime.now(timezone.utc)
+
+    def record(self, statement, seconds, rows=0, bytes_out=0, bytes_in=0, error=False):
+        with self.lock:
+            stats = self.statements.get(statement)
+            if stats is None:
+                if len(self.statements) >= MAX_STATEMENTS:
+                    statement = OTHER
+                stats = self.statements.setdefault(statement, StatementStats())
+            stats.record(seconds, rows, bytes_out, bytes_in, error)
+
+    def record_slow(self, entry):
+        with self.lock:
+            self.slow.append(entry)
+        if SLOW_LOG:
+            with open(SLOW_LOG, "a") as f:
+                f.write(json.dumps(entry) + "\n")
+
+    def snapshot(self):
+        """Every statement's statistics, by total time, and the slow-query log, as JSON-ready data."""
+        with self.lock:
+            statements = [stats.to_dict(statement) for statement, stats in self.statements.items()]
+            slow = list(self.slow)
+        statements.sort(key=lambda s: s["total_ms"], reverse=True)
+        return {"pid": os.getpid(), "started_at": self.started_at.isoformat(),
+                "taken_at": datetime.now(timezone.utc).isoformat(), "statements": statements, "slow": slow}
+
+    def reset(self):
+        with self.lock:
+            self.statements.clear()
+            self.slow.clear()
+            self.started_at = datetime.now(timezone.utc)
+
+
+METRICS = Metrics()
+
+
+#---------------------------------- Normalization --------------------------------------------#
+
+# One value of a list: a placeholder or literal already replaced by ?, NULL or a boolean, maybe cast
+_VALUE = r"(?:\?|NULL|TRUE|FALSE)(?:\s*::\s*\w+(?:\[\])?)?"
+
+NORMALIZE = [
+    (re.compile(r"--[^\n]*"), " "),                                          # comments
+    (re.compile(r"\s+"), " "),
+    (re.compile(r"[Ee]?'(?:[^']|'')*'"), "?"),                               # string literals
+    (re.compile(r"%\(\w+\)s|%s|\$\d+"), "?"),                                # placeholders
+    (re.compile(r"(?<![\w.$])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"), "?"),    # numbers, not in names
+    (re.compile(rf"\(\s*{_VALUE}(?:\s*,\s*{_VALUE})*\s*\)", re.IGNORECASE), "(?)"),   # value lists
+    (re.compile(rf"ARRAY\[\s*{_VALUE}(?:\s*,\s*{_VALUE})*\s*\]", re.IGNORECASE), "ARRAY[?]"),
+    (re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+"), r"\1"),                       # VALUES rows, any number
+]
+
+# Normalized texts of short statements are cached; long ones (a page of
+# execute_values) are mostly unique, and caching them would only hold memory
+CACHE_MAX_LENGTH = 4096
+
+# A long INSERT ... VALUES is keyed by the text around its rows, which all
+# fold to (?): the start up to VALUES and an ON CONFLICT or RETURNING clause
+# at the end. The rows themselves (100 KB for a page) are never scanned.
+VALUES_ROWS = re.compile(r"\bVALUES\s*\(", re.IGNORECASE)
+AFTER_ROWS = re.compile(r"\)\s*((?:ON\s+CONFLICT|RETURNING)\b.*)", re.IGNORECASE | re.DOTALL)
+
+
+@lru_cache(maxsize=4096)
+def _normalize_cached(query):
+    return _normalize(query)
+
+
+def _normalize(query):
+    for pattern, replacement in NORMALIZE:
+        query = pattern.sub(replacement, query)
+    return query.strip().rstrip(";").strip()
+
+
+def _normalize_rows(query):
+    """normalize() of a long INSERT ... VALUES from the text around its rows, or None for other statements."""
+    head, tail = query[:CACHE_MAX_LENGTH], query[-CACHE_MAX_LENGTH:]
+    if isinstance(query, bytes):
+        head, tail = head.decode("utf-8", "replace"), tail.decode("utf-8", "replace")
+    rows = VALUES_ROWS.search(head)
+    if rows is None:
+        return None
+    after = AFTER_ROWS.search(tail)
+    return " ".join(filter(None, [_normalize_cached(head[:rows.start()]), "VALUES (?)",
+                                  after and _normalize_cached(after.group(1))]))
+
+
+def normalize(query):
+    """The statement with its literals and placeholders replaced by ?, the key its metrics are kept under."""
+    if len(query) > CACHE_MAX_LENGTH:
+        normalized = _normalize_rows(query)
+        if normalized is not None:
+            return normalized
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    return _normalize_cached(query) if len(query) <= CACHE_MAX_LENGTH else _normalize(query)
+
+
+def explain_command(query):
+    """The EXPLAIN to capture the plan of `query` with, or None if EXPLAIN does not accept it.
+
+    Only reads get ANALYZE: it runs the statement again, so a write would fire
+    its triggers a second time and move its sequences on.
+    """
+    match = re.match(r"\s*(?:\(\s*)?(\w+)", query)
+    if match is None or match.group(1).lower() not in EXPLAINABLE:
+        return None
+    if match.group(1).lower() in READ_ONLY and not WRITES.search(query):
+        return "EXPLAIN (ANALYZE, BUFFERS) "
+    return "EXPLAIN "
+
+
+#---------------------------------- psycopg2 --------------------------------------------#
+
+def result_size_function(*modules):
+    """libpq's PQresultMemorySize, through the libpq the first importable of `modules` is linked with, or None."""
+    for name in modules:
+        try:
+            function = ctypes.CDLL(importlib.import_module(name).__file__).PQresultMemorySize
+        except (ImportError, OSError, AttributeError):
+            continue
+        function.restype = ctypes.c_size_t
+        function.argtypes = [ctypes.c_void_p]
+        return function
+    return None
+
+
+_result_size = result_size_function("psycopg2._psycopg")
+
+
+class CountingFile:
+    """File object wrapper that counts the bytes COPY reads from or writes to it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.count += len(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self.file.readline(size)
+        self.count += len(data)
+        return data
+
+    def write(self, data):
+        self.count += len(data)
+        return self.file.write(data)
+
+
+class CountingTextFile(CountingFile, io.TextIOBase):
+    """CountingFile for text files: psycopg2 only reads and writes str on io.TextIOBase objects."""
+
+
+class InstrumentedCursor(extensions.cursor):
+    """psycopg2 cursor that records every statement in METRICS (and slow ones in the slow-query log)."""
+
+    def execute(self, query, vars=None):
+        if not INSTRUMENT:
+            return super().execute(query, vars)
+        start = time.perf_counter()
+        error = True
+        try:
+            result = super().execute(query, vars)
+            error = False
+            return result
+        finally:
+            self._observe(query, time.perf_counter() - start, error)
+
+    def executemany(self, query, vars_list):
+        if not INSTRUMENT:
+            return super().executemany(query, vars_list)
+        start = time.perf_counter()
+        error = True
+        try:
+            result = super().executemany(query, vars_list)
+            error = False
+            return result
+        finally:
+            self._observe(query, time.perf_counter() - start, error, explain=False)
+
+    def copy_expert(self, sql, file, size=8192):
+        if not INSTRUMENT:
+            return super().copy_expert(sql, file, size)
+        counting = CountingTextFile(file) if isinstance(file, io.TextIOBase) else CountingFile(file)
+        start = time.perf_counter()
+        error = True
+        try:
+            result = super().copy_expert(sql, counting, size)
+            error = False
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            outgoing = re.search(r"\bFROM\s+STDIN\b", sql, re.IGNORECASE) is not None
+            METRICS.record(normalize(sql), seconds, max(self.rowcount, 0),
+                           counting.count if outgoing else len(sql), 0 if outgoing else counting.count, error)
+            if SLOW_QUERY_MS is not None and seconds * 1e3 >= SLOW_QUERY_MS:
+                METRICS.record_slow(slow_entry(sql, seconds, self.rowcount))
+
+    def _observe(self, query, seconds, error, explain=True):
+        sent = self.query or (query if isinstance(query, bytes) else str(query).encode())
+        bytes_in = 0
+        if not error and _result_size is not None and self.pgresult_ptr is not None:
+            bytes_in = _result_size(self.pgresult_ptr)
+        statement = normalize(query if isinstance(query, (str, bytes)) else sent)
+        METRICS.record(statement, seconds, max(self.rowcount, 0), len(sent), bytes_in, error)
+        if SLOW_QUERY_MS is not None and seconds * 1e3 >= SLOW_QUERY_MS:
+            text = sent.decode("utf-8", "replace")
+            plan = self._explain(text) if explain and not error and self.name is None else None
+            METRICS.record_slow(slow_entry(text, seconds, self.rowcount, statement, plan))
+
+    def _explain(self, text):
+        """The plan of `text` (see explain_command), run and rolled back; None if it cannot be explained."""
+        explain = explain_command(text)
+        if explain is None:
+            return None
+        conn = self.connection
+        status = conn.get_transaction_status()
+        if status not in (extensions.TRANSACTION_STATUS_IDLE, extensions.TRANSACTION_STATUS_INTRANS):
+            return None
+        # a plain cursor, so the EXPLAIN is not recorded itself
+        with conn.cursor(cursor_factory=extensions.cursor) as cur:
+            if status == extensions.TRANSACTION_STATUS_INTRANS:
+                begin, end = "SAVEPOINT instrumentation_explain", "ROLLBACK TO SAVEPOINT instrumentation_explain"
+            elif conn.autocommit:
+                begin, end = "BEGIN", "ROLLBACK"
+            else:
+                # psycopg2 opens a transaction by itself; rolling it back leaves the connection as it was
+                begin, end = None, None
+            try:
+                if begin:
+                    cur.execute(begin)
+                cur.execute(explain + text)
+                plan = "\n".join(row[0] for row in cur.fetchall())
+            except Exception as e:
+                plan = f"(no plan: {e})"
+            finally:
+                if end:
+                    cur.execute(end)
+                else:
+                    conn.rollback()
+            if status == extensions.TRANSACTION_STATUS_INTRANS:
+                cur.execute("RELEASE SAVEPOINT instrumentation_explain")
+        return plan
+
+
+def slow_entry(text, seconds, rows, statement=None, plan=None):
+    return {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "ms": seconds * 1e3,
+        "rows": rows,
+        "statement": statement or normalize(text),
+        "query": text if len(text) <= MAX_QUERY_TEXT else text[:MAX_QUERY_TEXT] + " ...",
+        "plan": plan,
+    }
+
+
+#---------------------------------- Reports and endpoint --------------------------------------------#
+
+def report(snapshot, limit=20, width=70):
+    """Table of the `limit` statements with the most total time."""
+    rows = []
+    for s in snapshot["statements"][:limit]:
+        statement = s["statement"] if len(s["statement"]) <= width else s["statement"][:width - 3] + "..."
+        rows.append([statement, s["calls"], s["errors"], s["total_ms"], s["p50_ms"], s["p95_ms"], s["p99_ms"],
+                     s["max_ms"], s["rows"], s["bytes_out"] / 1024, s["bytes_in"] / 1024])
+    return tabulate(rows, headers=["statement", "calls", "errors", "total ms", "p50 ms", "p95 ms", "p99 ms",
+                                   "max ms", "rows", "KiB out", "KiB in"], floatfmt=".2f")
+
+
+def slow_report(snapshot):
+    lines = []
+    for entry in snapshot["slow"]:
+        lines.append(f"{entry['at']}  {entry['ms']:.1f} ms  {entry['rows']} rows\n  {entry['query']}")
+        if entry.get("plan"):
+            lines.append("\n".join("    " + line for line in entry["plan"].splitlines()))
+    return "\n".join(lines) or "No slow statements."
+
+
+def dump(path, metrics=METRICS):
+    with open(path, "w") as f:
+        json.dump(metrics.snapshot(), f, indent=2)
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = METRICS
+
+    def do_GET(self):
+        path, _, query = self.path.partition("?")
+        if path != "/metrics":
+            self.send_error(404)
+            return
+        snapshot = self.metrics.snapshot()
+        if "format=text" in query:
+            body, kind = (report(snapshot, limit=50) + "\n\n" + slow_report(snapshot) + "\n").encode(), "text/plain"
+        else:
+            body, kind = json.dumps(snapshot).encode(), "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", kind)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve_metrics(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve GET /metrics from a daemon thread. Returns the server (its port is server.server_port)."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+def start_from_environment():
+    """Start the endpoint and the dump at exit that the ELECTROGRID_METRICS_* variables ask for."""
+    if METRICS_PORT is not None:
+        server = serve_metrics()
+        print(f" Query metrics on http://{METRICS_HOST}:{server.server_port}/metrics")
+    if METRICS_FILE:
+        atexit.register(dump, METRICS_FILE)
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Show query metrics from a dump file or a /metrics endpoint.")
+    parser.add_argument("source", help="metrics JSON file, or the URL of a /metrics endpoint")
+    parser.add_argument("--limit", type=int, default=20, help="statements to show")
+    parser.add_argument("--slow", action="store_true", help="show the slow-query log with its plans")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.source.startswith(("http://", "https://")):
+        with urlopen(args.source) as response:
+            snapshot = json.load(response)
+    else:
+        with open(args.source) as f:
+            snapshot = json.load(f)
+    print(slow_report(snapshot) if args.slow else report(snapshot, args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
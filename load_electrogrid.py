@@ -1,33 +1,38 @@
-import pandas as pd
+import argparse
+import json
+import os
+import time
+
+from contextlib import contextmanager
 from pathlib import Path
 import psycopg2
 from psycopg2.extras import execute_values
 
-
-# Configuration 
-
-PGHOST = "dbm.fe.up.pt"
-PGPORT = 5433
-PGDATABASE = "fced01"
-PGUSER = "fced01"
-PGPASSWORD = "GROUP1"
+import raw_dataset
+import transforms
+from bulk_load import drop_constraints, restore_constraints, truncate_tables
+from copy_load import copy_dataframe
+from incremental import apply_delta, reset_state
+from instrumentation import InstrumentedCursor, METRICS, dump, start_from_environment
+from partitions import ensure_for_csv
+from scheduler import parallel_load
+from staging_load import staging_load
+from streaming import stream_table
+
+
+# Configuration (the standard PG* environment variables override the defaults,
+# e.g. PGHOST=localhost to load into a local server)
+
+PGHOST = os.environ.get("PGHOST", "dbm.fe.up.pt")
+PGPORT = int(os.environ.get("PGPORT", 5433))
+PGDATABASE = os.environ.get("PGDATABASE", "fced01")
+PGUSER = os.environ.get("PGUSER", "fced01")
+PGPASSWORD = os.environ.get("PGPASSWORD", "GROUP1")
 PGSCHEMA = "electrogrid"
 
-CSV_DIR = "./raw_data" 
-
-#Establishing database access
-
-import psycopg2
-
-conn = psycopg2.connect(
-        host=PGHOST,
-        port=PGPORT,
-        dbname=PGDATABASE,
-        user=PGUSER,
-        password=PGPASSWORD
-    )
-cursor = conn.cursor()
+CSV_DIR = Path("./raw_data")
 
+# Tables in delete order: every table is cleared before the tables it references
 TABLES = [
     "meter_check",
     "service_orders",
@@ -44,511 +49,295 @@ TABLES = [
     "region"
 ]
 
-try:
-    # Connect to the database
-    conn = psycopg2.connect(
-        host=PGHOST,
-        port=PGPORT,
-        dbname=PGDATABASE,
-        user=PGUSER,
-        password=PGPASSWORD
-    )
-    cursor = conn.cursor()
-    print("Connected successfully!")
-
-    # Delete from each table
-    for table in TABLES:
-        cursor.execute(f"DELETE FROM {PGSCHEMA}.{table};")
-        print(f" Cleared table: {table}")
-
-    # Commit changes
-    conn.commit()
-    print(" All tables cleared successfully.")
-
-except Exception as e:
-    print("Error clearing tables:", e)
-    conn.rollback()
-
-#Read, clean, and transform the data
-
-raw_cndf = pd.read_csv('raw_data/connections_raw.csv')
-raw_tdf = pd.read_csv('raw_data/technicians_raw.csv')
-raw_sdf = pd.read_csv('raw_data/service_orders_raw.csv')
-raw_cdf = pd.read_csv('raw_data/clients_raw.csv')
-
-# region df
-
-region_df = (raw_tdf[['region']]).rename(columns={'region':'region_name'}).copy()
-region_df['region_name'] = region_df['region_name'].astype(str).str.strip()
-region_df = region_df.drop_duplicates()
-
-# connection_type df
-
-connection_type_df = raw_cndf[['connection_type']].copy()
-connection_type_df['connection_type'] = connection_type_df['connection_type'].astype(str).str.strip()
-connection_type_df = connection_type_df.drop_duplicates()
-
-# status df
-
-status_df = raw_cndf[['status']].copy()
-status_df['status'] = status_df['status'].astype(str).str.strip()
-status_df = status_df.drop_duplicates()
-
-# service_type df
-
-service_type_df = raw_sdf[['service_type']].copy()
-service_type_df['service_type'] = service_type_df['service_type'].astype(str).str.strip()
-service_type_df = service_type_df.drop_duplicates()
-
-# person df
-
-client_df = (raw_cdf[['client_id', 'client_name', 'email', 'phone']]
-             .rename( columns={'client_id': 'person_id', 'client_name': 'name'})).copy()
-client_df['person_id'] = client_df['person_id'].astype(str).str.strip()
-client_df['name'] = client_df['name'].astype(str).str.strip()
-client_df['email'] = client_df['email'].astype(str).str.strip()
-client_df['phone'] = client_df['phone'].astype(str).str.strip()
-client_df = client_df.drop_duplicates(subset=['person_id'], keep='first')
-
-tech_df = (raw_tdf[['technician_id', 'technician_name', 'email', 'phone']]
-             .rename( columns={'technician_id': 'person_id', 'technician_name': 'name'})).copy()
-tech_df['person_id'] = tech_df['person_id'].astype(str).str.strip()
-tech_df['name'] = tech_df['name'].astype(str).str.strip()
-tech_df['email'] = tech_df['email'].astype(str).str.strip()
-tech_df['phone'] = tech_df['phone'].astype(str).str.strip()
-tech_df = tech_df.drop_duplicates(subset=['person_id'], keep='first')
-
-person_df = (pd.concat([client_df, tech_df],
-                       ignore_index=True))
-person_df['phone'] = person_df['phone'].astype(str).str.replace(r'[^\d]', '', regex=True).str[-9:]
-person_df  = person_df.drop_duplicates(subset=['person_id'], keep='first')
-
-# client df
-
-client_df = ((raw_cdf[['client_id', 'address']])
-             .rename( columns={'client_id': 'person_id', 'client_name': 'name'})).copy()
-client_df['person_id'] = client_df['person_id'].astype(str).str.strip()
-client_df['address'] = client_df['address'].astype(str).str.strip()
-client_df = client_df.drop_duplicates(subset=['person_id'], keep='first')
-
-
-# Convert DataFrame to list of tuples
-
-datamart_region = [tuple(x) for x in region_df.to_numpy()]
-columns_region = ', '.join(region_df.columns)
-
-datamart_connection_type = [tuple(x) for x in connection_type_df.to_numpy()]
-columns_connection_type = ', '.join(connection_type_df.columns)
-
-datamart_status = [tuple(x) for x in status_df.to_numpy()]
-columns_status = ', '.join(status_df.columns)
-
-datamart_connection_type = [tuple(x) for x in connection_type_df.to_numpy()]
-columns_connection_type = ', '.join(connection_type_df.columns)
-
-datamart_service_type = [tuple(x) for x in service_type_df.to_numpy()]
-columns_service_type = ', '.join(service_type_df.columns)
-
-datamart_person = [tuple(x) for x in person_df.to_numpy()]
-columns_person = ', '.join(person_df.columns)
-
-datamart_client = [tuple(x) for x in client_df.to_numpy()]
-columns_client = ', '.join(client_df.columns)
-
-
-#Read, clean, and transform the data
-CSV_DIR = Path("./raw_data")
-
-# -------------------------- SERVICE ORDERS ----------------------------------------------#
-df_raw = pd.read_csv(CSV_DIR/"service_orders_raw.csv")
-
-columns_to_keep_service_orders = [
-    "service_order_id",
-    "start_date",
-    "end_date",
-    "notes",
-    "client_id",
-    "technician_id",
-    "connection_id",
-    "service_type"
-]
-df_service_orders = df_raw[columns_to_keep_service_orders].copy()
-
-# Convert dates to proper datetime objects
-df_service_orders["start_date"] = pd.to_datetime(df_service_orders["start_date"], errors="coerce")
-df_service_orders["end_date"] = pd.to_datetime(df_service_orders["end_date"], errors="coerce")
-
-# Strip text fields
-df_service_orders["notes"] = df_service_orders["notes"].astype(str).str.strip()
-df_service_orders["service_type"] = df_service_orders["service_type"].astype(str).str.strip()
-
-# Convert ID fields to strings and strip spaces
-df_service_orders["client_id"] = df_service_orders["client_id"].astype(str).str.strip()
-df_service_orders["technician_id"] = df_service_orders["technician_id"].astype(str).str.strip()
-df_service_orders["connection_id"] = df_service_orders["connection_id"].astype(str).str.strip()
-df_service_orders["service_type"] = df_service_orders["service_type"].astype(str).str.strip()
-
-
-# Drop rows with missing critical foreign keys or primary key
-df_service_orders = df_service_orders.dropna(subset=["service_order_id", "client_id", "technician_id", "connection_id", "service_type"])
-
-# Remove duplicates
-df_service_orders = df_service_orders.drop_duplicates(subset=["service_order_id"])
-df_service_orders = df_service_orders[df_service_orders['client_id'].isin(client_df['person_id'])]
-
-# Reorder columns to match SQL schema definition
-df_service_orders = df_service_orders[
-    [
-        "service_order_id",
-        "start_date",
-        "end_date",
-        "notes",
-        "client_id",
-        "technician_id",
-        "connection_id",
-        "service_type"
-    ]
-]
-
-#Convert data to tuples & Extract column names 
-datamart_service_orders = [tuple(x) for x in df_service_orders.to_numpy()]
-columns_service_orders = ', '.join(df_service_orders.columns)
-
-
-
-
-#-----------------------------------Bills--------------------------------------------------------#
-
-df_raw = pd.read_csv(CSV_DIR/"bills_raw.csv")
-
-# Keep only the columns that match the database schema
-columns_to_keep_bills = [
-    "bill_id",
-    "connection_id",
-    "client_id",
-    "period_start",
-    "period_end",
-    "kwh_used",
-    "amount",
-    "issue_date",
-    "payment_date"
-]
-df_bills = df_raw[columns_to_keep_bills].copy()
-
-# Rename columns to match SQL table structure
-df_bills = df_bills.rename(columns={
-    "period_start": "period_starts",
-    "period_end": "period_ends",
-    "bill_id":"bills_id"
-})
-
-
-# strip spaces form text
-for col in ["bills_id", "client_id", "connection_id"]:
-    df_bills[col] = df_bills[col].astype(str).str.strip()
-
-# Convert numeric columns
-df_bills["kwh_used"] = pd.to_numeric(df_bills["kwh_used"], errors="coerce")
-df_bills["amount"] = pd.to_numeric(df_bills["amount"], errors="coerce").round(2)
-
-# Convert date columns
-date_cols = ["period_starts", "period_ends", "issue_date", "payment_date"]
-for col in date_cols:
-    df_bills[col] = pd.to_datetime(df_bills[col], errors="coerce")
-
-# Drop rows with missing critical fields
-df_bills = df_bills.dropna(subset=["bills_id", "client_id", "connection_id"])
-
-# Remove duplicates
-df_bills = df_bills.drop_duplicates(subset=["bills_id"])
-df_bills = df_bills[df_bills['client_id'].isin(client_df['person_id'])]
-
-# Reorder columns to match SQL table definition
-df_bills = df_bills[
-    [
-        "bills_id",
-        "period_starts",
-        "period_ends",
-        "kwh_used",
-        "amount",
-        "issue_date",
-        "payment_date",
-        "client_id",
-        "connection_id"
-    ]
-]
-
-#Convert data to tuples & Extract column names 
-datamart_bills = [tuple(x) for x in df_bills.to_numpy()]
-columns_bills = ', '.join(df_bills.columns)
-
+# Tables in foreign-key order: every table is loaded after the tables it references
+LOAD_ORDER = list(reversed(TABLES))
 
-#-------------------------------------Connections---------------------------------------------#
+# Tables that --chunksize streams from their CSV instead of building in memory
+STREAMED_TABLES = ["bills", "service_orders"]
 
-# Read CSV
-df_raw = pd.read_csv(CSV_DIR/"connections_raw.csv")
+# Rows per INSERT statement with execute_values. Statement-level triggers (the
+# billing rollups on bills) run once per statement, so fewer, larger pages
+# keep their cost down.
+PAGE_SIZE = 1000
 
 
-# Keep only relevant columns
-columns_to_keep_connections = [
-    "connection_id",
-    "client_id",
-    "property_address",
-    "connection_type",
-    "install_date",
-    "meter_serial",
-    "status",
-    "technician_id"
-]
-df_connnections = df_raw[columns_to_keep_connections].copy()
-
-
-# strip spaces
-text_cols = [
-    "connection_id",
-    "client_id",
-    "property_address",
-    "meter_serial",
-    "connection_type",
-    "status",
-    "technician_id"
-]
-for col in text_cols:
-    df_connnections[col] = df_connnections[col].astype(str).str.strip()
-
-# Standardize case for connection_type and status
-df_connnections["connection_type"] = df_connnections["connection_type"].str.strip()
-df_connnections["status"] = df_connnections["status"].str.title()
-
-# Convert date column
-df_connnections["install_date"] = pd.to_datetime(df_connnections["install_date"], errors="coerce")
-
-# Drop rows missing critical foreign keys or primary key
-df_connnections = df_connnections.dropna(subset=["connection_id", "client_id", "technician_id"])
-
-# Remove duplicates
-df_connnections = df_connnections.drop_duplicates(subset=["connection_id"])
-df_connnections = df_connnections[df_connnections['client_id'].isin(client_df['person_id'])]
-
-# Reorder columns to match SQL schema
-df_connnections = df_connnections[
-    [
-        "connection_id",
-        "property_address",
-        "install_date",
-        "meter_serial",
-        "connection_type",
-        "status",
-        "client_id",
-        "technician_id"
-    ]
-]
-
-
-
-#Convert data to tuples & Extract column names 
-datamart_connections = [tuple(x) for x in df_connnections.to_numpy()]
-columns_connections = ', '.join(df_connnections.columns)
-
-# ------------------------------------Technician_Skills and Skills------------------#
-
-#Read CSV file
-df_raw = pd.read_csv(CSV_DIR/"technicians_raw.csv")
-
-
-# 2. Keep only the relevant columns
-df = df_raw[["technician_id", "skills"]].copy()
-
-# 3. Clean IDs and split skills
-df["technician_id"] = df["technician_id"].astype(str).str.strip()
-
-# Split the skills by comma and explode into multiple rows
-df["skills"] = df["skills"].astype(str).str.split(",")
-
-df_exploded = df.explode("skills", ignore_index=True)
-
-# 4. Clean up skill names
-df_exploded["skills"] = df_exploded["skills"].astype(str).str.strip().str.title()
-
-# 5. Drop empty skill rows
-df_exploded = df_exploded[df_exploded["skills"] != ""]
-
-# 6. Rename to match SQL schema
-df_technician_skill = df_exploded.rename(columns={"skills": "skill_name"})
-
-# 7. Remove duplicates (same technician-skill combination)
-df_technician_skill = df_technician_skill.drop_duplicates(subset=["technician_id", "skill_name"])
-
-# 8. Create separate df for unique skills
-df_skills = pd.DataFrame(df_technician_skill["skill_name"].unique(), columns=["skill_name"])
+def parse_args():
+    parser = argparse.ArgumentParser(description="Clean the raw electrogrid CSVs and load them into PostgreSQL.")
+    parser.add_argument(
+        "--method",
+        choices=["execute_values", "copy"],
+        default="execute_values",
+        help="execute_values builds INSERT statements; copy streams each table with COPY ... FROM STDIN"
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="read bills_raw.csv and service_orders_raw.csv in chunks of this many rows and flush each chunk"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="apply only the inserts, updates and deletes needed to match the CSVs, in one transaction"
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        nargs="?",
+        const=os.cpu_count(),
+        default=None,
+        help="run the transforms in JOBS processes and load independent tables over JOBS connections "
+             "(through staging tables, published in one transaction); defaults to the number of CPUs"
+    )
+    parser.add_argument(
+        "--staging",
+        action="store_true",
+        help="COPY the raw CSVs into staging tables and clean, deduplicate and FK-filter them in SQL; "
+             "rows that fail a check are written to electrogrid.load_rejects instead of aborting the load"
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="drop the keys, indexes and foreign keys, load into the bare tables and rebuild them afterwards "
+             "(foreign keys added NOT VALID, then validated), all in one transaction"
+    )
+    parser.add_argument(
+        "--csv-dir",
+        type=Path,
+        default=CSV_DIR,
+        help="directory holding the five raw CSV files (default ./raw_data)"
+    )
+    parser.add_argument(
+        "--timings-json",
+        type=Path,
+        default=None,
+        help="write the wall time of each load stage to this JSON file"
+    )
+    parser.add_argument(
+        "--metrics-json",
+        type=Path,
+        default=None,
+        help="write the latency histogram, rows and bytes of every statement to this JSON file "
+             "(see instrumentation.py)"
+    )
+    args = parser.parse_args()
 
+    if args.incremental and args.chunksize is not None:
+        parser.error("--incremental compares whole tables and cannot be combined with --chunksize")
+    if args.jobs is not None and (args.incremental or args.chunksize is not None):
+        parser.error("--jobs cannot be combined with --incremental or --chunksize")
+    if args.staging and (args.incremental or args.chunksize is not None or args.jobs is not None):
+        parser.error("--staging cannot be combined with --incremental, --chunksize or --jobs")
+    if args.bulk and (args.incremental or args.jobs is not None):
+        parser.error("--bulk cannot be combined with --incremental or --jobs")
+    return args
 
-#Convert data to tuples & Extract column names 
-datamart_technician_skill = [tuple(x) for x in df_technician_skill.to_numpy()]
-columns_technician_skill = ', '.join(df_technician_skill.columns)
 
-datamart_skills = [tuple(x) for x in df_skills.to_numpy()]
-columns_skills = ', '.join(df_skills.columns)
+#Establishing database access
 
+def connect():
+    return psycopg2.connect(
+        host=PGHOST,
+        port=PGPORT,
+        dbname=PGDATABASE,
+        user=PGUSER,
+        password=PGPASSWORD,
+        cursor_factory=InstrumentedCursor
+    )
 
 
+def clear_tables(conn):
+    try:
+        cursor = conn.cursor()
 
-# ------------------------------------Technicians-----------------------------------------#
+        # Delete from each table
+        for table in TABLES:
+            cursor.execute(f"DELETE FROM {PGSCHEMA}.{table};")
+            print(f" Cleared table: {table}")
 
-# Keep only relevant columns
-df_technicians = df_raw[["technician_id", "region"]].copy()
+        # Stored row hashes no longer describe the tables
+        reset_state(cursor, PGSCHEMA)
 
-#Rename columns to match SQL schema
-df_technicians = df_technicians.rename(columns={
-    "technician_id": "person_id",
-    "region": "region_name"
-})
+        # Commit changes
+        conn.commit()
+        print(" All tables cleared successfully.")
 
-# Clean and standardize
-df_technicians["person_id"] = df_technicians["person_id"].astype(str).str.strip()
-df_technicians["region_name"] = df_technicians["region_name"].astype(str).str.strip().str.title()  # Normalize capitalization
+    except Exception as e:
+        print("Error clearing tables:", e)
+        conn.rollback()
 
-# Drop rows with missing values
-df_technicians = df_technicians.dropna(subset=["person_id", "region_name"])
 
-# Remove duplicates
-df_technicians = df_technicians.drop_duplicates(subset=["person_id"])
+def sync_client_ids(cur):
+    """Move the client ID sequence past the highest C<number> ID in person."""
+    cur.execute(f"CREATE SEQUENCE IF NOT EXISTS {PGSCHEMA}.client_id_seq;")
+    cur.execute(f"""
+        SELECT setval('{PGSCHEMA}.client_id_seq',
+                      COALESCE(max(substring(person_id FROM 2)::BIGINT), 0) + 1, false)
+        FROM {PGSCHEMA}.person
+        WHERE person_id ~ '^C[0-9]+$';
+    """)
 
-# Reorder columns to match SQL table
-df_technicians = df_technicians[["person_id", "region_name"]]
 
-#Convert data to tuples & Extract column names 
+@contextmanager
+def timed(timings, stage):
+    """Add the wall time of the enclosed block to timings[stage]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
 
-datamart_technicians = [tuple(x) for x in df_technicians.to_numpy()]
-columns_technicians = ', '.join(df_technicians.columns)
 
-# ------------------------------------Meter_Check-----------------------------------------#
+def report_timings(timings, path, metrics_path=None):
+    print(" Stage times: " + ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in timings.items()))
+    if path is not None:
+        path.write_text(json.dumps(timings, indent=2))
+    if metrics_path is not None:
+        dump(metrics_path)
+        statements = METRICS.snapshot()["statements"]
+        print(f" Query metrics of {len(statements)} statements written to {metrics_path}")
 
-meter_check_data = [
-    ('CH001', 'MTR1000', 'T001', '2024-03-12', 'overload detected'),
-    ('CH002', 'MTR1001', 'T002', '2024-07-28', '42 kwh'),
-    ('CH003', 'MTR1002', 'T003', '2024-11-05', 'calibration needed'),
-    ('CH004', 'MTR1003', 'T004', '2024-05-17', '57 kwh'),
-    ('CH005', 'MTR1004', 'T005', '2024-09-14', 'display faulty'),
-    ('CH006', 'MTR1005', 'T006', '2024-02-08', '23 kwh'),
-    ('CH007', 'MTR1006', 'T007', '2024-12-30', 'communication error'),
-    ('CH008', 'MTR1007', 'T008', '2024-06-21', '68 kwh'),
-    ('CH009', 'MTR1008', 'T009', '2024-04-03', 'voltage spike'),
-    ('CH010', 'MTR1009', 'T010', '2024-10-11', '19 kwh'),
-    ('CH011', 'MTR1010', 'T011', '2024-08-25', 'meter replacement'),
-    ('CH012', 'MTR1011', 'T012', '2024-01-15', '76 kwh'),
-    ('CH013', 'MTR1012', 'T013', '2024-07-07', 'sensor failure'),
-    ('CH014', 'MTR1013', 'T014', '2024-03-29', '34 kwh'),
-    ('CH015', 'MTR1014', 'T015', '2024-12-12', 'battery low'),
-    ('CH016', 'MTR1015', 'T016', '2024-05-05', '89 kwh'),
-    ('CH017', 'MTR1016', 'T017', '2024-09-18', 'wiring issue'),
-    ('CH018', 'MTR1017', 'T018', '2024-02-22', '12 kwh'),
-    ('CH019', 'MTR1018', 'T019', '2024-11-08', 'reset required'),
-    ('CH020', 'MTR1019', 'T020', '2024-06-14', '95 kwh')]
 
 # LOAD DATA INTO DATABASE
 
-try:
-    with conn.cursor() as cur:
-        # Insert into region
+def insert_frame(cur, table, df, method):
+    """Insert one cleaned DataFrame with the selected method."""
+    if method == "copy":
+        copy_dataframe(cur, f"{PGSCHEMA}.{table}", df)
+    else:
+        columns = ', '.join(df.columns)
+        # Missing values (NaN, NaT, NA) become None so they are inserted as NULL;
+        # rows are generated lazily, one page of execute_values at a time
+        values = df.astype(object).where(df.notna(), None)
         execute_values(
             cur,
-            f"INSERT INTO electrogrid.region ({columns_region}) VALUES %s",
-            datamart_region
+            f"INSERT INTO {PGSCHEMA}.{table} ({columns}) VALUES %s",
+            values.itertuples(index=False, name=None),
+            page_size=PAGE_SIZE
         )
 
-        # Insert into connection_type
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.connection_type ({columns_connection_type}) VALUES %s",
-            datamart_connection_type
-        )
 
-        # Insert into status
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.status ({columns_status}) VALUES %s",
-            datamart_status
-        )
+def load_table(cur, table, df, method):
+    """Insert one cleaned DataFrame and report its throughput."""
+    start = time.perf_counter()
+    insert_frame(cur, table, df, method)
+    elapsed = time.perf_counter() - start
+    rate = len(df) / elapsed if elapsed > 0 else float("inf")
+    print(f" Loaded {table}: {len(df)} rows in {elapsed:.3f}s ({rate:,.0f} rows/sec)")
 
-        # Insert into service_type
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.service_type ({columns_service_type}) VALUES %s",
-            datamart_service_type
-        )
 
-        # Insert into person
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.person ({columns_person}) VALUES %s",
-            datamart_person
-        )
+def stream_fact_tables(cur, frames, args):
+    """Stream bills and service orders chunk by chunk, after their parent tables are loaded."""
+    client_ids = set(frames["client"]['person_id'])
+    connection_ids = set(frames["connections"]['connection_id'])
 
-        # Insert into client
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.client ({columns_client}) VALUES %s",
-            datamart_client
-        )
+    def insert(cur, table, df):
+        insert_frame(cur, table, df, args.method)
 
-        # Insert into technician
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.technician ({columns_technicians}) VALUES %s",
-            datamart_technicians
-        )
+    stream_table(cur, raw_dataset.read_chunks("bills", args.chunksize, csv_dir=args.csv_dir),
+                 "bills", transforms.clean_bills, "bills_id",
+                 {"client_id": client_ids, "connection_id": connection_ids}, insert)
+    stream_table(cur, raw_dataset.read_chunks("service_orders", args.chunksize, csv_dir=args.csv_dir),
+                 "service_orders", transforms.clean_service_orders, "service_order_id",
+                 {"client_id": client_ids, "connection_id": connection_ids}, insert)
 
-        # Insert into skills
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.skills ({columns_skills}) VALUES %s",
-            datamart_skills
-        )
 
-        # Insert into technician_skill
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.technician_skill ({columns_technician_skill}) VALUES %s",
-            datamart_technician_skill
-        )
+def build_frames(args):
+    """Run the transform for every table that is loaded from memory."""
+    frames = {}
+    for table in LOAD_ORDER:
+        if args.chunksize is not None and table in STREAMED_TABLES:
+            continue
+        if table == "service_type":
+            frames[table] = transforms.build_service_type(args.csv_dir, args.chunksize)
+        else:
+            frames[table] = transforms.build(table, args.csv_dir)
+    return frames
 
-        # Insert into connections
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.connections ({columns_connections}) VALUES %s",
-            datamart_connections
-        )
 
-        cur.executemany(
-            "INSERT INTO electrogrid.meter_check VALUES (%s, %s, %s, cast(%s as date), %s)",
-            meter_check_data
-        )
+def main():
+    args = parse_args()
+    timings = {}
+    start_from_environment()
 
-        # Insert into bills
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.bills ({columns_bills}) VALUES %s",
-            datamart_bills
-        )
-
-        # Insert into service_orders
-        execute_values(
-            cur,
-            f"INSERT INTO electrogrid.service_orders ({columns_service_orders}) VALUES %s",
-            datamart_service_orders
-        )
-
-    conn.commit()
-    print("All data inserted successfully!")
-
-except Exception as e:
-    conn.rollback()
-    print(f"Error: {e}")
+    with timed(timings, "connect"):
+        conn = connect()
+    print("Connected successfully!")
 
-conn.commit()
-cursor.close()
-conn.close()
+    if args.jobs is not None:
+        # Staging tables keep the live tables untouched until the final publish
+        try:
+            with timed(timings, "partitions"), conn.cursor() as cur:
+                ensure_for_csv(cur, args.csv_dir)
+            conn.commit()
+            with timed(timings, "parallel_load"):
+                parallel_load(connect, args.csv_dir, PGSCHEMA, args.jobs)
+            with conn.cursor() as cur:
+                sync_client_ids(cur)
+            conn.commit()
+            print(f"All data inserted successfully! (parallel, {args.jobs} jobs)")
+        except Exception as e:
+            print(f"Error: {e}")
+        conn.close()
+        report_timings(timings, args.timings_json, args.metrics_json)
+        return
+
+    # A full load deletes from each table; an incremental load keeps them and applies a delta.
+    # A bulk load truncates the tables inside its own transaction instead.
+    if not args.incremental and not args.bulk:
+        with timed(timings, "clear"):
+            clear_tables(conn)
+
+    #Read, clean, and transform the data (--staging does this in the database)
+    with timed(timings, "transform"):
+        frames = {} if args.staging else build_frames(args)
+
+    try:
+        with conn.cursor() as cur:
+            # Every month of bills and service orders gets its partition before the rows arrive
+            with timed(timings, "partitions"):
+                ensure_for_csv(cur, args.csv_dir, args.chunksize)
+
+            if args.bulk:
+                with timed(timings, "drop_constraints"):
+                    saved = drop_constraints(cur, PGSCHEMA, TABLES)
+                with timed(timings, "clear"):
+                    truncate_tables(cur, PGSCHEMA, TABLES)
+
+            with timed(timings, "load"):
+                if args.incremental:
+                    apply_delta(cur, PGSCHEMA, list(frames.items()))
+                elif args.staging:
+                    staging_load(cur, PGSCHEMA, args.csv_dir, LOAD_ORDER)
+                else:
+                    for table, df in frames.items():
+                        load_table(cur, table, df, args.method)
+                    if args.chunksize is not None:
+                        stream_fact_tables(cur, frames, args)
+                sync_client_ids(cur)
+
+            if args.bulk:
+                timings.update(restore_constraints(cur, PGSCHEMA, saved))
+
+        with timed(timings, "commit"):
+            conn.commit()
+        if args.incremental:
+            print("Incremental load applied successfully!")
+        elif args.staging:
+            print("All data inserted successfully! (staging)")
+        else:
+            print(f"All data inserted successfully! (method: {args.method}{', bulk' if args.bulk else ''})")
+
+    except Exception as e:
+        conn.rollback()
+        print(f"Error: {e}")
+
+    conn.close()
+    report_timings(timings, args.timings_json, args.metrics_json)
+
+
+if __name__ == "__main__":
+    main()
 
 
 # to verify data insertion:
@@ -568,4 +357,3 @@ conn.close()
 --select * from electrogrid.service_orders;
 --select * from electrogrid.meter_check;
 '''
-
@@ -0,0 +1,459 @@
+import argparse
+import asyncio
+import io
+import os
+import socket
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from copy_load import copy_dataframe, read_csv_columns
+from db import close_pool, connection
+
+
+# Smart-meter readings: streaming ingestion and windowed queries
+#
+# Meters report every 15 minutes as CSV lines of
+#
+#   meter_serial,read_at,kwh,event_code
+#   MTR1000,2025-03-01T10:15:00Z,0.412,
+#   MTR1001,2025-03-01T10:15:00Z,,power_outage
+#
+# (kwh used since the meter's previous reading; an optional event code from
+# Meter_Event; a header line is skipped). They are written to Meter_Reading
+# (electrogrid.sql) in batches of BATCH_ROWS, each parsed into columns by
+# pandas, checked as a whole with array operations and sent with one COPY in
+# its own transaction:
+#
+#   python meter_readings.py --ingest readings/*.csv      files, read BLOCK_BYTES at a time
+#   python meter_readings.py --listen                     lines sent to a local TCP port (--unix PATH for a socket file)
+#   python meter_readings.py --send readings.csv          stream a file to a listening ingester
+#
+# A batch goes out when it is full, or FLUSH_INTERVAL seconds after its first
+# line, so a slow trickle of readings still arrives within a second or so.
+# While a batch is written, the listener stops reading from its sockets, and
+# the senders wait (TCP backpressure) instead of the buffer growing.
+#
+# Readings are rejected, and counted by reason, when the meter serial is not
+# in Connections, the timestamp or kWh cannot be read, the kWh is negative,
+# the event code is unknown or the reading has neither kWh nor event. The
+# known serials are read again when unknown ones show up, at most every
+# KEYS_MAX_AGE seconds, so new connections are picked up as they are loaded.
+#
+# Windowed queries, over [--from, --to) (the last day by default) in windows
+# of --width:
+#
+#   python meter_readings.py --meter MTR1000 --width "1 hour"   one meter: kWh, peak, events and running total per window
+#   python meter_readings.py --totals --width "1 day"           every meter: meters reporting, kWh and events per window
+#   python meter_readings.py --top 10                           the meters that used the most kWh
+#   python meter_readings.py --events MTR1000                   one meter's events
+#
+#   python meter_readings.py --generate readings.csv --meters 1000 --days 7
+#
+# writes synthetic readings of the first 1000 meters in Connections, ending at
+# the current 15 minutes.
+
+READING_COLUMNS = ["meter_serial", "read_at", "kwh", "event_code"]
+READ_INTERVAL = timedelta(minutes=15)
+
+BATCH_ROWS = int(os.environ.get("ELECTROGRID_METER_BATCH", 200_000))
+BLOCK_BYTES = 8 << 20
+FLUSH_INTERVAL = float(os.environ.get("ELECTROGRID_METER_FLUSH", 1.0))
+KEYS_MAX_AGE = 60
+BRIN_INDEX = "electrogrid.meter_reading_read_at_brin"
+
+# Windows start at whole hours and days (UTC), whatever the queried period
+WINDOW_ORIGIN = datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+METER_HOST = os.environ.get("ELECTROGRID_METER_HOST", "127.0.0.1")
+METER_PORT = int(os.environ.get("ELECTROGRID_METER_PORT", 9400))
+
+# Share of synthetic readings with an event, and the events they get
+EVENT_RATE = 0.001
+SYNTHETIC_EVENTS = ["overload", "voltage_spike", "power_outage", "communication_error", "battery_low", "tamper"]
+
+
+#---------------------------------- Ingestion --------------------------------------------#
+
+def parse(data):
+    """The readings in a block of CSV lines as a DataFrame of text columns (a header line is skipped)."""
+    if data.startswith(b"meter_serial"):
+        data = data[data.find(b"\n") + 1:]
+    if not data.strip():
+        return pd.DataFrame({column: pd.Series([], dtype=str) for column in READING_COLUMNS})
+    return read_csv_columns(io.BytesIO(data), READING_COLUMNS)
+
+
+class Ingester:
+    """Checks batches of readings and COPYs them into Meter_Reading on one connection, one transaction each."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.written = 0
+        self.rejected = Counter()
+        self.seconds = 0.0
+        self.serials = self.events = None
+        self.keys_read_at = 0.0
+        self.read_keys()
+
+    def read_keys(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT meter_serial FROM electrogrid.connections WHERE meter_serial IS NOT NULL;")
+            self.serials = pd.Index([row[0] for row in cur.fetchall()])
+            cur.execute("SELECT event_code FROM electrogrid.meter_event;")
+            self.events = pd.Index([row[0] for row in cur.fetchall()])
+        self.conn.commit()
+        self.keys_read_at = time.monotonic()
+
+    def check(self, raw):
+        """(readings to write, reason of each rejected row) for a DataFrame from parse()."""
+        serial = raw["meter_serial"].str.strip()
+        read_at = pd.to_datetime(raw["read_at"], format="ISO8601", utc=True, errors="coerce")
+        kwh = pd.to_numeric(raw["kwh"], errors="coerce")
+        event = raw["event_code"].str.strip().replace("", None)
+
+        unknown = ~serial.isin(self.serials)
+        if unknown.any() and time.monotonic() - self.keys_read_at > KEYS_MAX_AGE:
+            self.read_keys()
+            unknown = ~serial.isin(self.serials)
+
+        reasons = pd.Series(pd.NA, index=raw.index, dtype="string")
+        # later checks do not overwrite earlier ones: each row keeps its first reason
+        for mask, reason in [
+            (unknown, "unknown_meter"),
+            (read_at.isna(), "bad_timestamp"),
+            (kwh.isna() & raw["kwh"].notna(), "bad_kwh"),
+            (kwh < 0, "negative_kwh"),
+            (event.notna() & ~event.isin(self.events), "unknown_event"),
+            (kwh.isna() & event.isna(), "empty_reading"),
+        ]:
+            reasons[mask & reasons.isna()] = reason
+        keep = reasons.isna().to_numpy()
+        readings = pd.DataFrame({"meter_serial": serial, "read_at": read_at, "kwh": kwh.round(3),
+                                 "event_code": event})[keep]
+        return readings, reasons.dropna()
+
+    def write(self, data):
+        """Check and COPY one block of CSV lines, and commit. Returns the number of readings written."""
+        start = time.perf_counter()
+        readings, rejected = self.check(parse(data))
+        with self.conn.cursor() as cur:
+            if len(readings):
+                copy_dataframe(cur, "electrogrid.meter_reading", readings)
+                # summarize the new block ranges, which every query would read otherwise
+                cur.execute("SELECT brin_summarize_new_values(%s::REGCLASS);", (BRIN_INDEX,))
+        self.conn.commit()
+        self.written += len(readings)
+        self.rejected.update(rejected.to_numpy())
+        self.seconds += time.perf_counter() - start
+        return len(readings)
+
+    def report(self, elapsed=None):
+        elapsed = self.seconds if elapsed is None else elapsed
+        rate = self.written / elapsed if elapsed > 0 else float("inf")
+        rejected = ", ".join(f"{n:,} {reason}" for reason, n in self.rejected.most_common())
+        print(f" Wrote {self.written:,} readings in {elapsed:.3f}s ({rate:,.0f} readings/sec)"
+              + (f"; rejected {rejected}" if rejected else ""))
+
+
+def read_blocks(stream, size=BLOCK_BYTES):
+    """Blocks of about `size` bytes of whole lines from a binary stream."""
+    tail = b""
+    while True:
+        data = stream.read(size)
+        if not data:
+            break
+        data = tail + data
+        end = data.rfind(b"\n") + 1
+        tail = data[end:]
+        if end:
+            yield data[:end]
+    if tail.strip():
+        yield tail + b"\n"
+
+
+def ingest_files(ingester, paths, block_bytes=BLOCK_BYTES):
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in read_blocks(f, block_bytes):
+                ingester.write(block)
+
+
+class Listener:
+    """Collects reading lines from socket clients and writes them in batches through an Ingester."""
+
+    def __init__(self, ingester, batch_rows=BATCH_ROWS, flush_interval=FLUSH_INTERVAL):
+        self.ingester = ingester
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.pending_rows = 0
+        self.first_line_at = None
+        self.lock = asyncio.Lock()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.pending:
+                return
+            data = b"".join(self.pending)
+            self.pending, self.pending_rows, self.first_line_at = [], 0, None
+            # COPY blocks, so it runs in a thread; the lock keeps one batch at a time
+            await asyncio.to_thread(self.ingester.write, data)
+
+    async def handle(self, reader, writer):
+        tail = b""
+        try:
+            while data := await reader.read(1 << 16):
+                data = tail + data
+                end = data.rfind(b"\n") + 1
+                tail = data[end:]
+                if not end:
+                    continue
+                self.pending.append(data[:end])
+                self.pending_rows += data.count(b"\n", 0, end)
+                self.first_line_at = self.first_line_at or time.monotonic()
+                if self.pending_rows >= self.batch_rows:
+                    # not reading while the batch is written holds the sender back
+                    await self.flush()
+            if tail.strip():
+                self.pending.append(tail + b"\n")
+                self.pending_rows += 1
+                self.first_line_at = self.first_line_at or time.monotonic()
+        finally:
+            writer.close()
+
+    async def flush_on_time(self):
+        while True:
+            await asyncio.sleep(self.flush_interval / 4)
+            if self.first_line_at is not None and time.monotonic() - self.first_line_at >= self.flush_interval:
+                await self.flush()
+
+
+async def listen(ingester, host=METER_HOST, port=METER_PORT, unix_path=None, report_every=10):
+    listener = Listener(ingester)
+    if unix_path:
+        server = await asyncio.start_unix_server(listener.handle, unix_path)
+        print(f" Listening for readings on {unix_path}")
+    else:
+        server = await asyncio.start_server(listener.handle, host, port)
+        print(f" Listening for readings on {host}:{port}")
+    flusher = asyncio.create_task(listener.flush_on_time())
+    try:
+        async with server:
+            reported = 0
+            while True:
+                await asyncio.sleep(report_every)
+                if ingester.written != reported:
+                    ingester.report()
+                    reported = ingester.written
+    finally:
+        flusher.cancel()
+        await listener.flush()
+
+
+def send(path, host=METER_HOST, port=METER_PORT, unix_path=None):
+    """Stream a readings file to a listener. Returns the number of bytes sent."""
+    if unix_path:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(unix_path)
+    else:
+        sock = socket.create_connection((host, port))
+    with sock, open(path, "rb") as f:
+        return sock.sendfile(f)
+
+
+#---------------------------------- Queries --------------------------------------------#
+
+def meter_windows(conn, meter_serial, date_from, date_to, width="1 hour"):
+    """(window, readings, kwh, peak kwh, events, running kwh) of one meter, per window of `width`."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT date_bin(%(width)s::INTERVAL, read_at, %(origin)s) AS window,
+                   count(kwh), sum(kwh), max(kwh), count(event_code),
+                   sum(sum(kwh)) OVER (ORDER BY date_bin(%(width)s::INTERVAL, read_at, %(origin)s))
+            FROM electrogrid.meter_reading
+            WHERE read_at >= %(from)s AND read_at < %(to)s AND meter_serial = %(meter)s
+            GROUP BY 1
+            ORDER BY 1;
+        """, {"width": width, "origin": WINDOW_ORIGIN, "from": date_from, "to": date_to, "meter": meter_serial})
+        return cur.fetchall()
+
+
+def window_totals(conn, date_from, date_to, width="1 day"):
+    """(window, meters reporting, readings, kwh, events) over every meter, per window of `width`."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT date_bin(%(width)s::INTERVAL, read_at, %(origin)s) AS window,
+                   count(DISTINCT meter_serial), count(kwh), sum(kwh), count(event_code)
+            FROM electrogrid.meter_reading
+            WHERE read_at >= %(from)s AND read_at < %(to)s
+            GROUP BY 1
+            ORDER BY 1;
+        """, {"width": width, "origin": WINDOW_ORIGIN, "from": date_from, "to": date_to})
+        return cur.fetchall()
+
+
+def top_meters(conn, date_from, date_to, limit=10):
+    """(meter_serial, kwh, readings, events) of the `limit` meters that used the most kWh."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT meter_serial, sum(kwh) AS kwh, count(kwh), count(event_code)
+            FROM electrogrid.meter_reading
+            WHERE read_at >= %s AND read_at < %s
+            GROUP BY meter_serial
+            ORDER BY kwh DESC NULLS LAST, meter_serial
+            LIMIT %s;
+        """, (date_from, date_to, limit))
+        return cur.fetchall()
+
+
+def meter_events(conn, meter_serial, date_from, date_to):
+    """(read_at, event_code, description, kwh) of the events of one meter."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT r.read_at, r.event_code, e.description, r.kwh
+            FROM electrogrid.meter_reading AS r
+            LEFT JOIN electrogrid.meter_event AS e ON e.event_code = r.event_code
+            WHERE r.read_at >= %s AND r.read_at < %s AND r.meter_serial = %s AND r.event_code IS NOT NULL
+            ORDER BY r.read_at;
+        """, (date_from, date_to, meter_serial))
+        return cur.fetchall()
+
+
+#---------------------------------- Synthetic readings --------------------------------------------#
+
+def meter_serials(conn, limit):
+    with conn.cursor() as cur:
+        cur.execute("SELECT meter_serial FROM electrogrid.connections WHERE meter_serial IS NOT NULL "
+                    "ORDER BY meter_serial LIMIT %s;", (limit,))
+        return [row[0] for row in cur.fetchall()]
+
+
+def generate(path, serials, days, end=None, seed=0):
+    """Write `days` of 15-minute readings of the meters `serials`, in time order, ending at `end`. Returns the row count."""
+    rng = np.random.default_rng(seed)
+    if end is None:
+        now = datetime.now(timezone.utc).replace(second=0, microsecond=0)
+        end = now - timedelta(minutes=now.minute % 15)
+    serials = np.asarray(serials, dtype=object)
+    meters = len(serials)
+    level = rng.uniform(0.05, 0.6, meters)
+    steps = int(days * timedelta(days=1) / READ_INTERVAL)
+    # one day of readings per write
+    per_day = int(timedelta(days=1) / READ_INTERVAL)
+    total = 0
+    with open(path, "w") as f:
+        f.write(",".join(READING_COLUMNS) + "\n")
+        for first in range(0, steps, per_day):
+            count = min(per_day, steps - first)
+            times = pd.date_range(end - (steps - first) * READ_INTERVAL, periods=count, freq=READ_INTERVAL)
+            hours = times.hour.to_numpy() + times.minute.to_numpy() / 60
+            # more use in the morning and the evening
+            profile = 1 + 0.5 * np.sin((hours - 6) / 24 * 2 * np.pi) ** 2
+            kwh = np.outer(profile, level) * rng.gamma(4, 0.25, (count, meters))
+            events = np.full((count, meters), "", dtype=object)
+            hit = rng.random((count, meters)) < EVENT_RATE
+            events[hit] = rng.choice(SYNTHETIC_EVENTS, hit.sum())
+            kwh[events == "power_outage"] = np.nan
+            block = pd.DataFrame({
+                "meter_serial": np.tile(serials, count),
+                "read_at": np.repeat(times.strftime("%Y-%m-%dT%H:%M:%SZ").to_numpy(), meters),
+                "kwh": kwh.ravel(),
+                "event_code": events.ravel(),
+            })
+            block.to_csv(f, header=False, index=False, float_format="%.3f")
+            total += len(block)
+    return total
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def utc_timestamp(text):
+    """An ISO timestamp; one without an offset is UTC, like the readings, whatever the session TimeZone."""
+    value = datetime.fromisoformat(text)
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest and query smart-meter readings.")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--ingest", nargs="+", metavar="CSV", help="ingest reading files")
+    group.add_argument("--listen", action="store_true", help="ingest the lines sent to a local socket")
+    group.add_argument("--send", metavar="CSV", help="stream a reading file to a listening ingester")
+    group.add_argument("--meter", metavar="SERIAL", help="windowed totals of one meter")
+    group.add_argument("--totals", action="store_true", help="windowed totals over every meter")
+    group.add_argument("--top", type=int, metavar="N", help="the N meters that used the most kWh")
+    group.add_argument("--events", metavar="SERIAL", help="events of one meter")
+    group.add_argument("--generate", metavar="CSV", help="write synthetic readings")
+    parser.add_argument("--host", default=METER_HOST)
+    parser.add_argument("--port", type=int, default=METER_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="use a Unix socket instead of TCP")
+    parser.add_argument("--from", dest="date_from", type=utc_timestamp, metavar="TIMESTAMP",
+                        help="start of the queried period, UTC unless it has an offset (default: one day before --to)")
+    parser.add_argument("--to", dest="date_to", type=utc_timestamp, metavar="TIMESTAMP",
+                        help="end of the queried period, excluded, UTC unless it has an offset (default: now)")
+    parser.add_argument("--width", default=None, help='window length, e.g. "15 minutes", "1 hour", "1 day"')
+    parser.add_argument("--meters", type=int, default=1000, help="meters to generate readings for")
+    parser.add_argument("--days", type=float, default=1, help="days of readings to generate")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.send:
+        start = time.perf_counter()
+        sent = send(args.send, args.host, args.port, args.unix)
+        print(f" Sent {sent:,} bytes in {time.perf_counter() - start:.3f}s")
+        return 0
+
+    date_to = args.date_to or datetime.now(timezone.utc)
+    date_from = args.date_from or date_to - timedelta(days=1)
+    try:
+        with connection() as conn:
+            if args.generate:
+                serials = meter_serials(conn, args.meters)
+                start = time.perf_counter()
+                rows = generate(args.generate, serials, args.days)
+                print(f" Wrote {rows:,} readings of {len(serials):,} meters to {args.generate} "
+                      f"in {time.perf_counter() - start:.3f}s")
+            elif args.ingest:
+                ingester = Ingester(conn)
+                start = time.perf_counter()
+                ingest_files(ingester, args.ingest)
+                ingester.report(time.perf_counter() - start)
+            elif args.listen:
+                ingester = Ingester(conn)
+                try:
+                    asyncio.run(listen(ingester, args.host, args.port, args.unix))
+                except KeyboardInterrupt:
+                    pass
+                ingester.report()
+            else:
+                start = time.perf_counter()
+                if args.meter:
+                    rows = meter_windows(conn, args.meter, date_from, date_to, args.width or "1 hour")
+                    headers = ["window", "readings", "kWh", "peak kWh", "events", "running kWh"]
+                elif args.totals:
+                    rows = window_totals(conn, date_from, date_to, args.width or "1 day")
+                    headers = ["window", "meters", "readings", "kWh", "events"]
+                elif args.top is not None:
+                    rows = top_meters(conn, date_from, date_to, args.top)
+                    headers = ["meter", "kWh", "readings", "events"]
+                else:
+                    rows = meter_events(conn, args.events, date_from, date_to)
+                    headers = ["read at", "event", "description", "kWh"]
+                conn.rollback()
+                print(tabulate(rows, headers=headers, tablefmt="grid"))
+                print(f" {len(rows)} rows in {(time.perf_counter() - start) * 1e3:.1f} ms")
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
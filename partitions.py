@@ -0,0 +1,225 @@
+import argparse
+import re
+import sys
+import time
+from datetime import date
+
+from tabulate import tabulate
+
+import raw_dataset
+import schema
+from cleaning import SPECS, convert
+from db import close_pool, connection
+
+
+# Monthly partitions of Bills and Service_Orders
+#
+# Both tables are partitioned by month (electrogrid.sql, "Partitions"). This
+# module creates the partitions the data needs, archives old months and shows
+# what partition pruning saves:
+#
+#   python partitions.py                            partitions with their months and row counts
+#   python partitions.py --ahead 3                  create the partitions up to 3 months from now
+#   python partitions.py --retain 24                archive the months more than 24 months old
+#   python partitions.py --archive-before 2025-01-01 --drop
+#   python partitions.py --check-pruning            EXPLAIN the recent-period queries with and without pruning
+#
+# Archiving is a catalog operation: each old partition is detached from its
+# table and moved to the electrogrid_archive schema (or dropped with --drop),
+# without deleting or rewriting rows. The archived table keeps its rows and
+# indexes but loses its foreign keys, so clients and connections can still be
+# deleted or reloaded. Nothing else is touched, so archiving costs the same
+# however many rows a month holds: the billing rollups keep the totals of
+# archived months (billing_rollups.py --verify and --rebuild only cover the
+# months still in Bills), and Bill_Consumption drops the archived bills the
+# next time consumption_analytics.py rewrites it.
+
+# Partitioned tables and their partition key, from electrogrid.sql
+PARTITIONED = {table: definition["partition_key"] for table, definition in schema.TABLES.items()
+               if definition["partition_key"]}
+ARCHIVE_SCHEMA = "electrogrid_archive"
+
+# Queries on recent periods, by table. {since} is the first day of the
+# period, the first of the month two months before the latest one.
+PRUNING_QUERIES = [
+    ("bills issued in the last 3 months", "bills",
+     "SELECT count(*), sum(amount) FROM electrogrid.bills WHERE issue_date >= {since}"),
+    ("unpaid bills of the last 3 months", "bills",
+     "SELECT client_id, sum(amount) FROM electrogrid.bills "
+     "WHERE issue_date >= {since} AND payment_date IS NULL GROUP BY client_id"),
+    ("service orders started in the last 3 months", "service_orders",
+     "SELECT service_type, count(*) FROM electrogrid.service_orders WHERE start_date >= {since} GROUP BY service_type"),
+]
+
+BOUNDS = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def partitions(cur, table):
+    """[(partition, first day, first day after)] of `table`, by month; the default partition has no bounds."""
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits AS i
+        JOIN pg_class AS c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::REGCLASS
+        ORDER BY c.relname;
+    """, (f"electrogrid.{table}",))
+    found = []
+    for name, bound in cur.fetchall():
+        match = BOUNDS.search(bound)
+        found.append((name, *(date.fromisoformat(d) for d in match.groups())) if match else (name, None, None))
+    return found
+
+
+def create(cur, table, first, last):
+    """Create the partitions of `table` for the months from `first` to `last`. Returns how many were new."""
+    cur.execute("SELECT electrogrid.create_month_partitions(%s, %s, %s);", (table, first, last))
+    return cur.fetchone()[0]
+
+
+def csv_months(table, csv_dir=raw_dataset.CSV_DIR, chunksize=None):
+    """(first, last) partition-key date in the raw CSV of `table`, or None if it has none.
+
+    The file is read through raw_dataset.load, so a loader that has parsed it
+    already pays nothing more. With `chunksize`, only the partition column is
+    read, `chunksize` rows at a time, as for --chunksize loads.
+    """
+    spec = SPECS[table]["columns"][PARTITIONED[table]]
+    if chunksize is None:
+        chunks = [raw_dataset.load(table, csv_dir)]
+    else:
+        chunks = raw_dataset.read_chunks(table, chunksize, columns=[spec["source"]], csv_dir=csv_dir)
+    first = last = None
+    for chunk in chunks:
+        dates = convert(chunk[spec["source"]], spec).dropna()
+        if len(dates):
+            first = dates.min() if first is None else min(first, dates.min())
+            last = dates.max() if last is None else max(last, dates.max())
+    return (first.date(), last.date()) if first is not None else None
+
+
+def ensure_for_csv(cur, csv_dir=raw_dataset.CSV_DIR, chunksize=None):
+    """Create the partitions for every month in the raw CSVs, so loaded rows go straight to their month."""
+    created = 0
+    for table in PARTITIONED:
+        months = csv_months(table, csv_dir, chunksize)
+        if months is not None:
+            created += create(cur, table, *months)
+    if created:
+        print(f" Created {created} monthly partitions")
+    return created
+
+
+def add_months(day, months):
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def archive(cur, table, before, drop=False):
+    """Detach the partitions of `table` that end on or before `before`; move them to the archive or drop them."""
+    cur.execute(f"CREATE SCHEMA IF NOT EXISTS {ARCHIVE_SCHEMA};")
+    archived = []
+    for name, _, upper in partitions(cur, table):
+        if upper is None or upper > before:
+            continue
+        cur.execute(f"ALTER TABLE electrogrid.{table} DETACH PARTITION electrogrid.{name};")
+        if drop:
+            cur.execute(f"DROP TABLE electrogrid.{name};")
+        else:
+            cur.execute("""
+                SELECT conname FROM pg_constraint WHERE conrelid = %s::REGCLASS AND contype = 'f';
+            """, (f"electrogrid.{name}",))
+            for (constraint,) in cur.fetchall():
+                cur.execute(f'ALTER TABLE electrogrid.{name} DROP CONSTRAINT "{constraint}";')
+            cur.execute(f"ALTER TABLE electrogrid.{name} SET SCHEMA {ARCHIVE_SCHEMA};")
+        archived.append(name)
+    return archived
+
+
+#---------------------------------- Pruning --------------------------------------------#
+
+def plan_relations(plan):
+    """Names of the tables a plan tree reads."""
+    found = {plan["Relation Name"]} if "Relation Name" in plan else set()
+    for child in plan.get("Plans", []):
+        found |= plan_relations(child)
+    return found
+
+
+def explain_scans(cur, query):
+    """(partitions read, execution ms) of `query`."""
+    cur.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + query)
+    plan = cur.fetchone()[0][0]
+    return plan_relations(plan["Plan"]), plan["Execution Time"]
+
+
+def check_pruning(cur):
+    """Rows of (query, partitions read / total, ms with pruning, ms without)."""
+    rows = []
+    for name, table, query in PRUNING_QUERIES:
+        cur.execute(f"SELECT max({PARTITIONED[table]}) FROM electrogrid.{table};")
+        latest = cur.fetchone()[0]
+        if latest is None:
+            print(f" Skipped {name}: no rows")
+            continue
+        query = cur.mogrify(query.format(since="%s"), (add_months(latest.replace(day=1), -2),)).decode()
+        total = len(partitions(cur, table))
+
+        read, pruned_ms = explain_scans(cur, query)
+        cur.execute("SET LOCAL enable_partition_pruning = off;")
+        _, full_ms = explain_scans(cur, query)
+        cur.execute("SET LOCAL enable_partition_pruning = on;")
+        rows.append([name, f"{len(read)} of {total}", f"{pruned_ms:.2f}", f"{full_ms:.2f}"])
+    return rows
+
+
+#---------------------------------- Command line --------------------------------------------#
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Create, list and archive the monthly partitions.")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--ahead", type=int, metavar="MONTHS",
+                       help="create the partitions from this month to MONTHS months ahead")
+    group.add_argument("--retain", type=int, metavar="MONTHS",
+                       help="archive the months that ended more than MONTHS months before this month")
+    group.add_argument("--archive-before", type=date.fromisoformat, metavar="YYYY-MM-DD",
+                       help="archive the months that end on or before this date")
+    group.add_argument("--check-pruning", action="store_true",
+                       help="EXPLAIN the recent-period queries with and without partition pruning")
+    parser.add_argument("--drop", action="store_true", help="drop archived partitions instead of keeping them")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    this_month = date.today().replace(day=1)
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            start = time.perf_counter()
+            if args.ahead is not None:
+                created = sum(create(cur, table, this_month, add_months(this_month, args.ahead))
+                              for table in PARTITIONED)
+                print(f" Created {created} partitions in {time.perf_counter() - start:.3f}s")
+            elif args.retain is not None or args.archive_before is not None:
+                before = args.archive_before or add_months(this_month, -args.retain)
+                for table in PARTITIONED:
+                    archived = archive(cur, table, before, args.drop)
+                    where = "dropped" if args.drop else f"moved to {ARCHIVE_SCHEMA}"
+                    print(f" {table}: {len(archived)} partitions {where}" + (f" ({', '.join(archived)})" if archived else ""))
+                print(f" Archived in {time.perf_counter() - start:.3f}s")
+            elif args.check_pruning:
+                print(tabulate(check_pruning(cur), headers=["query", "partitions read", "ms", "ms without pruning"]))
+            else:
+                rows = []
+                for table in PARTITIONED:
+                    for name, lower, upper in partitions(cur, table):
+                        cur.execute(f"SELECT count(*) FROM electrogrid.{name};")
+                        rows.append([table, name, lower or "default", upper or "", cur.fetchone()[0]])
+                print(tabulate(rows, headers=["table", "partition", "from", "to", "rows"]))
+            conn.commit()
+        return 0
+    finally:
+        close_pool()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
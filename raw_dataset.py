@@ -0,0 +1,173 @@
+import hashlib
+import json
+from pathlib import Path
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (needed by DataFrame.to_parquet / read_parquet)
+    CACHE_FORMAT = "parquet"
+except ImportError:
+    CACHE_FORMAT = "pickle"
+
+
+# Parse-once access to the raw CSV files
+#
+# Every raw file is parsed at most once per process, with an explicit column
+# list and dtypes (columns the loader never uses, such as client_name in the
+# bills file, are not read at all). The parsed frame is also written to a
+# columnar cache next to a small manifest holding the CSV's size, mtime and
+# SHA-256, so reruns on unchanged inputs skip CSV parsing entirely.
+#
+# Values are read as text: the transforms in load_electrogrid.py do the
+# typing (to_datetime / to_numeric with errors="coerce"), so a malformed value
+# becomes NULL instead of failing the whole read.
+
+RAW_FILES = {
+    "clients": {
+        "file": "clients_raw.csv",
+        "dtypes": {
+            "client_id": "str",
+            "client_name": "str",
+            "email": "str",
+            "phone": "str",
+            "address": "str",
+        },
+    },
+    "technicians": {
+        "file": "technicians_raw.csv",
+        "dtypes": {
+            "technician_id": "str",
+            "technician_name": "str",
+            "email": "str",
+            "phone": "str",
+            "region": "str",
+            "skills": "str",
+        },
+    },
+    "connections": {
+        "file": "connections_raw.csv",
+        "dtypes": {
+            "connection_id": "str",
+            "client_id": "str",
+            "property_address": "str",
+            "connection_type": "str",
+            "install_date": "str",
+            "meter_serial": "str",
+            "status": "str",
+            "technician_id": "str",
+        },
+    },
+    "service_orders": {
+        "file": "service_orders_raw.csv",
+        "dtypes": {
+            "service_order_id": "str",
+            "connection_id": "str",
+            "client_id": "str",
+            "technician_id": "str",
+            "service_type": "str",
+            "start_date": "str",
+            "end_date": "str",
+            "notes": "str",
+        },
+    },
+    "bills": {
+        "file": "bills_raw.csv",
+        "dtypes": {
+            "bill_id": "str",
+            "connection_id": "str",
+            "client_id": "str",
+            "period_start": "str",
+            "period_end": "str",
+            "kwh_used": "str",
+            "amount": "str",
+            "issue_date": "str",
+            "payment_date": "str",
+        },
+    },
+}
+
+CSV_DIR = Path("./raw_data")
+CACHE_DIR = Path("./.cache/raw")
+
+_parsed = {}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def csv_path(name, csv_dir=CSV_DIR):
+    return Path(csv_dir) / RAW_FILES[name]["file"]
+
+
+def read_csv(name, csv_dir=CSV_DIR, **kwargs):
+    """Parse a raw CSV with its declared columns and dtypes (no cache)."""
+    dtypes = RAW_FILES[name]["dtypes"]
+    return pd.read_csv(csv_path(name, csv_dir), usecols=list(dtypes), dtype=dtypes, **kwargs)
+
+
+def read_chunks(name, chunksize, columns=None, csv_dir=CSV_DIR):
+    """Iterate over a raw CSV `chunksize` rows at a time, for files too large to hold in memory."""
+    dtypes = RAW_FILES[name]["dtypes"]
+    if columns is not None:
+        dtypes = {c: dtypes[c] for c in columns}
+    return pd.read_csv(csv_path(name, csv_dir), usecols=list(dtypes), dtype=dtypes, chunksize=chunksize)
+
+
+def cache_is_fresh(path, manifest):
+    """True when the manifest still describes the CSV at `path`."""
+    stat = path.stat()
+    if manifest.get("format") != CACHE_FORMAT or manifest.get("size") != stat.st_size:
+        return False
+    if manifest.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    # Same size, different mtime (e.g. the file was copied again): compare contents
+    return manifest.get("sha256") == file_sha256(path)
+
+
+def load(name, csv_dir=CSV_DIR, cache_dir=CACHE_DIR):
+    """Return the parsed raw file `name`, from memory, from the columnar cache or from the CSV.
+
+    The returned DataFrame is shared between callers and must not be modified in place.
+    """
+    path = csv_path(name, csv_dir)
+    memo_key = (str(path.resolve()), name)
+    if memo_key in _parsed:
+        return _parsed[memo_key]
+
+    cache_dir = Path(cache_dir)
+    data_file = cache_dir / f"{name}.{CACHE_FORMAT}"
+    manifest_file = cache_dir / f"{name}.json"
+
+    manifest = json.loads(manifest_file.read_text()) if manifest_file.exists() else {}
+    fresh = (data_file.exists()
+             and manifest.get("source") == str(path.resolve())
+             and cache_is_fresh(path, manifest))
+
+    if fresh:
+        df = pd.read_parquet(data_file) if CACHE_FORMAT == "parquet" else pd.read_pickle(data_file)
+    else:
+        df = read_csv(name, csv_dir)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        if CACHE_FORMAT == "parquet":
+            df.to_parquet(data_file, index=False)
+        else:
+            df.to_pickle(data_file)
+
+    stat = path.stat()
+    if not fresh or manifest["mtime_ns"] != stat.st_mtime_ns:
+        manifest_file.write_text(json.dumps({
+            "source": str(path.resolve()),
+            "format": CACHE_FORMAT,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": file_sha256(path),
+        }, indent=2))
+
+    _parsed[memo_key] = df
+    return df
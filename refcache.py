@@ -0,0 +1,246 @@
+import os
+import select
+import threading
+import time
+import traceback
+from collections import OrderedDict
+
+import psycopg2
+
+from db import CONNECTION_ERRORS, connect_args, connection
+
+
+# In-process cache for reference data
+#
+# Regions, statuses, connection types, service types and the technician
+# roster of each region change rarely but are read on almost every action,
+# so they are read through a cache: the first lookup queries the database,
+# later ones are answered from memory.
+#
+# The cache is an LRU bounded to CACHE_SIZE entries, and every entry expires
+# CACHE_TTL seconds after it was read. Changes are pushed rather than waited
+# for: triggers in electrogrid.sql send a NOTIFY on the CHANNEL channel, with
+# the table name as payload, whenever one of those tables (or the person row
+# of a technician) changes. A background thread LISTENs on its own connection
+# and drops the affected entries as soon as the change commits. If that
+# connection is lost, notifications may have been missed, so the whole cache
+# is cleared when it reconnects; the TTL bounds staleness in the meantime.
+
+CACHE_SIZE = int(os.environ.get("ELECTROGRID_CACHE_SIZE", 256))
+CACHE_TTL = float(os.environ.get("ELECTROGRID_CACHE_TTL", 300))
+
+CHANNEL = "electrogrid_reference"
+RECONNECT_DELAY = 5
+
+# Reference tables and the query for each (one value per row)
+REFERENCE_QUERIES = {
+    "region": "SELECT region_name FROM electrogrid.region ORDER BY region_name;",
+    "status": "SELECT status FROM electrogrid.status ORDER BY status;",
+    "connection_type": "SELECT connection_type FROM electrogrid.connection_type ORDER BY connection_type;",
+    "service_type": "SELECT service_type FROM electrogrid.service_type ORDER BY service_type;",
+}
+
+TECHNICIANS_BY_REGION = """
+    SELECT t.person_id, p.name, p.email, p.phone, t.region_name
+    FROM electrogrid.technician AS t
+    JOIN electrogrid.person AS p
+      ON t.person_id = p.person_id
+    WHERE t.region_name = %s
+    ORDER BY p.name;
+"""
+
+# Cache entries are keyed (kind, ...); a change to a table drops these kinds
+INVALIDATES = {
+    "region": ["region"],
+    "status": ["status"],
+    "connection_type": ["connection_type"],
+    "service_type": ["service_type"],
+    "technician": ["roster"],
+}
+
+
+class TTLCache:
+    """Thread-safe LRU mapping with at most `maxsize` entries, each expiring `ttl` seconds after it was stored."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # bumped by every invalidation, so a load that overlapped one is not stored
+        self.generation = 0
+
+    def get(self, key):
+        """(True, value) for a live entry, (False, None) otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, entry[1]
+
+    def put(self, key, value, generation=None):
+        """Store `value`, unless the cache was invalidated since `generation` was read."""
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key, load):
+        """The cached value for `key`, or load() stored under it."""
+        found, value = self.get(key)
+        if found:
+            return value
+        generation = self.generation
+        value = load()
+        self.put(key, value, generation)
+        return value
+
+    def invalidate(self, kinds):
+        """Drop every entry whose key starts with one of `kinds`."""
+        with self._lock:
+            self.generation += 1
+            for key in [k for k in self._entries if k[0] in kinds]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+
+class ChangeListener(threading.Thread):
+    """Background thread that LISTENs for reference-data changes and invalidates the cache.
+
+    Subclasses listen on another `channel` by overriding changed(), reset() and disconnected().
+    """
+
+    channel = CHANNEL
+    description = "Reference cache"
+
+    def __init__(self, cache, poll_interval=1.0, name="refcache-listener"):
+        super().__init__(name=name, daemon=True)
+        self.cache = cache
+        self.poll_interval = poll_interval
+        self.listening = threading.Event()
+        self._stopping = threading.Event()
+
+    def changed(self, payloads):
+        """Handle the payloads of the notifications that arrived together."""
+        for payload in payloads:
+            self.cache.invalidate(INVALIDATES.get(payload, []))
+
+    def reset(self):
+        """Called once listening starts, since changes made before were not seen."""
+        self.cache.clear()
+
+    def disconnected(self):
+        self.cache.clear()
+
+    def run(self):
+        while not self._stopping.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(**connect_args())
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {self.channel};")
+                self.reset()
+                self.listening.set()
+                while not self._stopping.is_set():
+                    if select.select([conn], [], [], self.poll_interval)[0]:
+                        conn.poll()
+                        payloads = [notify.payload for notify in conn.notifies]
+                        conn.notifies.clear()
+                        if payloads:
+                            self.changed(payloads)
+            except CONNECTION_ERRORS as e:
+                self.listening.clear()
+                self.disconnected()
+                reason = str(e).strip().splitlines()[0] if str(e).strip() else type(e).__name__
+                print(f" {self.description} listener disconnected ({reason}); retrying in {RECONNECT_DELAY}s")
+                self._stopping.wait(RECONNECT_DELAY)
+            except Exception:
+                # a failed query or handler would otherwise end the thread and leave the data stale for good
+                self.listening.clear()
+                self.disconnected()
+                print(f" {self.description} listener failed; retrying in {RECONNECT_DELAY}s")
+                traceback.print_exc()
+                self._stopping.wait(RECONNECT_DELAY)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+class ReferenceCache:
+    """Read-through cache of the reference tables and the technician roster of each region."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL, listen=True):
+        self.cache = TTLCache(maxsize, ttl)
+        self.listener = None
+        if listen:
+            self.listener = ChangeListener(self.cache)
+            self.listener.start()
+
+    def _query(self, query, params=None):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    def values(self, table):
+        """All values of a reference table (region, status, connection_type, service_type), sorted."""
+        return self.cache.get_or_load(
+            (table,), lambda: [row[0] for row in self._query(REFERENCE_QUERIES[table])])
+
+    def regions(self):
+        return self.values("region")
+
+    def statuses(self):
+        return self.values("status")
+
+    def connection_types(self):
+        return self.values("connection_type")
+
+    def service_types(self):
+        return self.values("service_type")
+
+    def technicians(self, region_name):
+        """(person_id, name, email, phone, region_name) of the technicians in a region, by name."""
+        return self.cache.get_or_load(
+            ("roster", region_name), lambda: self._query(TECHNICIANS_BY_REGION, (region_name,)))
+
+    def close(self):
+        if self.listener is not None:
+            self.listener.stop()
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def get_reference_cache():
+    """The process-wide reference cache, created (and its listener started) on first use."""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = ReferenceCache()
+        return _shared_cache
+
+
+def close_reference_cache():
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is not None:
+            _shared_cache.close()
+            _shared_cache = None
@@ -0,0 +1,125 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import raw_dataset
+import schema
+import transforms
+from copy_load import copy_dataframe
+from incremental import reset_state
+
+
+# Parallel, dependency-aware loading
+#
+# Every table is transformed and staged concurrently; the foreign-key graph
+# parsed from electrogrid.sql only decides the order of the final inserts:
+#
+#   1. every table's pandas transform runs in a process pool;
+#   2. as soon as a table is transformed it is copied into an UNLOGGED
+#      staging table over one of several connections; the staging tables are
+#      created with LIKE and carry no foreign keys, so they load in any order;
+#   3. once everything is staged, one transaction on the caller's connection
+#      truncates the live tables and inserts the staged rows in foreign-key
+#      order, where the constraints are checked.
+#
+# If any transform or staging load fails, the live tables are never touched.
+# Step 3 copies rows instead of renaming the staging tables into place: the
+# live tables are referenced by foreign keys, which would keep pointing at the
+# old tables after a rename. TRUNCATE fires the statement-level TRUNCATE
+# triggers once (the bill rollups are cleared by bill_rollup_truncate) instead
+# of a DELETE trigger over every old row; it takes an ACCESS EXCLUSIVE lock, so
+# readers wait for the publish to commit rather than seeing the old rows.
+
+
+def stage_schema(schema_name):
+    return f"{schema_name}_stage"
+
+
+def create_staging_tables(conn, schema_name, tables):
+    stage = stage_schema(schema_name)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {stage} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {stage};")
+        for table in tables:
+            cur.execute(f"CREATE UNLOGGED TABLE {stage}.{table} (LIKE {schema_name}.{table});")
+    conn.commit()
+
+
+def drop_staging_tables(conn, schema_name):
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {stage_schema(schema_name)} CASCADE;")
+    conn.commit()
+
+
+def publish(conn, schema_name, order):
+    """Swap the staged rows into the live tables in a single transaction."""
+    stage = stage_schema(schema_name)
+    start = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"TRUNCATE {', '.join(f'{schema_name}.{t}' for t in order)};")
+            for table in order:
+                columns = ", ".join(schema.TABLES[table]["columns"])
+                cur.execute(f"INSERT INTO {schema_name}.{table} ({columns}) "
+                            f"SELECT {columns} FROM {stage}.{table};")
+            reset_state(cur, schema_name)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    print(f" Published {len(order)} tables in {time.perf_counter() - start:.3f}s")
+
+
+def parallel_load(connect, csv_dir, schema_name, jobs):
+    """Transform and load every table with `jobs` processes and `jobs` connections, all-or-nothing.
+
+    connect -- function returning a new psycopg2 connection
+    """
+    tables = list(transforms.TRANSFORMS)
+    order = schema.load_order(tables)
+    stage = stage_schema(schema_name)
+
+    # Parse (or read from the cache) every raw file once before the workers
+    # start, so they do not race to write the same cache files.
+    for name in raw_dataset.RAW_FILES:
+        raw_dataset.load(name, csv_dir)
+
+    conn = connect()
+    create_staging_tables(conn, schema_name, tables)
+
+    local = threading.local()
+    worker_connections = []
+
+    def stage_table(table, df):
+        if not hasattr(local, "conn"):
+            local.conn = connect()
+            worker_connections.append(local.conn)
+        start = time.perf_counter()
+        with local.conn.cursor() as cur:
+            copy_dataframe(cur, f"{stage}.{table}", df)
+        local.conn.commit()
+        return len(df), time.perf_counter() - start
+
+    try:
+        with ProcessPoolExecutor(jobs) as processes, ThreadPoolExecutor(jobs) as threads:
+            transforming = {processes.submit(transforms.build, t, csv_dir): t for t in tables}
+            loading = {}
+
+            while transforming or loading:
+                finished, _ = wait(list(transforming) + list(loading), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in transforming:
+                        table = transforming.pop(future)
+                        loading[threads.submit(stage_table, table, future.result())] = table
+                    else:
+                        table = loading.pop(future)
+                        rows, elapsed = future.result()
+                        rate = rows / elapsed if elapsed > 0 else float("inf")
+                        print(f" Staged {table}: {rows} rows in {elapsed:.3f}s ({rate:,.0f} rows/sec)")
+
+        publish(conn, schema_name, order)
+    finally:
+        for worker_conn in worker_connections:
+            worker_conn.close()
+        drop_staging_tables(conn, schema_name)
+        conn.close()
@@ -0,0 +1,117 @@
+import re
+from pathlib import Path
+
+
+# Table definitions read from electrogrid.sql
+#
+# electrogrid.sql is the single source of truth for the schema. This module
+# parses its CREATE TABLE statements so the loader can look up column lists,
+# types, keys and foreign-key dependencies instead of repeating them in Python.
+
+SQL_FILE = Path(__file__).with_name("electrogrid.sql")
+
+CONSTRAINT_WORDS = ("PRIMARY", "UNIQUE", "FOREIGN", "CHECK", "CONSTRAINT")
+
+
+def split_top_level(body):
+    """Split a CREATE TABLE body on the commas that are not inside parentheses."""
+    parts, depth, current = [], 0, ""
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def parse_schema(path=SQL_FILE):
+    """Return {table: {"columns": [...], "primary_key": [...], "references": {column: table}, ...}}.
+
+    Besides those, every table has "types" ({column: declared type, upper case}),
+    "not_null" (columns declared NOT NULL or part of the primary key), "unique"
+    (columns declared UNIQUE) and "reference_columns" ({column: referenced
+    column}, the parent's primary key when the REFERENCES clause names none)
+    and "partition_key" (the column of PARTITION BY RANGE, or None). All names
+    are lower case.
+    """
+    sql = Path(path).read_text()
+    sql = re.sub(r"--[^\n]*", "", sql)
+
+    tables = {}
+    statements = r"CREATE TABLE\s+(\w+)\s*\((.*?)\)\s*(?:PARTITION\s+BY\s+\w+\s*\((\w+)\))?\s*;"
+    for name, body, partition_key in re.findall(statements, sql, flags=re.S | re.I):
+        columns, primary_key, references = [], [], {}
+        types, not_null, unique, reference_columns = {}, [], [], {}
+        for item in split_top_level(body):
+            words = item.split()
+            if words[0].upper() == "PRIMARY":
+                primary_key = [c.strip().lower() for c in re.search(r"\((.*?)\)", item).group(1).split(",")]
+            elif words[0].upper() not in CONSTRAINT_WORDS:
+                column = words[0].lower()
+                columns.append(column)
+                types[column] = words[1].upper()
+                if re.search(r"\bPRIMARY\s+KEY\b", item, flags=re.I):
+                    primary_key = [column]
+                if re.search(r"\bNOT\s+NULL\b", item, flags=re.I):
+                    not_null.append(column)
+                if re.search(r"\bUNIQUE\b", item, flags=re.I):
+                    unique.append(column)
+                parent = re.search(r"\bREFERENCES\s+(\w+)\s*(?:\((\w+)\))?", item, flags=re.I)
+                if parent:
+                    references[column] = parent.group(1).lower()
+                    if parent.group(2):
+                        reference_columns[column] = parent.group(2).lower()
+        tables[name.lower()] = {
+            "columns": columns,
+            "primary_key": primary_key,
+            "references": references,
+            "types": types,
+            "not_null": not_null + [c for c in primary_key if c not in not_null],
+            "unique": unique,
+            "reference_columns": reference_columns,
+            "partition_key": partition_key.lower() or None,
+        }
+
+    for table in tables.values():
+        for column, parent in table["references"].items():
+            if column not in table["reference_columns"]:
+                table["reference_columns"][column] = tables[parent]["primary_key"][0]
+    return tables
+
+
+def dependencies(table, tables=None):
+    """Tables that `table` references (self-references are ignored)."""
+    tables = TABLES if tables is None else tables
+    return {parent for parent in tables[table]["references"].values() if parent != table}
+
+
+def load_waves(names, tables=None):
+    """Group `names` into waves: every table comes after all tables it references.
+
+    Tables in the same wave do not depend on each other and can be loaded at the same time.
+    """
+    remaining = list(names)
+    done, waves = set(), []
+    while remaining:
+        wave = [t for t in remaining if dependencies(t, tables) & set(names) <= done]
+        if not wave:
+            raise ValueError(f"Foreign-key cycle between tables: {', '.join(remaining)}")
+        waves.append(wave)
+        done.update(wave)
+        remaining = [t for t in remaining if t not in done]
+    return waves
+
+
+def load_order(names, tables=None):
+    """`names` sorted so every table comes after the tables it references."""
+    return [t for wave in load_waves(names, tables) for t in wave]
+
+
+TABLES = parse_schema()
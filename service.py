@@ -0,0 +1,479 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import traceback
+from datetime import date
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool, PoolTimeout
+
+import db
+import dispatch
+import electrogrid
+import instrumentation
+import refcache
+
+
+# Asynchronous HTTP/JSON service for the electrogrid operations
+#
+# Exposes the menu actions of electrogrid.py to other programs (dispatch,
+# call-center tools) over HTTP with JSON bodies:
+#
+#   GET  /clients?phone=912345678           client profile (client, active connections, service orders)
+#   POST /clients                           {"clients": [{"name", "email", "phone", "address"}, ...]}
+#   GET  /regions                           region names
+#   GET  /technicians?region=Porto          technicians of a region
+#   GET  /dispatch?region=Porto&skills=Repair,Installation&limit=5
+#                                           technicians with those skills, fewest open orders first
+#   GET  /meter-checks?date_from=&date_to=&technician_id=&region=&after_date=&after_id=&limit=
+#   GET  /health
+#   GET  /metrics                           query latency histograms and slow queries (instrumentation.py)
+#
+# One process serves many clients at once: requests run as asyncio tasks on
+# a single event loop, and every database call goes through psycopg 3's
+# AsyncConnectionPool, so a request waiting for PostgreSQL does not block the
+# others. The queries are the ones electrogrid.py runs; psycopg prepares
+# statements on the server by itself once a connection has run them a few
+# times. Regions and rosters are served from a refcache.TTLCache kept fresh
+# by LISTEN/NOTIFY on an async connection, like the menu's cache, and
+# /dispatch answers from a dispatch.DispatchIndex kept current the same way.
+#
+# The server speaks just enough HTTP/1.1 for JSON clients (Content-Length
+# bodies, keep-alive). Database settings come from the PG* environment
+# variables and the pool size from ELECTROGRID_POOL_MIN / _MAX (see db.py).
+
+SERVICE_HOST = os.environ.get("ELECTROGRID_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("ELECTROGRID_SERVICE_PORT", 8080))
+
+MAX_BODY = 1 << 20
+MAX_PAGE_SIZE = 1000
+# Seconds a keep-alive connection may stay idle between requests
+IDLE_TIMEOUT = 30
+
+# psycopg 3 takes %s placeholders and prepares repeated statements itself
+CLIENT_PROFILE = electrogrid.CLIENT_PROFILE.replace("$1", "%s")
+
+PROFILE_FIELDS = {
+    "client": ["person_id", "name", "phone", "email", "address"],
+    "connections": ["connection_id", "property_address", "install_date", "meter_serial", "connection_type", "status"],
+    "service_orders": ["service_order_id", "connection_id", "service_type", "start_date", "end_date", "notes",
+                       "technician_id"],
+}
+TECHNICIAN_FIELDS = ["person_id", "name", "email", "phone", "region"]
+CANDIDATE_FIELDS = ["person_id", "name", "open_orders"]
+
+RESULT_SIZE = instrumentation.result_size_function("psycopg_binary.pq", "psycopg_c.pq")
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class RequestError(Exception):
+    """An error to report to the client with an HTTP status."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def to_json(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def parse_date(params, name):
+    text = params.get(name)
+    if not text:
+        return None
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise RequestError(400, f"{name} must be a date (YYYY-MM-DD)")
+
+
+class InstrumentedAsyncCursor(psycopg.AsyncCursor):
+    """AsyncCursor that records its statements in instrumentation.METRICS, like instrumentation.InstrumentedCursor."""
+
+    async def execute(self, query, params=None, **kwargs):
+        if not instrumentation.INSTRUMENT:
+            return await super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        error = True
+        try:
+            result = await super().execute(query, params, **kwargs)
+            error = False
+            return result
+        finally:
+            seconds = time.perf_counter() - start
+            text = query if isinstance(query, str) else query.as_string(self)
+            pgresult = self.pgresult
+            bytes_in = RESULT_SIZE(pgresult.pgresult_ptr) if not error and pgresult is not None and RESULT_SIZE else 0
+            statement = instrumentation.normalize(text)
+            instrumentation.METRICS.record(statement, seconds, max(self.rowcount, 0), len(text.encode()), bytes_in,
+                                           error)
+            if instrumentation.SLOW_QUERY_MS is not None and seconds * 1e3 >= instrumentation.SLOW_QUERY_MS:
+                explain = instrumentation.explain_command(text)
+                plan = await self._explain(explain + text, params) if not error and explain else None
+                instrumentation.METRICS.record_slow(
+                    instrumentation.slow_entry(text, seconds, self.rowcount, statement, plan))
+
+    async def _explain(self, query, params):
+        """Run the EXPLAIN `query` (see instrumentation.explain_command) in a transaction that is rolled back."""
+        try:
+            async with self.connection.transaction(force_rollback=True):
+                # a plain cursor, so the EXPLAIN is not recorded itself
+                cur = psycopg.AsyncCursor(self.connection)
+                await cur.execute(query, params)
+                return "\n".join(row[0] for row in await cur.fetchall())
+        except psycopg.Error as e:
+            return f"(no plan: {e})"
+
+
+class ReferenceData:
+    """Regions and technician rosters, cached and invalidated by NOTIFY like refcache.ReferenceCache."""
+
+    def __init__(self, pool, conninfo):
+        self.pool = pool
+        self.conninfo = conninfo
+        self.cache = refcache.TTLCache()
+
+    async def _get(self, key, query, params=None, shape=list):
+        found, value = self.cache.get(key)
+        if found:
+            return value
+        generation = self.cache.generation
+        async with self.pool.connection() as conn:
+            rows = await (await conn.execute(query, params)).fetchall()
+        value = shape(rows)
+        self.cache.put(key, value, generation)
+        return value
+
+    async def regions(self):
+        return await self._get(("region",), refcache.REFERENCE_QUERIES["region"],
+                               shape=lambda rows: [row[0] for row in rows])
+
+    async def technicians(self, region_name):
+        return await self._get(("roster", region_name), refcache.TECHNICIANS_BY_REGION, (region_name,),
+                               shape=lambda rows: [dict(zip(TECHNICIAN_FIELDS, row)) for row in rows])
+
+    async def listen(self):
+        """Invalidate cached entries on every change notification, reconnecting when needed."""
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {refcache.CHANNEL};")
+                    # changes made while nobody was listening were not seen
+                    self.cache.clear()
+                    async for notify in conn.notifies():
+                        self.cache.invalidate(refcache.INVALIDATES.get(notify.payload, []))
+            except psycopg.OperationalError as e:
+                self.cache.clear()
+                print(f" Reference listener disconnected ({e}); retrying in {refcache.RECONNECT_DELAY}s")
+                await asyncio.sleep(refcache.RECONNECT_DELAY)
+            except Exception:
+                # anything else would end the task, and cached entries would only expire by TTL
+                self.cache.clear()
+                print(f" Reference listener failed; retrying in {refcache.RECONNECT_DELAY}s")
+                traceback.print_exc()
+                await asyncio.sleep(refcache.RECONNECT_DELAY)
+
+
+class DispatchData:
+    """The dispatch index, built and kept current from NOTIFY like dispatch.DispatchListener."""
+
+    def __init__(self, pool, conninfo):
+        self.pool = pool
+        self.conninfo = conninfo
+        self.index = dispatch.DispatchIndex()
+        self.loaded = asyncio.Event()
+
+    async def load(self):
+        async with self.pool.connection() as conn, conn.transaction():
+            # one snapshot, so the roster holds no skill that the skill list lacks
+            await conn.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY;")
+            skills = [row[0] for row in await (await conn.execute(dispatch.SKILLS)).fetchall()]
+            roster = await (await conn.execute(dispatch.ROSTER)).fetchall()
+            counts = dict(await (await conn.execute(dispatch.OPEN_ORDERS)).fetchall())
+        self.index.build(skills, roster, counts)
+        self.loaded.set()
+
+    async def refresh(self, technicians):
+        async with self.pool.connection() as conn:
+            if technicians is None:
+                rows = await (await conn.execute(dispatch.OPEN_ORDERS)).fetchall()
+            else:
+                rows = await (await conn.execute(dispatch.OPEN_ORDERS_OF, (list(technicians),))).fetchall()
+        self.index.set_open_orders(dict(rows), technicians)
+
+    async def ready(self):
+        """The index, once it has been built."""
+        try:
+            await asyncio.wait_for(self.loaded.wait(), db.CHECKOUT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise RequestError(503, "the dispatch index is not loaded yet")
+        return self.index
+
+    async def listen(self):
+        """Build the index, then apply every change notification, rebuilding after a reconnect."""
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.conninfo, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {dispatch.CHANNEL};")
+                    # changes made while nobody was listening were not seen
+                    await self.load()
+                    async for notify in conn.notifies():
+                        rebuild, technicians = dispatch.changes([notify.payload])
+                        if rebuild:
+                            await self.load()
+                        elif technicians is None or technicians:
+                            await self.refresh(technicians)
+            except (psycopg.OperationalError, PoolTimeout) as e:
+                print(f" Dispatch listener disconnected ({e}); retrying in {refcache.RECONNECT_DELAY}s")
+                await asyncio.sleep(refcache.RECONNECT_DELAY)
+            except Exception:
+                # anything else would end the task and leave the index stale for good
+                print(f" Dispatch listener failed; retrying in {refcache.RECONNECT_DELAY}s")
+                traceback.print_exc()
+                await asyncio.sleep(refcache.RECONNECT_DELAY)
+
+
+class ElectrogridService:
+    def __init__(self, pool, conninfo):
+        self.pool = pool
+        self.reference = ReferenceData(pool, conninfo)
+        self.dispatch_data = DispatchData(pool, conninfo)
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("GET", "/clients"): self.client_profile,
+            ("POST", "/clients"): self.insert_clients,
+            ("GET", "/regions"): self.regions,
+            ("GET", "/technicians"): self.technicians,
+            ("GET", "/dispatch"): self.dispatch_candidates,
+            ("GET", "/meter-checks"): self.meter_checks,
+            ("GET", "/metrics"): self.metrics,
+        }
+
+    #----- Operations -----#
+
+    async def health(self, params, body):
+        async with self.pool.connection() as conn:
+            await conn.execute("SELECT 1;")
+        return 200, {"status": "ok", "pool": self.pool.get_stats()}
+
+    async def client_profile(self, params, body):
+        phone = electrogrid.phone_number(params.get("phone", ""))
+        if phone is None:
+            raise RequestError(400, "phone is required")
+        async with self.pool.connection() as conn:
+            row = await (await conn.execute(CLIENT_PROFILE, (phone,))).fetchone()
+        if row is None:
+            raise RequestError(404, "no client with that phone number")
+        client, connections, service_orders = row
+        return 200, {
+            "client": dict(zip(PROFILE_FIELDS["client"], client)),
+            "connections": [dict(zip(PROFILE_FIELDS["connections"], c)) for c in connections],
+            "service_orders": [dict(zip(PROFILE_FIELDS["service_orders"], s)) for s in service_orders],
+        }
+
+    async def insert_clients(self, params, body):
+        clients = body.get("clients", [body]) if isinstance(body, dict) else None
+        if not clients or not all(isinstance(c, dict) and c.get("name") and c.get("address") for c in clients):
+            raise RequestError(400, 'expected {"clients": [{"name", "email", "phone", "address"}, ...]}')
+
+        columns = (
+            [c["name"] for c in clients],
+            [c.get("email") for c in clients],
+            [electrogrid.phone_number(str(c["phone"])) if c.get("phone") else None for c in clients],
+            [c["address"] for c in clients],
+        )
+        async with self.pool.connection() as conn, conn.transaction():
+            rows = await (await conn.execute(electrogrid.INSERT_CLIENTS, columns)).fetchall()
+        return 201, {"ids": [row[0] for row in rows]}
+
+    async def regions(self, params, body):
+        return 200, {"regions": await self.reference.regions()}
+
+    async def technicians(self, params, body):
+        region = params.get("region")
+        if region not in await self.reference.regions():
+            raise RequestError(404, f"unknown region: {region}")
+        return 200, {"region": region, "technicians": await self.reference.technicians(region)}
+
+    async def dispatch_candidates(self, params, body):
+        try:
+            limit = min(int(params.get("limit", dispatch.DISPATCH_LIMIT)), MAX_PAGE_SIZE)
+        except ValueError:
+            raise RequestError(400, "limit must be a number")
+        skills = [skill.strip() for skill in params.get("skills", "").split(",") if skill.strip()]
+        index = await self.dispatch_data.ready()
+        region = params.get("region")
+        if region not in index.regions():
+            raise RequestError(404, f"unknown region: {region}")
+        unknown = [skill for skill in skills if skill not in index.skills()]
+        if unknown:
+            raise RequestError(404, f"unknown skill: {', '.join(unknown)}")
+        rows = index.candidates(region, skills, limit)
+        return 200, {"region": region, "skills": skills,
+                     "technicians": [dict(zip(CANDIDATE_FIELDS, row)) for row in rows]}
+
+    async def meter_checks(self, params, body):
+        try:
+            limit = min(int(params.get("limit", electrogrid.PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            raise RequestError(400, "limit must be a number")
+        after = None
+        if params.get("after_date") or params.get("after_id"):
+            if not (params.get("after_date") and params.get("after_id")):
+                raise RequestError(400, "after_date and after_id go together")
+            after = (parse_date(params, "after_date"), params["after_id"])
+
+        query, values = electrogrid.meter_checks_query(
+            date_from=parse_date(params, "date_from"),
+            date_to=parse_date(params, "date_to"),
+            technician_id=params.get("technician_id") or None,
+            region=params.get("region") or None,
+            after=after,
+            limit=limit,
+        )
+        async with self.pool.connection() as conn:
+            cur = conn.cursor(row_factory=dict_row)
+            rows = await (await cur.execute(query, values)).fetchall()
+
+        # the keyset of the last row is where the next page starts
+        last = rows[-1] if len(rows) == limit else None
+        return 200, {
+            "meter_checks": rows,
+            "next": {"after_date": last["check_date"], "after_id": last["check_id"]} if last else None,
+        }
+
+    async def metrics(self, params, body):
+        return 200, instrumentation.METRICS.snapshot()
+
+    #----- HTTP -----#
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            allowed = any(path == url.path for _, path in self.routes)
+            raise RequestError(405 if allowed else 404, f"{method} {url.path} is not supported")
+        try:
+            return await handler(params, body)
+        except psycopg.errors.UniqueViolation as e:
+            raise RequestError(409, e.diag.message_detail or str(e))
+        except (psycopg.errors.DataError, psycopg.errors.IntegrityError) as e:
+            raise RequestError(400, e.diag.message_primary or str(e))
+        except PoolTimeout:
+            raise RequestError(503, "all database connections are busy")
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one client connection until it closes."""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+
+                headers = {}
+                while (line := await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    method = target = None
+                    version = "HTTP/1.0"
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                try:
+                    if method is None:
+                        raise RequestError(400, "malformed request line")
+                    length = headers.get("content-length", "0")
+                    if not length.isdigit():
+                        keep_alive = False
+                        raise RequestError(400, "invalid Content-Length")
+                    if int(length) > MAX_BODY:
+                        keep_alive = False
+                        raise RequestError(413, "request body too large")
+                    raw = await reader.readexactly(int(length)) if int(length) else b""
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError:
+                        raise RequestError(400, "request body is not valid JSON")
+                    status, payload = await self.dispatch(method, target, body)
+                except RequestError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except asyncio.IncompleteReadError:
+                    raise
+                except Exception as e:
+                    print(f"Error: {e!r}")
+                    status, payload = 500, {"error": "internal error"}
+
+                data = json.dumps(payload, default=to_json).encode("utf-8")
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host=SERVICE_HOST, port=SERVICE_PORT, on_ready=None):
+    """Run the service until cancelled. `on_ready(port)` is called once it accepts requests."""
+    conninfo = make_conninfo(**db.connect_args())
+    # lookups are single statements, so the connections run in autocommit and a
+    # lookup costs one round-trip instead of BEGIN, query and COMMIT
+    pool = AsyncConnectionPool(conninfo, min_size=db.POOL_MIN, max_size=db.POOL_MAX, open=False,
+                               timeout=db.CHECKOUT_TIMEOUT,
+                               kwargs={"autocommit": True, "cursor_factory": InstrumentedAsyncCursor})
+    await pool.open(wait=True)
+    service = ElectrogridService(pool, conninfo)
+    listener = asyncio.create_task(service.reference.listen())
+    dispatch_listener = asyncio.create_task(service.dispatch_data.listen())
+    server = await asyncio.start_server(service.handle, host, port)
+    try:
+        address = server.sockets[0].getsockname()
+        print(f"Electrogrid service listening on http://{address[0]}:{address[1]}")
+        if on_ready is not None:
+            on_ready(address[1])
+        async with server:
+            await server.serve_forever()
+    finally:
+        listener.cancel()
+        dispatch_listener.cancel()
+        await pool.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve the electrogrid operations over HTTP/JSON.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Service stopped.")
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+
+import psycopg
+from psycopg.conninfo import make_conninfo
+
+import db
+import service
+
+
+# End-to-end check and load test for service.py against a local PostgreSQL
+#
+# Starts the service in this process on a free port (database from the PG*
+# environment variables), checks every endpoint once, then runs --clients
+# concurrent keep-alive clients that each send --requests client lookups by
+# phone, and reports throughput and latency:
+#
+#   PGHOST=localhost python service_check.py --clients 50 --requests 200
+#
+# Exits with status 1 if a check fails or a lookup does not return 200.
+
+
+class Client:
+    """Minimal keep-alive HTTP/1.1 client for the JSON service."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, target, body=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection("127.0.0.1", self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        self.writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n"
+                          f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        headers = {}
+        while (line := await self.reader.readline()) not in (b"\r\n", b""):
+            name, _, value = line.decode().partition(":")
+            headers[name.strip().lower()] = value.strip()
+        payload = json.loads(await self.reader.readexactly(int(headers["content-length"])))
+        if headers.get("connection") == "close":
+            self.close()
+        return status, payload
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def sample_phones():
+    async with await psycopg.AsyncConnection.connect(make_conninfo(**db.connect_args())) as conn:
+        cur = await conn.execute("""
+            SELECT p.phone FROM electrogrid.person p JOIN electrogrid.client c USING (person_id)
+            WHERE p.phone IS NOT NULL ORDER BY p.person_id;
+        """)
+        return [row[0] for row in await cur.fetchall()]
+
+
+async def check_endpoints(client, phones):
+    """Call every endpoint once. Returns the failed checks."""
+    checks = []
+
+    async def expect(name, status_wanted, method, target, body=None, test=lambda payload: True):
+        status, payload = await client.request(method, target, body)
+        ok = status == status_wanted and test(payload)
+        checks.append((name, ok))
+        if not ok:
+            print(f" FAILED {name}: {status} {payload}")
+        return payload
+
+    await expect("health", 200, "GET", "/health")
+    await expect("client lookup", 200, "GET", f"/clients?phone={phones[0]}",
+                 test=lambda p: p["client"]["phone"] == phones[0])
+    await expect("unknown phone", 404, "GET", "/clients?phone=1")
+    regions = await expect("regions", 200, "GET", "/regions", test=lambda p: len(p["regions"]) > 0)
+    await expect("technicians", 200, "GET", f"/technicians?region={regions['regions'][0]}",
+                 test=lambda p: all(t["region"] == regions["regions"][0] for t in p["technicians"]))
+    await expect("dispatch", 200, "GET", f"/dispatch?region={regions['regions'][0]}&skills=Repair&limit=3",
+                 test=lambda p: len(p["technicians"]) <= 3
+                 and [t["open_orders"] for t in p["technicians"]] == sorted(t["open_orders"] for t in p["technicians"]))
+    await expect("unknown skill", 404, "GET", f"/dispatch?region={regions['regions'][0]}&skills=Juggling")
+    page = await expect("meter checks", 200, "GET", "/meter-checks?limit=5", test=lambda p: len(p["meter_checks"]) <= 5)
+    if page.get("next"):
+        following = page["next"]
+        await expect("meter checks, next page", 200, "GET",
+                     f"/meter-checks?limit=5&after_date={following['after_date']}&after_id={following['after_id']}",
+                     test=lambda p: all(r["check_id"] not in {c["check_id"] for c in page["meter_checks"]}
+                                        for r in p["meter_checks"]))
+    await expect("bad date", 400, "GET", "/meter-checks?date_from=yesterday")
+    await expect("bad insert", 400, "POST", "/clients", {"clients": [{"email": "x"}]})
+    await expect("unknown path", 404, "GET", "/nothing")
+    return [name for name, ok in checks if not ok]
+
+
+async def load_test(port, phones, clients, requests):
+    latencies, failures = [], 0
+
+    async def worker(n):
+        nonlocal failures
+        client = Client(port)
+        try:
+            for i in range(requests):
+                phone = phones[(n * requests + i) % len(phones)]
+                start = time.perf_counter()
+                status, _ = await client.request("GET", f"/clients?phone={phone}")
+                latencies.append(time.perf_counter() - start)
+                failures += status != 200
+        finally:
+            client.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(clients)))
+    return time.perf_counter() - start, latencies, failures
+
+
+async def main(args):
+    started = asyncio.get_running_loop().create_future()
+    server = asyncio.create_task(service.serve("127.0.0.1", 0, on_ready=started.set_result))
+    port = await started
+
+    try:
+        phones = await sample_phones()
+        client = Client(port)
+        failed = await check_endpoints(client, phones)
+        client.close()
+        print(f" Endpoint checks: {'all passed' if not failed else 'FAILED: ' + ', '.join(failed)}")
+
+        elapsed, latencies, failures = await load_test(port, phones, args.clients, args.requests)
+        latencies.sort()
+        print(f" {len(latencies)} lookups from {args.clients} concurrent clients in {elapsed:.2f}s: "
+              f"{len(latencies) / elapsed:,.0f} requests/s, "
+              f"median {statistics.median(latencies) * 1e3:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1e3:.1f} ms, {failures} failed")
+        return 0 if not failed and not failures else 1
+    finally:
+        server.cancel()
+        try:
+            await server
+        except asyncio.CancelledError:
+            pass
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Check service.py end to end and load-test client lookups.")
+    parser.add_argument("--clients", type=int, default=20, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=100, help="lookups per client")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(parse_args())))
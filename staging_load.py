@@ -0,0 +1,322 @@
+import csv
+import re
+import time
+
+import raw_dataset
+import schema
+import transforms
+from cleaning import DATE_FORMAT, SPECS
+from copy_load import copy_dataframe
+
+
+# Set-based load through raw staging tables
+#
+# The raw CSVs are copied as they are (every column as TEXT, plus the row's
+# position in the file) into UNLOGGED tables in the <schema>_raw schema.
+# Every table is then filled with one INSERT ... SELECT that applies the same
+# rules as the pandas path (cleaning.SPECS: strip, case, phone digits, dates,
+# numbers, required columns, first occurrence of each key wins) and checks the
+# rows against electrogrid.sql: NOT NULL and UNIQUE columns, VARCHAR lengths,
+# NUMERIC ranges and every foreign key, joined against the parent tables that
+# are already loaded. Rows that fail a check are not inserted: the same
+# statement writes them to <schema>.load_rejects with a reason code, so a bad
+# row never aborts the load.
+#
+# Reason codes, checked in this order:
+#   missing_value        a required or NOT NULL column is empty or unparseable
+#   duplicate_key        an earlier row has the same key
+#   unknown_<column>     the foreign key has no parent row, e.g. unknown_connection_id
+#   value_too_long       text longer than the column's VARCHAR(n)
+#   value_out_of_range   number too large for the column's NUMERIC(p,s)
+#   duplicate_<column>   an earlier accepted row has the same UNIQUE value, e.g. duplicate_email
+#
+# Phones, dates and numbers are only converted for the rows that get past the
+# checks before the one that needs them: most rejects are orphans, and
+# parsing their dates would be wasted work.
+#
+# Lookup tables (regions, statuses, ...) are the distinct cleaned values of a
+# raw column and do not produce rejects.
+
+# Strings pandas.read_csv reads as missing values; the raw tables keep them as text
+NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+             "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"]
+
+# Characters str.strip() removes
+WHITESPACE = r"E' \t\n\r\f\x0B'"
+
+# Column kinds converted late, only where a check or the final INSERT needs them
+LATE_KINDS = ("phone", "date", "number")
+
+# Raw relations: the raw table behind each one, how its rows are ordered
+# within a file, and the SQL that reads it (the technician skills are split
+# into one row per skill, like the pandas explode).
+RELATIONS = {name: {"source": name, "part": "0", "from": "{raw}." + name} for name in raw_dataset.RAW_FILES}
+RELATIONS["meter_check"] = {"source": "meter_check", "part": "0", "from": "{raw}.meter_check"}
+RELATIONS["technician_skills"] = {
+    "source": "technicians",
+    "part": "r.part",
+    "from": "(SELECT t.row_no, t.technician_id, s.skills, s.part FROM {raw}.technicians t "
+            "LEFT JOIN LATERAL regexp_split_to_table(t.skills, ',') WITH ORDINALITY AS s(skills, part) ON true)",
+}
+
+# Tables loaded row by row from raw rows: (relation, cleaning spec) pairs, in
+# priority order for duplicate keys
+SOURCES = {
+    "person": [("clients", "client_person"), ("technicians", "technician_person")],
+    "client": [("clients", "client")],
+    "technician": [("technicians", "technician")],
+    "technician_skill": [("technician_skills", "technician_skill")],
+    "connections": [("connections", "connections")],
+    "bills": [("bills", "bills")],
+    "service_orders": [("service_orders", "service_orders")],
+    "meter_check": [("meter_check", "meter_check")],
+}
+
+# Lookup tables: the distinct values of the spec column named like the table's column
+LOOKUPS = {
+    "region": ("technicians", "region"),
+    "connection_type": ("connections", "connection_type"),
+    "status": ("connections", "status"),
+    "service_type": ("service_orders", "service_type"),
+    "skills": ("technician_skills", "technician_skill"),
+}
+
+
+def raw_schema(schema_name):
+    return f"{schema_name}_raw"
+
+
+def ensure_reject_table(cur, schema_name):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.load_rejects (
+            table_name TEXT NOT NULL,
+            source TEXT NOT NULL,
+            row_no BIGINT NOT NULL,
+            reason TEXT NOT NULL,
+            row_data JSONB,
+            rejected_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        );
+    """)
+
+
+def create_raw_tables(cur, schema_name, csv_dir):
+    """Create the raw schema with one TEXT table per raw file."""
+    raw = raw_schema(schema_name)
+    cur.execute(f"DROP SCHEMA IF EXISTS {raw} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {raw};")
+
+    for name in raw_dataset.RAW_FILES:
+        with open(raw_dataset.csv_path(name, csv_dir), newline="", encoding="utf-8") as f:
+            header = next(csv.reader(f))
+        columns = ", ".join(f'"{column}" TEXT' for column in header)
+        cur.execute(f"CREATE UNLOGGED TABLE {raw}.{name} (row_no BIGINT GENERATED ALWAYS AS IDENTITY, {columns});")
+
+    columns = ", ".join(f'"{column}" TEXT' for column in SPECS["meter_check"]["columns"])
+    cur.execute(f"CREATE UNLOGGED TABLE {raw}.meter_check (row_no BIGINT GENERATED ALWAYS AS IDENTITY, {columns});")
+
+
+def copy_raw_files(cur, schema_name, csv_dir):
+    """COPY every raw CSV as it is; row_no numbers the rows in file order."""
+    raw = raw_schema(schema_name)
+    for name in raw_dataset.RAW_FILES:
+        start = time.perf_counter()
+        path = raw_dataset.csv_path(name, csv_dir)
+        with open(path, newline="", encoding="utf-8") as f:
+            columns = ", ".join(f'"{column}"' for column in next(csv.reader(f)))
+        with open(path, "rb") as f:
+            cur.copy_expert(f"COPY {raw}.{name} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+        rows = cur.rowcount
+        cur.execute(f"ANALYZE {raw}.{name};")
+        print(f" Copied {path.name} into {raw}.{name}: {rows} rows in {time.perf_counter() - start:.3f}s")
+
+    copy_dataframe(cur, f"{raw}.meter_check", transforms.build_meter_check(csv_dir))
+
+
+def text_sql(value):
+    """Stripped text of a raw value; empty strings and pandas' NA strings become NULL."""
+    na_values = ", ".join(f"'{v}'" for v in NA_VALUES)
+    return f"NULLIF(btrim(CASE WHEN {value} = ANY(ARRAY[{na_values}]) THEN NULL ELSE {value} END, {WHITESPACE}), '')"
+
+
+def date_sql(text):
+    """Like to_datetime(..., errors="coerce"): an invalid date such as 2025-02-30 becomes NULL."""
+    year, month, day = (f"split_part({text}, '-', {i})::INT" for i in (1, 2, 3))
+    leap = f"({year} % 4 = 0 AND ({year} % 100 <> 0 OR {year} % 400 = 0))"
+    days = f"CASE WHEN {month} = 2 THEN CASE WHEN {leap} THEN 29 ELSE 28 END WHEN {month} IN (4, 6, 9, 11) THEN 30 ELSE 31 END"
+    # nested CASEs: the parts are only cast once the pattern has matched
+    pattern = (f"length({text}) = 10 AND substr({text}, 5, 1) = '-' AND substr({text}, 8, 1) = '-' "
+               f"AND translate({text}, '0123456789', '') = '--'")
+    return (f"CASE WHEN {pattern} THEN CASE WHEN {year} >= 1 AND {month} BETWEEN 1 AND 12 "
+            f"AND {day} BETWEEN 1 AND {days} THEN {text}::DATE END END")
+
+
+def column_sql(spec, text):
+    """SQL expression that converts one stripped raw column the way cleaning.convert does."""
+    kind = spec["kind"]
+
+    if kind in ("id", "text"):
+        return text
+    if kind == "category":
+        case = spec.get("case")
+        return {"title": f"initcap({text})", "upper": f"upper({text})", "lower": f"lower({text})"}.get(case, text)
+    if kind == "phone":
+        return rf"NULLIF(right(regexp_replace({text}, '\D', '', 'g'), 9), '')::BIGINT"
+    if kind == "date":
+        if spec.get("format", DATE_FORMAT) != DATE_FORMAT:
+            raise ValueError(f"The staging load only reads {DATE_FORMAT} dates, not {spec['format']}")
+        return date_sql(text)
+    if kind == "number":
+        number = rf"CASE WHEN {text} ~ '^[-+]?(\d+\.?\d*|\.\d+)([eE][-+]?\d+)?$' THEN {text}::NUMERIC END"
+        return f"round({number}, {spec['decimals']})" if "decimals" in spec else number
+
+    raise ValueError(f"Unknown column kind: {kind}")
+
+
+def typed_sql(spec, name, alias="c"):
+    """The final value of column `name` of a cleaned row: converts the LATE_KINDS, which cleaned_sql leaves as text."""
+    return column_sql(spec, f"{alias}.{name}") if spec["kind"] in LATE_KINDS else f"{alias}.{name}"
+
+
+def cleaned_sql(raw, sources):
+    """SELECT of the cleaned rows of every (relation, spec) source, with their origin and order.
+
+    The inner query strips every raw value once; OFFSET 0 keeps the planner
+    from merging it into the outer one, which would repeat the stripping in
+    every place the conversions refer to the value. Columns of the LATE_KINDS
+    stay stripped text (see typed_sql).
+    """
+    selects = []
+    for priority, (relation, spec_name) in enumerate(sources):
+        info = RELATIONS[relation]
+        specs = SPECS[spec_name]["columns"]
+        texts = ", ".join(text_sql(f'r."{col["source"]}"') + f" AS {name}" for name, col in specs.items())
+        columns = ", ".join(f"s.{name}" if col["kind"] in LATE_KINDS else f"{column_sql(col, f's.{name}')} AS {name}"
+                            for name, col in specs.items())
+        selects.append(f"SELECT s.source, s.row_no, {priority} AS priority, s.part, {columns} FROM ("
+                       f"SELECT '{info['source']}' AS source, r.row_no, {info['part']} AS part, {texts} "
+                       f"FROM {info['from'].format(raw=raw)} r OFFSET 0) s")
+    return "\nUNION ALL\n".join(selects)
+
+
+def value_checks(table, values):
+    """(condition, reason) pairs for the VARCHAR lengths and NUMERIC ranges of `table`.
+
+    values -- {column: SQL expression of its value}
+    """
+    checks = []
+    for column, value in values.items():
+        declared = schema.TABLES[table]["types"][column]
+        length = re.fullmatch(r"VARCHAR\((\d+)\)", declared)
+        numeric = re.fullmatch(r"NUMERIC\((\d+),\s*(\d+)\)", declared)
+        if length:
+            checks.append((f"length({value}) > {length.group(1)}", "value_too_long"))
+        elif numeric:
+            digits = int(numeric.group(1)) - int(numeric.group(2))
+            checks.append((f"abs({value}) >= 1e{digits}", "value_out_of_range"))
+    return checks
+
+
+def insert_checked(cur, schema_name, table):
+    """Insert the rows of `table` that pass every check and record the others. Returns (inserted, rejected)."""
+    raw = raw_schema(schema_name)
+    definition = schema.TABLES[table]
+    sources = SOURCES[table]
+    spec = SPECS[sources[0][1]]
+    columns = definition["columns"]
+
+    value = {c: typed_sql(spec["columns"][c], c) for c in columns}
+
+    required = [c for c in columns if c in spec["required"] or c in definition["not_null"]]
+    key = spec["unique"]
+    missing = " OR ".join(f"{value[c]} IS NULL" for c in required) or "false"
+    order = "priority, row_no, part"
+
+    # A CASE stops at the first matching WHEN, so later checks only run on rows that passed the earlier ones
+    checks = [(missing, "missing_value"),
+              (f"row_number() OVER (PARTITION BY {', '.join(value[c] for c in key)} "
+               f"ORDER BY ({missing}), {order}) > 1", "duplicate_key")]
+    for column, parent in definition["references"].items():
+        parent_column = definition["reference_columns"][column]
+        checks.append((f"{value[column]} IS NOT NULL AND NOT EXISTS (SELECT 1 FROM {schema_name}.{parent} p "
+                       f"WHERE p.{parent_column} = {value[column]})", f"unknown_{column}"))
+    checks += value_checks(table, value)
+    reason = "CASE " + " ".join(f"WHEN {condition} THEN '{code}'" for condition, code in checks) + " END"
+
+    # UNIQUE columns are ranked among the rows that passed every other check
+    unique = [c for c in definition["unique"] if c not in key]
+    final_reason = "CASE WHEN reason IS NOT NULL THEN reason " + " ".join(
+        f"WHEN {value[c]} IS NOT NULL AND row_number() OVER (PARTITION BY reason IS NULL, {value[c]} "
+        f"ORDER BY {order}) > 1 THEN 'duplicate_{c}'" for c in unique
+    ) + " END"
+
+    # Rejects keep their raw row, looked up in the raw table of their source
+    rejected = ", ".join(f"""rejected_{i} AS (
+            INSERT INTO {schema_name}.load_rejects (table_name, source, row_no, reason, row_data)
+            SELECT '{table}', c.source, c.row_no, c.final_reason, to_jsonb(r) - 'row_no'
+            FROM candidates c JOIN {raw}.{source} r ON r.row_no = c.row_no
+            WHERE c.final_reason IS NOT NULL AND c.source = '{source}'
+        )""" for i, source in enumerate(dict.fromkeys(RELATIONS[relation]["source"] for relation, _ in sources)))
+
+    column_list = ", ".join(columns)
+    cur.execute(f"""
+        WITH cleaned AS MATERIALIZED (
+            {cleaned_sql(raw, sources)}
+        ), checked AS (
+            SELECT c.*, {reason} AS reason FROM cleaned c
+        ), candidates AS (
+            SELECT c.*, {final_reason} AS final_reason FROM checked c
+        ), {rejected}
+        INSERT INTO {schema_name}.{table} ({column_list})
+        SELECT {', '.join(value.values())} FROM candidates c WHERE final_reason IS NULL;
+    """)
+    inserted = cur.rowcount
+    cur.execute(f"SELECT count(*) FROM {schema_name}.load_rejects WHERE table_name = %s;", (table,))
+    return inserted, cur.fetchone()[0]
+
+
+def insert_lookup(cur, schema_name, table):
+    """Insert the distinct cleaned values of a lookup table. Returns (inserted, 0)."""
+    raw = raw_schema(schema_name)
+    relation, spec_name = LOOKUPS[table]
+    column = schema.TABLES[table]["columns"][0]
+    spec = SPECS[spec_name]
+    present = " AND ".join(f"c.{c} IS NOT NULL" for c in spec["required"])
+    fits = " AND ".join(f"NOT ({condition})" for condition, _ in value_checks(table, {column: f"c.{column}"})) or "true"
+    cur.execute(f"""
+        INSERT INTO {schema_name}.{table} ({column})
+        SELECT DISTINCT c.{column} FROM ({cleaned_sql(raw, [(relation, spec_name)])}) c
+        WHERE {present} AND {fits};
+    """)
+    return cur.rowcount, 0
+
+
+def print_rejects(cur, schema_name):
+    cur.execute(f"""
+        SELECT table_name, reason, count(*) FROM {schema_name}.load_rejects
+        GROUP BY table_name, reason ORDER BY table_name, reason;
+    """)
+    for table, reason, count in cur.fetchall():
+        print(f" Rejected {count} {table} rows: {reason}")
+
+
+def staging_load(cur, schema_name, csv_dir, tables):
+    """Load `tables` (in foreign-key order) from the raw CSVs through raw staging tables.
+
+    Runs in the caller's transaction. The tables are expected to be empty;
+    <schema>.load_rejects is cleared and then holds this load's rejected rows.
+    """
+    ensure_reject_table(cur, schema_name)
+    cur.execute(f"TRUNCATE {schema_name}.load_rejects;")
+    create_raw_tables(cur, schema_name, csv_dir)
+    copy_raw_files(cur, schema_name, csv_dir)
+
+    for table in tables:
+        start = time.perf_counter()
+        if table in LOOKUPS:
+            inserted, rejected = insert_lookup(cur, schema_name, table)
+        else:
+            inserted, rejected = insert_checked(cur, schema_name, table)
+        print(f" Loaded {table}: {inserted} rows, {rejected} rejected in {time.perf_counter() - start:.3f}s")
+
+    print_rejects(cur, schema_name)
+    cur.execute(f"DROP SCHEMA {raw_schema(schema_name)} CASCADE;")
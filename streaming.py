@@ -0,0 +1,56 @@
+import time
+
+import pandas as pd
+
+
+# Chunked, bounded-memory ingestion for the large fact files
+#
+# bills_raw.csv and service_orders_raw.csv grow with every monthly export, so
+# instead of reading them whole they are read `chunksize` rows at a time. Each
+# chunk is cleaned, deduplicated against the keys already seen in earlier
+# chunks, filtered against the parent key sets and flushed to the database
+# before the next chunk is read. Only the set of primary keys seen so far is
+# kept between chunks.
+
+def distinct_values(chunks, column):
+    """Return a one-column DataFrame with the distinct raw values of `column` across all chunks."""
+    values = set()
+    for chunk in chunks:
+        values.update(chunk[column].dropna())
+    return pd.DataFrame(sorted(values), columns=[column])
+
+
+def stream_table(cur, chunks, table, clean, key, fk_filters, insert):
+    """Clean, filter and insert a raw CSV one chunk at a time.
+
+    chunks     -- iterator of raw DataFrames, e.g. raw_dataset.read_chunks(...)
+    clean      -- function turning a raw chunk into rows in table column order
+    key        -- primary key column, deduplicated across chunks (first occurrence wins)
+    fk_filters -- {column: set of valid parent keys}; rows with unknown keys are dropped
+    insert     -- function(cur, table, df) that writes one cleaned chunk
+    """
+    start = time.perf_counter()
+    seen = set()
+    total = 0
+    chunk_count = 0
+
+    for chunk in chunks:
+        df = clean(chunk)
+
+        # Drop keys already seen in an earlier chunk. This happens before FK
+        # filtering so the result matches reading the whole file at once.
+        df = df[~df[key].isin(seen)]
+        seen.update(df[key])
+
+        for column, valid_keys in fk_filters.items():
+            df = df[df[column].isin(valid_keys)]
+
+        if len(df):
+            insert(cur, table, df)
+        total += len(df)
+        chunk_count += 1
+
+    elapsed = time.perf_counter() - start
+    rate = total / elapsed if elapsed > 0 else float("inf")
+    print(f" Loaded {table}: {total} rows in {chunk_count} chunks, {elapsed:.3f}s ({rate:,.0f} rows/sec)")
+    return total
@@ -0,0 +1,80 @@
+from datetime import date
+
+import billing_rollups
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.statements = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append((" ".join(sql.split()), params))
+
+    def fetchall(self):
+        return []
+
+    def fetchone(self):
+        # the first month in Bills, then the differences counted by verify
+        return (date(2025, 1, 1),) if "min(issue_date)" in self.statements[-1][0] else (0,)
+
+
+class Connection:
+    def __init__(self):
+        self.cur = RecordingCursor()
+
+    def cursor(self):
+        return self.cur
+
+
+def test_months_between_without_dates_adds_nothing():
+    assert billing_rollups.months_between(None, None) == ("", [])
+
+
+def test_months_between_starts_at_the_first_of_the_month():
+    where, params = billing_rollups.months_between(date(2025, 1, 15), date(2025, 3, 1))
+    assert where == " AND month >= date_trunc('month', %s::DATE) AND month <= %s"
+    assert params == [date(2025, 1, 15), date(2025, 3, 1)]
+
+
+def test_client_months_passes_the_client_before_the_dates():
+    conn = Connection()
+    billing_rollups.client_months(conn, "C001", date_to=date(2025, 3, 1))
+    [(sql, params)] = conn.cur.statements
+    assert "WHERE client_id = %s AND month <= %s ORDER BY month;" in sql
+    assert params == ["C001", date(2025, 3, 1)]
+
+
+def test_region_months_of_every_region():
+    conn = Connection()
+    billing_rollups.region_months(conn, date_from=date(2025, 1, 1))
+    [(sql, params)] = conn.cur.statements
+    assert "WHERE TRUE AND month >= date_trunc('month', %s::DATE)" in sql
+    assert params == [date(2025, 1, 1)]
+
+
+def test_rebuild_keeps_the_months_before_the_first_bill():
+    cur = RecordingCursor()
+    billing_rollups.rebuild(cur)
+    statements = cur.statements[1:]
+    assert len(statements) == 2 * len(billing_rollups.AGGREGATES)
+    for sql, params in statements:
+        assert sql.startswith(("DELETE FROM electrogrid.bill_rollup_", "INSERT INTO electrogrid.bill_rollup_"))
+        assert sql.endswith("WHERE TRUE AND month >= date_trunc('month', %s::DATE);")
+        assert params == [date(2025, 1, 1)]
+
+
+def test_verify_compares_the_same_months_on_both_sides():
+    cur = RecordingCursor()
+    differences = billing_rollups.verify(cur, date_from=date(2025, 3, 1), date_to=date(2025, 6, 1))
+    assert differences == {table: 0 for table in billing_rollups.AGGREGATES}
+    # --from replaces the first month in Bills
+    assert not any("min(issue_date)" in sql for sql, _ in cur.statements)
+    for sql, params in cur.statements:
+        assert sql.count("month >= date_trunc('month', %s::DATE) AND month <= %s") == 2
+        assert params == [date(2025, 3, 1), date(2025, 6, 1)] * 2
@@ -0,0 +1,68 @@
+import bulk_load
+
+
+class RecordingCursor:
+    def __init__(self, results=()):
+        self.statements = []
+        self.results = list(results)
+
+    def execute(self, sql, params=None):
+        self.statements.append(" ".join(sql.split()))
+
+    def fetchall(self):
+        return self.results.pop(0)
+
+
+CONSTRAINTS = [
+    ("bills", "bills_client_id_fkey", "f", "FOREIGN KEY (client_id) REFERENCES electrogrid.client(person_id)", False),
+    ("bills", "bills_pkey", "p", "PRIMARY KEY (bills_id)", False),
+    ("client", "client_pkey", "p", "PRIMARY KEY (person_id)", False),
+    ("person", "person_email_key", "u", "UNIQUE (email)", False),
+]
+INDEXES = [("bills", "bills_client_idx", "CREATE INDEX bills_client_idx ON electrogrid.bills USING btree (client_id)")]
+
+
+def test_drop_constraints_drops_foreign_keys_first():
+    cur = RecordingCursor([CONSTRAINTS, INDEXES])
+    saved = bulk_load.drop_constraints(cur, "electrogrid", ["bills", "client", "person"])
+    drops = cur.statements[2:]
+    assert drops[0] == 'ALTER TABLE electrogrid.bills DROP CONSTRAINT "bills_client_id_fkey";'
+    assert drops[-1] == 'DROP INDEX electrogrid."bills_client_idx";'
+    assert len(drops) == 5
+    assert [c["name"] for c in saved["constraints"]] == [c[1] for c in CONSTRAINTS]
+
+
+def test_restore_builds_keys_then_adds_and_validates_foreign_keys():
+    cur = RecordingCursor([CONSTRAINTS, INDEXES])
+    saved = bulk_load.saved_constraints(cur, "electrogrid", ["bills", "client", "person"])
+    cur.statements.clear()
+    phases = bulk_load.restore_constraints(cur, "electrogrid", saved)
+    assert set(phases) == {"indexes", "constraints", "validate"}
+    assert cur.statements == [
+        f"SET LOCAL maintenance_work_mem = '{bulk_load.MAINTENANCE_WORK_MEM}';",
+        'ALTER TABLE electrogrid.bills ADD CONSTRAINT "bills_pkey" PRIMARY KEY (bills_id);',
+        'ALTER TABLE electrogrid.client ADD CONSTRAINT "client_pkey" PRIMARY KEY (person_id);',
+        'ALTER TABLE electrogrid.person ADD CONSTRAINT "person_email_key" UNIQUE (email);',
+        "CREATE INDEX bills_client_idx ON electrogrid.bills USING btree (client_id);",
+        'ALTER TABLE electrogrid.bills ADD CONSTRAINT "bills_client_id_fkey" '
+        "FOREIGN KEY (client_id) REFERENCES electrogrid.client(person_id) NOT VALID;",
+        'ALTER TABLE electrogrid.bills VALIDATE CONSTRAINT "bills_client_id_fkey";',
+    ]
+
+
+def test_foreign_keys_of_partitioned_tables_are_checked_as_they_are_added():
+    constraints = [
+        ("service_orders", "service_orders_connection_id_fkey", "f",
+         "FOREIGN KEY (connection_id) REFERENCES electrogrid.connections(connection_id)", True),
+    ]
+    indexes = [("service_orders", "service_orders_start_idx",
+                "CREATE INDEX service_orders_start_idx ON ONLY electrogrid.service_orders USING btree (start_date)")]
+    cur = RecordingCursor([constraints, indexes])
+    saved = bulk_load.saved_constraints(cur, "electrogrid", ["service_orders"])
+    cur.statements.clear()
+    bulk_load.restore_constraints(cur, "electrogrid", saved)
+    assert cur.statements[1:] == [
+        "CREATE INDEX service_orders_start_idx ON electrogrid.service_orders USING btree (start_date);",
+        'ALTER TABLE electrogrid.service_orders ADD CONSTRAINT "service_orders_connection_id_fkey" '
+        "FOREIGN KEY (connection_id) REFERENCES electrogrid.connections(connection_id);",
+    ]
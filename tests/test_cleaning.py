@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from cleaning import SPECS, clean, convert
+
+
+def raw_bills(*rows):
+    columns = ["bill_id", "connection_id", "client_id", "client_name", "period_start", "period_end",
+               "kwh_used", "amount", "issue_date", "payment_date"]
+    return pd.DataFrame(list(rows), columns=columns, dtype=object)
+
+
+GOOD = ["B1", "CN1", "C1", "Ana", "2025-02-18", "2025-03-20", "855", "129.284", "2025-03-22", ""]
+
+
+def test_clean_keeps_a_good_row_with_typed_columns():
+    df = clean(raw_bills(GOOD), "bills")
+    assert list(df.columns) == list(SPECS["bills"]["columns"])
+    row = df.iloc[0]
+    assert row["bills_id"] == "B1"
+    assert row["issue_date"] == pd.Timestamp("2025-03-22")
+    assert row["kwh_used"] == 855 and row["amount"] == 129.28
+    assert pd.isna(row["payment_date"])
+
+
+def test_clean_drops_rows_missing_a_required_value():
+    blank_id = ["  "] + GOOD[1:]
+    no_client = GOOD[:2] + [np.nan] + GOOD[3:]
+    bad_issue_date = GOOD[:8] + ["22/03/2025", ""]
+    df = clean(raw_bills(blank_id, no_client, bad_issue_date, GOOD), "bills")
+    assert list(df["bills_id"]) == ["B1"]
+
+
+def test_clean_keeps_the_first_row_of_a_duplicate_key():
+    later = ["B1 "] + GOOD[1:6] + ["900"] + GOOD[7:]
+    df = clean(raw_bills(GOOD, later), "bills")
+    assert len(df) == 1 and df["kwh_used"].iloc[0] == 855
+
+
+def test_optional_values_stay_missing_instead_of_becoming_text():
+    row = GOOD[:6] + ["n/a", np.nan] + GOOD[8:]
+    df = clean(raw_bills(row), "bills")
+    assert pd.isna(df["kwh_used"].iloc[0]) and pd.isna(df["amount"].iloc[0])
+
+
+def test_phone_keeps_the_last_nine_digits():
+    phones = pd.Series(["(351) 934 530 693", "+351912345678", "abc", np.nan])
+    result = convert(phones, {"kind": "phone"})
+    assert list(result[:2]) == ["934530693", "912345678"]
+    assert result[2:].isna().all()
+
+
+def test_categories_are_stripped_and_normalized():
+    result = convert(pd.Series([" porto", "PORTO ", "Lisboa", ""]), {"kind": "category", "case": "title"})
+    assert isinstance(result.dtype, pd.CategoricalDtype)
+    assert list(result[:3]) == ["Porto", "Porto", "Lisboa"] and pd.isna(result[3])
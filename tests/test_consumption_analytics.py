@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from consumption_analytics import BILL_COLUMNS, METRIC_COLUMNS, compute_metrics
+
+
+def bills(rows):
+    """Bills from (bills_id, connection_id, period_starts, days, kwh_used, amount)."""
+    df = pd.DataFrame(rows, columns=["bills_id", "connection_id", "period_starts", "days", "kwh_used", "amount"])
+    df["period_starts"] = pd.to_datetime(df["period_starts"])
+    df["period_ends"] = df["period_starts"] + pd.to_timedelta(df["days"], unit="D")
+    return df[BILL_COLUMNS]
+
+
+def monthly(connection, kwh, first="2025-01-01"):
+    starts = pd.date_range(first, periods=len(kwh), freq="MS")
+    return [(f"{connection}-{i}", connection, start, 30, k, k * 0.2) for i, (start, k) in enumerate(zip(starts, kwh))]
+
+
+def test_metrics_are_sorted_by_connection_and_period():
+    rows = monthly("CN2", [300, 330]) + monthly("CN1", [150, 300])
+    metrics = compute_metrics(bills(rows[::-1]))
+    assert list(metrics.columns) == METRIC_COLUMNS
+    assert list(metrics["bills_id"]) == ["CN1-0", "CN1-1", "CN2-0", "CN2-1"]
+    assert list(metrics["days"]) == [30, 30, 30, 30]
+    assert metrics["avg_daily_kwh"].tolist() == [5, 10, 10, 11]
+    assert metrics["price_per_kwh"].round(6).tolist() == [0.2] * 4
+
+
+def test_month_over_month_change_stays_within_a_connection():
+    metrics = compute_metrics(bills(monthly("CN1", [150, 300]) + monthly("CN2", [300, 330])))
+    change = metrics["mom_change"].tolist()
+    assert np.isnan(change[0]) and change[1] == pytest.approx(1.0)
+    assert np.isnan(change[2]) and change[3] == pytest.approx(0.1)
+
+
+def test_z_score_leaves_the_bill_out_of_its_history():
+    kwh = [300, 303, 297, 301, 299, 90]
+    metrics = compute_metrics(bills(monthly("CN1", kwh)), threshold=3, min_history=3)
+    daily = np.array(kwh) / 30
+    others = daily[:-1]
+    expected = (daily[-1] - others.mean()) / others.std(ddof=1)
+    assert metrics["z_score"].iloc[-1] == pytest.approx(expected)
+    assert metrics["flagged"].tolist() == [False] * 5 + [True]
+
+
+def test_z_score_needs_enough_history_and_some_spread():
+    few = compute_metrics(bills(monthly("CN1", [300, 310, 90])), min_history=3)
+    assert few["z_score"].isna().all() and not few["flagged"].any()
+    flat = compute_metrics(bills(monthly("CN1", [300] * 5)), min_history=3)
+    assert flat["z_score"].isna().all()
+
+
+def test_bad_periods_and_zero_kwh_give_missing_metrics():
+    rows = [("B1", "CN1", "2025-01-01", 0, 100, 20), ("B2", "CN1", "2025-02-01", 30, 0, 5)]
+    metrics = compute_metrics(bills(rows))
+    assert pd.isna(metrics["days"].iloc[0]) and np.isnan(metrics["avg_daily_kwh"].iloc[0])
+    assert np.isnan(metrics["price_per_kwh"].iloc[1])
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import copy_load
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({
+        "name": pd.array(["", None, "tab\there"], dtype="string"),
+        "count": pd.array([1, None, 3], dtype="Int64"),
+        "amount": [12.5, np.nan, 0.1],
+        "day": pd.to_datetime(["2025-03-01", None, "2025-03-02"]),
+        "active": pd.array([True, None, False], dtype="boolean"),
+        "read_at": pd.to_datetime(["2025-07-01 10:15", None, "2025-07-01 00:00"]).tz_localize("Europe/Lisbon"),
+    })
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.copies = []
+
+    def copy_expert(self, sql, file, size=8192):
+        data = b""
+        while chunk := file.read(size):
+            data += chunk
+        self.copies.append((sql, data))
+
+
+def test_copy_text_writes_null_escapes_and_utc(frame):
+    lines = copy_load.copy_text(frame).splitlines()
+    assert lines == [
+        "\t1\t12.5\t2025-03-01\tt\t2025-07-01T09:15:00.000000+00",
+        "\\N\t\\N\t\\N\t\\N\t\\N\t\\N",
+        "tab\\there\t3\t0.1\t2025-03-02\tf\t2025-06-30T23:00:00.000000+00",
+    ]
+
+
+def test_copy_text_of_empty_frame():
+    assert copy_load.copy_text(pd.DataFrame({"a": []})) == ""
+
+
+def test_datetimes_with_time_of_day_keep_it():
+    values = pd.to_datetime(["2025-03-01 10:15", "2025-03-01"], format="ISO8601").to_numpy()
+    assert list(copy_load.format_datetimes(values)) == ["2025-03-01T10:15:00.000000", "2025-03-01T00:00:00.000000"]
+
+
+def test_categorical_columns_are_written_by_code():
+    series = pd.Series(["Porto", None, "Lisboa", "Porto"], dtype="category")
+    assert list(copy_load.column_text(series)) == ["Porto", "\\N", "Lisboa", "Porto"]
+
+
+@pytest.mark.skipif(copy_load.pa is None, reason="pyarrow is not installed")
+def test_copy_csv_tells_null_from_empty_string(frame):
+    lines = copy_load.copy_csv(frame).decode().splitlines()
+    # NULL is an unquoted empty field, the empty string a quoted one
+    assert lines[0].startswith('"",1,12.5,2025-03-01,true,')
+    assert lines[1] == ",,,,,"
+    assert lines[2].endswith('"2025-06-30 23:00:00.000000+00"')
+
+
+def test_frame_reader_streams_what_serialize_writes(frame):
+    reader = copy_load.FrameReader(frame, rows_per_chunk=1)
+    data = b""
+    while chunk := reader.read(7):
+        data += chunk
+    assert data == copy_load.serialize(frame)
+
+
+def test_copy_dataframe_streams_the_frame(frame):
+    cur = RecordingCursor()
+    assert copy_load.copy_dataframe(cur, "electrogrid.items", frame) == 3
+    [(sql, data)] = cur.copies
+    assert sql == f"COPY electrogrid.items (name, count, amount, day, active, read_at) FROM STDIN {copy_load.COPY_FORMAT}"
+    assert data == copy_load.serialize(frame)
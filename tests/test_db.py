@@ -0,0 +1,129 @@
+import psycopg2
+import pytest
+from psycopg2 import extensions
+
+import db
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = 0
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        if not self.alive:
+            raise psycopg2.OperationalError("server closed the connection unexpectedly")
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+class FakeThreadedPool:
+    """Stands in for psycopg2's pool: hands out queued connections, records returns."""
+
+    def __init__(self, minconn, maxconn, **kwargs):
+        self.idle = []
+        self.closed = []
+        self.opened = 0
+
+    def getconn(self):
+        if self.idle:
+            return self.idle.pop()
+        self.opened += 1
+        return FakeConnection()
+
+    def putconn(self, conn, close=False):
+        if close:
+            conn.closed = 1
+            self.closed.append(conn)
+        else:
+            self.idle.append(conn)
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(db.pool, "ThreadedConnectionPool", FakeThreadedPool)
+    return lambda **kwargs: db.ConnectionPool(minconn=1, maxconn=2, host="test", **kwargs)
+
+
+def test_connection_that_fails_the_health_check_is_replaced(make_pool):
+    connections = make_pool(health_check_after=0)
+    dead = FakeConnection(alive=False)
+    connections._pool.idle.append(dead)
+
+    conn = connections.getconn()
+    assert conn is not dead
+    assert connections._pool.closed == [dead]
+    assert conn.rollbacks == 1  # the new connection was pinged
+
+
+def test_recently_returned_connection_is_not_pinged(make_pool):
+    connections = make_pool(health_check_after=60)
+    with connections.connection() as conn:
+        pass
+    conn.alive = False
+    assert connections.getconn() is conn
+
+
+def test_connection_error_in_block_discards_the_connection(make_pool):
+    connections = make_pool()
+    with pytest.raises(psycopg2.OperationalError):
+        with connections.connection() as conn:
+            raise psycopg2.OperationalError("connection lost")
+    assert connections._pool.closed == [conn]
+    assert connections._pool.idle == []
+
+
+def test_checkout_times_out_when_every_connection_is_lent(make_pool):
+    connections = make_pool()
+    connections.getconn()
+    connections.getconn()
+    with pytest.raises(db.pool.PoolError):
+        connections.getconn(timeout=0.01)
+
+
+class RecordingCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+
+def test_execute_prepared_prepares_once_per_connection():
+    first, second = FakeConnection(), FakeConnection()
+    cur = RecordingCursor(first)
+    db.execute_prepared(cur, "lookup", "SELECT $1", (7,), types=("BIGINT",))
+    db.execute_prepared(cur, "lookup", "SELECT $1", (8,), types=("BIGINT",))
+    assert cur.statements == [
+        ("PREPARE lookup (BIGINT) AS SELECT $1", None),
+        ("EXECUTE lookup (%s);", (7,)),
+        ("EXECUTE lookup (%s);", (8,)),
+    ]
+
+    other = RecordingCursor(second)
+    db.execute_prepared(other, "lookup", "SELECT $1", (9,), types=("BIGINT",))
+    assert other.statements[0] == ("PREPARE lookup (BIGINT) AS SELECT $1", None)
+
+
+def test_execute_prepared_without_parameters():
+    cur = RecordingCursor(FakeConnection())
+    db.execute_prepared(cur, "everything", "SELECT 1", ())
+    assert cur.statements == [("PREPARE everything  AS SELECT 1", None), ("EXECUTE everything ;", ())]
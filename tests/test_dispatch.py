@@ -0,0 +1,67 @@
+import pytest
+
+from dispatch import DispatchIndex, changes
+
+SKILLS = ["Installation", "Inspection", "Repair"]
+
+ROSTER = [
+    ("T1", "Ana", "Porto", ["Repair"]),
+    ("T2", "Rui", "Porto", ["Installation", "Repair"]),
+    ("T3", "Eva", "Porto", ["Inspection", "Installation", "Repair"]),
+    ("T4", "Luis", "Lisboa", ["Repair"]),
+    ("T5", "Rita", "Porto", []),
+]
+
+
+@pytest.fixture
+def index():
+    index = DispatchIndex()
+    index.build(SKILLS, ROSTER, {"T1": 3, "T2": 1, "T3": 1, "T4": 0})
+    return index
+
+
+def test_candidates_have_every_skill_and_the_fewest_open_orders(index):
+    assert index.candidates("Porto", ["Repair"]) == [("T2", "Rui", 1), ("T3", "Eva", 1), ("T1", "Ana", 3)]
+    assert index.candidates("Porto", ["Repair", "Installation"]) == [("T2", "Rui", 1), ("T3", "Eva", 1)]
+    assert index.candidates("Porto", ["Inspection"]) == [("T3", "Eva", 1)]
+
+
+def test_candidates_without_skills_are_the_whole_region(index):
+    assert [row[0] for row in index.candidates("Porto")] == ["T5", "T2", "T3", "T1"]
+    assert [row[0] for row in index.candidates("Porto", limit=2)] == ["T5", "T2"]
+
+
+def test_unknown_region_or_skill_matches_nobody(index):
+    assert index.candidates("Faro", ["Repair"]) == []
+    assert index.candidates("Porto", ["Welding"]) == []
+
+
+def test_roster_skills_missing_from_skills_are_left_out():
+    index = DispatchIndex()
+    index.build(["Repair"], [("T1", "Ana", "Porto", ["Repair", "Welding"])], {})
+    assert index.candidates("Porto", ["Repair"]) == [("T1", "Ana", 0)]
+    assert index.skills() == ["Repair"]
+    assert index.loaded.is_set()
+
+
+def test_set_open_orders_moves_technicians(index):
+    index.set_open_orders({"T1": 0}, ["T1", "T2"])
+    # T2 was named without a count: it has no open orders left
+    assert index.candidates("Porto", ["Repair"]) == [("T1", "Ana", 0), ("T2", "Rui", 0), ("T3", "Eva", 1)]
+
+    index.set_open_orders({"T3": 2, "T4": 5})
+    assert index.candidates("Porto", ["Repair"]) == [("T1", "Ana", 0), ("T2", "Rui", 0), ("T3", "Eva", 2)]
+    assert index.candidates("Lisboa") == [("T4", "Luis", 5)]
+    assert index.open_orders["T1"] == 0
+
+
+def test_set_open_orders_ignores_unknown_technicians(index):
+    index.set_open_orders({"T9": 4}, ["T9"])
+    assert "T9" not in index.open_orders
+
+
+def test_changes_collect_technicians_and_rebuilds():
+    assert changes(["orders:T1,T2", "orders:T3"]) == (False, {"T1", "T2", "T3"})
+    assert changes(["orders:T1", "roster"]) == (True, {"T1"})
+    assert changes(["orders:T1", "orders:*", "orders:T2"]) == (False, None)
+    assert changes([]) == (False, set())
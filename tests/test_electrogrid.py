@@ -0,0 +1,106 @@
+import pytest
+
+import electrogrid
+import explain_check
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("912345678", 912345678),
+    ("+351 912 345 678", 912345678),
+    ("(91) 234-5678", 912345678),
+    ("12", 12),
+    ("no digits", None),
+    ("", None),
+])
+def test_phone_number_keeps_the_stored_digits(text, expected):
+    assert electrogrid.phone_number(text) == expected
+
+
+def test_plan_nodes_walks_the_whole_tree():
+    plan = {"Node Type": "Nested Loop", "Plans": [
+        {"Node Type": "Index Scan", "Index Name": "a_idx"},
+        {"Node Type": "Sort", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "t"}]},
+    ]}
+    assert [n["Node Type"] for n in explain_check.plan_nodes(plan)] == [
+        "Nested Loop", "Index Scan", "Sort", "Seq Scan"]
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.closed = False
+
+    def execute(self, sql, params=None):
+        if self.conn.error:
+            raise self.conn.error
+        self.conn.params = params
+
+    def fetchall(self):
+        return [(f"C{i}",) for i in range(len(self.conn.params[0]))]
+
+    def close(self):
+        self.closed = True
+
+
+class FakeConnection:
+    def __init__(self, error=None):
+        self.error = error
+        self.cursors = []
+        self.events = []
+
+    def cursor(self):
+        self.cursors.append(FakeCursor(self))
+        return self.cursors[-1]
+
+    def commit(self):
+        self.events.append("commit")
+
+    def rollback(self):
+        self.events.append("rollback")
+
+
+def test_insert_clients_sends_columns_and_commits():
+    conn = FakeConnection()
+    clients = [("Ana", "a@x.pt", "+351 912 345 678", "Rua A"), ("Rui", "r@x.pt", None, "Rua B")]
+    assert electrogrid.insert_clients(clients, conn) == ["C0", "C1"]
+    assert conn.params == (["Ana", "Rui"], ["a@x.pt", "r@x.pt"], [912345678, None], ["Rua A", "Rua B"])
+    assert conn.events == ["commit"]
+    assert conn.cursors[0].closed
+
+
+def test_insert_clients_without_clients_does_not_touch_the_database():
+    conn = FakeConnection()
+    assert electrogrid.insert_clients([], conn) == []
+    assert conn.cursors == [] and conn.events == []
+
+
+def test_insert_clients_rolls_back_and_raises_on_error():
+    conn = FakeConnection(error=RuntimeError("duplicate email"))
+    with pytest.raises(RuntimeError):
+        electrogrid.insert_clients([("Ana", "a@x.pt", "912345678", "Rua A")], conn)
+    assert conn.events == ["rollback"]
+    assert conn.cursors[0].closed
+
+
+def test_meter_checks_query_without_filters_orders_by_keyset():
+    query, params = electrogrid.meter_checks_query()
+    assert "WHERE" not in query
+    assert query.endswith("ORDER BY mc.check_date DESC, mc.check_id DESC;")
+    assert params == []
+
+
+def test_meter_checks_query_combines_filters_in_parameter_order():
+    query, params = electrogrid.meter_checks_query(
+        date_from="2025-01-01", date_to="2025-03-31", region="North",
+        after=("2025-03-10", "MC00042"), limit="20")
+    assert "mc.check_date >= %s" in query and "mc.check_date <= %s" in query
+    assert "region_name = %s" in query
+    assert "(mc.check_date, mc.check_id) < (%s, %s)" in query
+    assert query.endswith("LIMIT 20;")
+    assert params == ["2025-01-01", "2025-03-31", "North", "2025-03-10", "MC00042"]
+
+
+def test_meter_checks_query_filters_on_the_technician_column():
+    query, params = electrogrid.meter_checks_query(technician_id="T007")
+    assert "mc.technician_id = %s" in query
+    assert params == ["T007"]
@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+
+import export_datamart
+from export_datamart import PartWriter, arrow_type, encode
+
+pytestmark = pytest.mark.skipif(export_datamart.pa is None, reason="pyarrow is not installed")
+
+if export_datamart.pa is not None:
+    import pyarrow as pa
+    import pyarrow.parquet as pa_parquet
+
+
+def test_arrow_types_follow_the_declared_types():
+    assert arrow_type("NUMERIC(10,2)") == pa.decimal128(10, 2)
+    assert arrow_type("NUMERIC") == pa.decimal128(38, export_datamart.NUMERIC_SCALE)
+    assert arrow_type("VARCHAR(50)") == pa.string()
+    assert arrow_type("TIMESTAMPTZ") == pa.timestamp("us", tz="UTC")
+
+
+@pytest.fixture
+def target():
+    return pa.schema([("bills_id", pa.string()), ("status", pa.dictionary(pa.int32(), pa.string()))])
+
+
+def test_encode_uses_the_whole_lookup_table_as_dictionary(target):
+    dictionaries = {"status": pa.array(["Active", "Inactive", "Pending"])}
+    batch = pa.record_batch([pa.array(["B1", "B2", "B3"]), pa.array(["Pending", None, "Active"])],
+                            names=["bills_id", "status"])
+    encoded = encode(batch, target, dictionaries)
+    status = encoded.column(1)
+    assert encoded.schema == target
+    assert status.dictionary.to_pylist() == ["Active", "Inactive", "Pending"]
+    assert status.to_pylist() == ["Pending", None, "Active"]
+
+
+def test_encode_rejects_values_missing_from_the_lookup_table(target):
+    batch = pa.record_batch([pa.array(["B1"]), pa.array(["Retired"])], names=["bills_id", "status"])
+    with pytest.raises(ValueError, match="status"):
+        encode(batch, target, {"status": pa.array(["Active"])})
+
+
+@pytest.fixture
+def bills():
+    target = pa.schema([("bills_id", pa.string()), ("issue_date", pa.date32())])
+    batch = pa.record_batch([pa.array(["B1", "B2", "B3"]),
+                             pa.array([date(2025, 3, 31), date(2025, 4, 1), date(2025, 3, 2)])], schema=target)
+    return target, batch
+
+
+@pytest.mark.parametrize("file_format", ["parquet", "arrow"])
+def test_part_writer_splits_batches_by_month(tmp_path, bills, file_format):
+    target, batch = bills
+    writer = PartWriter(tmp_path, target, file_format, part=3, month_column="issue_date")
+    writer.write(batch)
+    written = writer.close()
+
+    name = f"part-00003{export_datamart.FORMATS[file_format]}"
+    assert sorted(path.relative_to(tmp_path).as_posix() for path, _ in written) == \
+        [f"month=2025-03/{name}", f"month=2025-04/{name}"]
+    assert writer.rows == 3
+    assert not list(tmp_path.rglob("*.tmp"))
+    march = tmp_path / "month=2025-03" / name
+    if file_format == "parquet":
+        table = pa_parquet.read_table(march)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(str(march))).read_all()
+    assert table.schema == target
+    assert table.column("bills_id").to_pylist() == ["B1", "B3"]
+
+
+def test_an_empty_table_still_gets_its_first_part(tmp_path, bills):
+    target, _ = bills
+    written = PartWriter(tmp_path, target, "parquet", part=0).close()
+    assert [path.name for path, _ in written] == ["part-00000.parquet"]
+    assert pa_parquet.read_table(written[0][0]).num_rows == 0
+    # later, incremental parts without rows write nothing
+    assert PartWriter(tmp_path, target, "parquet", part=1).close() == []
+
+
+def test_abort_leaves_no_files(tmp_path, bills):
+    target, batch = bills
+    writer = PartWriter(tmp_path, target, "arrow", part=0, month_column="issue_date")
+    writer.write(batch)
+    writer.abort()
+    assert not [path for path in tmp_path.rglob("*") if path.is_file()]
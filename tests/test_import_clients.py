@@ -0,0 +1,68 @@
+import pandas as pd
+
+import import_clients
+
+
+class TakenCursor:
+    """Answers the TAKEN queries with the values of `taken` among the candidates."""
+
+    def __init__(self, taken):
+        self.taken = taken
+        self.queries = []
+
+    def execute(self, sql, params):
+        name = next(n for n, query in import_clients.TAKEN.items() if query == sql)
+        self.queries.append((name, params[0]))
+        self.rows = [(v,) for v in params[0] if v in self.taken.get(name, ())]
+
+    def fetchall(self):
+        return self.rows
+
+
+def raw(rows):
+    frame = pd.DataFrame(rows, columns=["name", "email", "phone", "address"])
+    frame.index = pd.RangeIndex(1, len(frame) + 1, name="row")
+    return frame
+
+
+def test_read_clients_renames_aliases_and_numbers_rows_from_one(tmp_path):
+    path = tmp_path / "clients.csv"
+    path.write_text("client_name,email,phone,address\nAna,a@x.pt,912345678,Rua A\n")
+    clients = import_clients.read_clients(path)
+    assert list(clients.columns) == ["name", "email", "phone", "address"]
+    assert clients.index.tolist() == [1]
+
+
+def test_normalize_cleans_values_like_the_loader():
+    clients = import_clients.normalize(raw([
+        ("  Ana  ", "A@X.PT", "+351 912 345 678", "Rua A"),
+        ("", "", "", ""),
+    ]))
+    assert clients.loc[1, "phone"] == 912345678
+    assert clients.loc[2].isna().all()
+    assert str(clients["phone"].dtype) == "Int64"
+
+
+def test_validate_gives_one_reason_per_row():
+    clients = import_clients.normalize(raw([
+        ("Ana", "a@x.pt", "912345678", "Rua A"),
+        ("", "b@x.pt", "912345679", "Rua B"),           # missing name
+        ("Rui", "a@x.pt", "912345670", "Rua C"),        # email repeated
+        ("Eva", "taken@x.pt", "912345671", "Rua D"),    # email in the database
+        ("Ivo", "i@x.pt", "912345678", "Rua E"),        # phone repeated
+        ("Leo", "l@x.pt", "999999999", "Rua F"),        # phone in the database
+    ]))
+    cur = TakenCursor({"email": {"taken@x.pt"}, "phone": {999999999}})
+    reasons = import_clients.validate(cur, clients)
+    assert reasons.tolist() == [
+        pd.NA, "missing name", "email repeated in the file", "email already in the database",
+        "phone repeated in the file", "phone already in the database",
+    ]
+
+
+def test_taken_values_skips_the_query_without_candidates():
+    cur = TakenCursor({})
+    assert import_clients.taken_values(cur, "email", []) == []
+    assert cur.queries == []
+    import_clients.taken_values(cur, "phone", ["912345678"])
+    assert cur.queries == [("phone", [912345678])]
@@ -0,0 +1,42 @@
+import pandas as pd
+
+import incremental
+
+
+def bills(**changes):
+    df = pd.DataFrame({
+        "bills_id": ["B1", "B2", "B3"],
+        "issue_date": pd.to_datetime(["2025-03-01", "2025-04-02", "2025-05-03"]),
+        "amount": [10.0, 20.0, 30.0],
+    }, index=[7, 8, 9])
+    return df.assign(**changes)
+
+
+def test_row_keys_of_one_column():
+    assert list(incremental.row_keys(bills(), ["bills_id"])) == ["B1", "B2", "B3"]
+
+
+def test_composite_keys_are_joined_and_dates_written_like_postgresql():
+    keys = incremental.row_keys(bills(), ["bills_id", "issue_date"])
+    assert list(keys) == ["B1\x1f2025-03-01", "B2\x1f2025-04-02", "B3\x1f2025-05-03"]
+    # positional, whatever the frame's index
+    assert list(keys.index) == [0, 1, 2]
+
+
+def test_keys_read_back_as_text_match_the_frame():
+    # read_query returns every column as text
+    stored = pd.DataFrame({"bills_id": ["B1"], "issue_date": ["2025-03-01"]})
+    assert incremental.row_keys(stored, ["bills_id", "issue_date"])[0] == \
+        incremental.row_keys(bills(), ["bills_id", "issue_date"])[0]
+
+
+def test_row_hashes_fit_bigint_and_follow_the_content():
+    hashes = incremental.row_hashes(bills())
+    assert hashes.dtype == "int64"
+    assert list(hashes) == list(incremental.row_hashes(bills()))
+    changed = incremental.row_hashes(bills(amount=[10.0, 21.0, 30.0]))
+    assert [a == b for a, b in zip(hashes, changed)] == [True, False, True]
+
+
+def test_row_hashes_ignore_the_index():
+    assert list(incremental.row_hashes(bills())) == list(incremental.row_hashes(bills().reset_index(drop=True)))
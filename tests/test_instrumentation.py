@@ -0,0 +1,112 @@
+import io
+
+import pytest
+
+import instrumentation
+from instrumentation import BUCKET_BOUNDS, CountingFile, CountingTextFile, LatencyHistogram, Metrics, normalize
+
+
+def test_buckets_grow_by_a_fourth_power_of_two_from_10_us():
+    assert BUCKET_BOUNDS[0] == pytest.approx(1e-5)
+    assert BUCKET_BOUNDS[4] == pytest.approx(2e-5)
+    assert all(b / a == pytest.approx(2 ** 0.25) for a, b in zip(BUCKET_BOUNDS, BUCKET_BOUNDS[1:]))
+
+
+def test_a_latency_goes_into_the_first_bucket_whose_bound_holds_it():
+    histogram = LatencyHistogram()
+    for seconds in [0, 1e-5, 1.1e-5, 1e6]:
+        histogram.record(seconds)
+    assert histogram.counts[0] == 2
+    assert histogram.counts[1] == 1
+    assert histogram.counts[-1] == 1
+
+
+def test_percentiles_are_bucket_bounds_capped_at_the_largest_latency():
+    histogram = LatencyHistogram()
+    for _ in range(98):
+        histogram.record(1e-3)
+    histogram.record(0.1)
+    histogram.record(0.5)
+    p50 = histogram.percentile(0.5)
+    assert 1e-3 <= p50 < 1e-3 * 2 ** 0.25
+    assert histogram.percentile(0.99, largest=0.5) >= 0.1
+    assert histogram.percentile(1.0, largest=0.5) == 0.5
+    assert LatencyHistogram().percentile(0.5) is None
+
+
+@pytest.mark.parametrize("query, normalized", [
+    ("SELECT * FROM t WHERE a = %s AND b = 'x''y' -- note\n", "SELECT * FROM t WHERE a = ? AND b = ?"),
+    ("SELECT * FROM t WHERE a = %(a)s OR a = $2;", "SELECT * FROM t WHERE a = ? OR a = ?"),
+    ("INSERT INTO t (a, b) VALUES (1, 'a'), (2, NULL), (3, 'c');", "INSERT INTO t (a, b) VALUES (?)"),
+    ("SELECT x FROM t2 WHERE id = ANY(ARRAY[1, 2::int])", "SELECT x FROM t2 WHERE id = ANY(ARRAY[?])"),
+    ("SELECT  col1,\n  -1.5e3  FROM  t1", "SELECT col1, ? FROM t1"),
+    (b"select $1", "select ?"),
+])
+def test_normalize(query, normalized):
+    assert normalize(query) == normalized
+
+
+def test_pages_of_different_sizes_share_one_statement():
+    assert normalize("INSERT INTO t VALUES (1, 2), (3, 4)") == normalize("INSERT INTO t VALUES (5, 6)")
+
+
+def page(rows, suffix=""):
+    values = ",".join(f"('B{i}', {i * 1.5}, NULL, '2025-03-01'::DATE)" for i in range(rows))
+    return f"INSERT INTO electrogrid.bills (bills_id, kwh_used, payment_date, issue_date) VALUES {values}{suffix}"
+
+
+@pytest.mark.parametrize("suffix", ["", " ON CONFLICT (bills_id, issue_date) DO NOTHING", " RETURNING bills_id;"])
+def test_long_pages_are_keyed_like_short_ones(suffix):
+    long_page = page(1000, suffix)
+    assert len(long_page) > instrumentation.CACHE_MAX_LENGTH
+    assert normalize(long_page) == normalize(page(1, suffix)) == instrumentation._normalize(long_page)
+    assert normalize(long_page.encode()) == normalize(long_page)
+
+
+def test_long_statements_without_values_are_normalized_whole():
+    query = "SELECT * FROM t WHERE id IN (" + ", ".join(map(str, range(2000))) + ") AND name = 'x'"
+    assert normalize(query) == "SELECT * FROM t WHERE id IN (?) AND name = ?"
+
+
+def test_metrics_fold_statements_past_the_limit(monkeypatch):
+    monkeypatch.setattr(instrumentation, "MAX_STATEMENTS", 2)
+    metrics = Metrics()
+    for statement in ["a", "b", "c", "d", "a"]:
+        metrics.record(statement, 0.001, rows=1)
+    snapshot = {s["statement"]: s for s in metrics.snapshot()["statements"]}
+    assert set(snapshot) == {"a", "b", instrumentation.OTHER}
+    assert snapshot["a"]["calls"] == 2 and snapshot[instrumentation.OTHER]["calls"] == 2
+
+
+def test_counting_file_counts_bytes_in_both_directions():
+    written = CountingFile(io.BytesIO())
+    written.write(b"abc")
+    assert written.count == 3
+    read = CountingFile(io.BytesIO(b"one\ntwo\n"))
+    assert read.readline() == b"one\n" and read.read() == b"two\n"
+    assert read.count == 8
+
+
+def test_counting_text_file_stays_a_text_file():
+    text = CountingTextFile(io.StringIO())
+    # psycopg2 writes str only to io.TextIOBase objects
+    assert isinstance(text, io.TextIOBase)
+    text.write("héllo")
+    assert text.count == 5 and text.file.getvalue() == "héllo"
+
+
+@pytest.mark.parametrize("query, explain", [
+    ("SELECT * FROM electrogrid.bills WHERE bills_id = %s", "EXPLAIN (ANALYZE, BUFFERS) "),
+    ("  (SELECT 1) UNION ALL (SELECT 2)", "EXPLAIN (ANALYZE, BUFFERS) "),
+    ("WITH t AS (SELECT 1) TABLE t", "EXPLAIN (ANALYZE, BUFFERS) "),
+    ("SELECT last_updated FROM t", "EXPLAIN (ANALYZE, BUFFERS) "),
+    ("INSERT INTO electrogrid.bills VALUES (%s)", "EXPLAIN "),
+    ("with moved AS (DELETE FROM t RETURNING *) SELECT count(*) FROM moved", "EXPLAIN "),
+    ("SELECT nextval('electrogrid.client_id_seq')", "EXPLAIN "),
+    ("SELECT * FROM t FOR UPDATE", "EXPLAIN "),
+    ("EXECUTE client_profile (%s)", "EXPLAIN "),
+    ("COPY electrogrid.bills FROM STDIN", None),
+    ("BEGIN", None),
+])
+def test_only_reads_are_explained_with_analyze(query, explain):
+    assert instrumentation.explain_command(query) == explain
@@ -0,0 +1,88 @@
+import asyncio
+import io
+import time
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+import meter_readings
+from copy_load import read_csv_columns
+
+
+def ingester():
+    """An Ingester with known serials and events, without a database."""
+    checker = meter_readings.Ingester.__new__(meter_readings.Ingester)
+    checker.serials = pd.Index(["MTR1", "MTR2"])
+    checker.events = pd.Index(["power_outage", "tamper"])
+    checker.keys_read_at = time.monotonic()
+    return checker
+
+
+def test_parse_skips_the_header_and_reads_text():
+    raw = meter_readings.parse(b"meter_serial,read_at,kwh,event_code\nMTR1,2025-03-01T10:15:00Z,0.412,\n")
+    assert list(raw.columns) == meter_readings.READING_COLUMNS
+    assert raw["kwh"].iloc[0] == "0.412" and pd.isna(raw["event_code"].iloc[0])
+    assert len(meter_readings.parse(b"meter_serial,read_at,kwh,event_code\n")) == 0
+
+
+def test_check_rejects_each_row_for_its_first_reason():
+    raw = meter_readings.parse(b"\n".join([
+        b"MTR1,2025-03-01T10:15:00Z,0.4123,",
+        b" MTR2 ,2025-03-01T10:15:00+01:00,,power_outage",
+        b"MTR9,2025-03-01T10:15:00Z,0.4,",
+        b"MTR1,yesterday,0.4,",
+        b"MTR1,2025-03-01T10:30:00Z,lots,",
+        b"MTR1,2025-03-01T10:45:00Z,-1,",
+        b"MTR1,2025-03-01T11:00:00Z,0.1,meltdown",
+        b"MTR1,2025-03-01T11:15:00Z,,",
+        b"MTR9,yesterday,-1,",
+    ]) + b"\n")
+    readings, reasons = ingester().check(raw)
+    assert list(reasons) == ["unknown_meter", "bad_timestamp", "bad_kwh", "negative_kwh", "unknown_event",
+                             "empty_reading", "unknown_meter"]
+    assert list(readings["meter_serial"]) == ["MTR1", "MTR2"]
+    assert readings["kwh"].iloc[0] == 0.412
+    assert readings["read_at"].iloc[1] == pd.Timestamp("2025-03-01T09:15:00Z")
+    assert readings["event_code"].iloc[1] == "power_outage"
+
+
+def test_read_csv_columns_types_and_missing_values():
+    data = io.BytesIO(b"B1,2025-03-01,12.5,\nB2,2025-04-01,,x\n")
+    df = read_csv_columns(data, ["id", "day", "kwh", "note"], {"day": "datetime", "kwh": "float"})
+    assert list(df["id"]) == ["B1", "B2"]
+    assert df["day"].iloc[1] == pd.Timestamp("2025-04-01")
+    assert df["kwh"].iloc[0] == 12.5 and pd.isna(df["kwh"].iloc[1])
+    assert pd.isna(df["note"].iloc[0]) and df["note"].iloc[1] == "x"
+
+
+def test_read_blocks_yields_whole_lines():
+    stream = io.BytesIO(b"a,1\nb,2\nc,3")
+    blocks = list(meter_readings.read_blocks(stream, size=5))
+    assert b"".join(blocks) == b"a,1\nb,2\nc,3\n"
+    assert all(block.endswith(b"\n") for block in blocks)
+
+
+def test_periods_without_an_offset_are_utc():
+    assert meter_readings.utc_timestamp("2025-03-01") == datetime(2025, 3, 1, tzinfo=timezone.utc)
+    with_offset = meter_readings.utc_timestamp("2025-03-01T00:00+01:00")
+    assert with_offset.utcoffset() == timedelta(hours=1)
+
+
+class Writer:
+    def close(self):
+        pass
+
+
+def test_a_trailing_line_without_newline_is_flushed_on_time():
+    listener = meter_readings.Listener(ingester=None)
+
+    async def receive():
+        reader = asyncio.StreamReader()
+        reader.feed_data(b"MTR1,2025-03-01T10:15:00Z,0.4,")
+        reader.feed_eof()
+        await listener.handle(reader, Writer())
+
+    asyncio.run(receive())
+    assert listener.pending == [b"MTR1,2025-03-01T10:15:00Z,0.4,\n"]
+    # without a start time flush_on_time would never write it
+    assert listener.first_line_at is not None
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+import partitions
+import raw_dataset
+
+
+@pytest.mark.parametrize("day, months, expected", [
+    (date(2025, 3, 15), 0, date(2025, 3, 1)),
+    (date(2025, 3, 15), 1, date(2025, 4, 1)),
+    (date(2025, 11, 30), 2, date(2026, 1, 1)),
+    (date(2025, 1, 1), -1, date(2024, 12, 1)),
+    (date(2025, 2, 1), -14, date(2023, 12, 1)),
+])
+def test_add_months_returns_the_first_of_the_month(day, months, expected):
+    assert partitions.add_months(day, months) == expected
+
+
+def test_partitioned_tables_come_from_the_schema():
+    assert partitions.PARTITIONED == {"bills": "issue_date", "service_orders": "start_date"}
+
+
+@pytest.fixture
+def bills_csv(tmp_path, monkeypatch):
+    # raw_dataset keeps its parse cache under the working directory
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "bills_raw.csv").write_text(
+        "bill_id,connection_id,client_id,client_name,period_start,period_end,kwh_used,amount,issue_date,payment_date\n"
+        "B1,CN1,C1,Ana,2025-02-18,2025-03-20,855,129.28,2025-03-22,\n"
+        "B2,CN1,C1,Ana,2024-12-18,2025-01-20,700,100.00,2025-01-05,\n"
+        "B3,CN1,C1,Ana,2025-01-18,2025-02-20,650,90.00,not a date,\n"
+    )
+    return tmp_path
+
+
+def test_csv_months_spans_the_partition_key_of_the_raw_csv(bills_csv):
+    assert partitions.csv_months("bills", bills_csv) == (date(2025, 1, 5), date(2025, 3, 22))
+
+
+def test_csv_months_reuses_the_parsed_file(bills_csv, monkeypatch):
+    raw_dataset.load("bills", bills_csv)
+    monkeypatch.setattr(raw_dataset, "read_csv", lambda *args, **kwargs: pytest.fail("CSV parsed twice"))
+    assert partitions.csv_months("bills", bills_csv) == (date(2025, 1, 5), date(2025, 3, 22))
+
+
+def test_csv_months_in_chunks(bills_csv):
+    assert partitions.csv_months("bills", bills_csv, chunksize=1) == (date(2025, 1, 5), date(2025, 3, 22))
+
+
+def test_csv_months_without_dates(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "service_orders_raw.csv").write_text(
+        "service_order_id,connection_id,client_id,client_name,technician_id,technician_name,"
+        "service_type,start_date,end_date,notes\n"
+        "SO1,CN1,C1,Ana,T1,Rui,Inspection,,,\n"
+    )
+    assert partitions.csv_months("service_orders", tmp_path) is None
@@ -0,0 +1,72 @@
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import raw_dataset
+
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(raw_dataset, "_parsed", {})
+    csv_dir = tmp_path / "raw"
+    csv_dir.mkdir()
+    columns = raw_dataset.RAW_FILES["clients"]["dtypes"]
+    pd.DataFrame([["C1", "Ana", "a@x.pt", "912345678", "Porto", "unused"]],
+                 columns=[*columns, "extra"]).to_csv(csv_dir / "clients_raw.csv", index=False)
+    return csv_dir
+
+
+def load(raw_dir, tmp_path):
+    return raw_dataset.load("clients", raw_dir, tmp_path / "cache")
+
+
+def test_load_reads_the_declared_columns_as_text(raw_dir, tmp_path):
+    df = load(raw_dir, tmp_path)
+    assert list(df.columns) == list(raw_dataset.RAW_FILES["clients"]["dtypes"])
+    assert df.loc[0, "phone"] == "912345678"
+    manifest = json.loads((tmp_path / "cache" / "clients.json").read_text())
+    assert manifest["size"] == (raw_dir / "clients_raw.csv").stat().st_size
+
+
+def test_load_parses_once_per_process(raw_dir, tmp_path):
+    assert load(raw_dir, tmp_path) is load(raw_dir, tmp_path)
+
+
+def test_a_fresh_cache_is_read_instead_of_the_csv(raw_dir, tmp_path, monkeypatch):
+    load(raw_dir, tmp_path)
+    monkeypatch.setattr(raw_dataset, "_parsed", {})
+    monkeypatch.setattr(raw_dataset, "read_csv", lambda *args, **kwargs: pytest.fail("the CSV was parsed again"))
+    assert load(raw_dir, tmp_path).loc[0, "client_name"] == "Ana"
+
+
+def test_a_touched_but_unchanged_csv_keeps_its_cache(raw_dir, tmp_path, monkeypatch):
+    load(raw_dir, tmp_path)
+    path = raw_dir / "clients_raw.csv"
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+    monkeypatch.setattr(raw_dataset, "_parsed", {})
+    monkeypatch.setattr(raw_dataset, "read_csv", lambda *args, **kwargs: pytest.fail("the CSV was parsed again"))
+    load(raw_dir, tmp_path)
+    # the manifest now holds the new mtime, so the next run skips the hash
+    assert json.loads((tmp_path / "cache" / "clients.json").read_text())["mtime_ns"] == path.stat().st_mtime_ns
+
+
+def test_a_changed_csv_is_parsed_again(raw_dir, tmp_path, monkeypatch):
+    load(raw_dir, tmp_path)
+    path = raw_dir / "clients_raw.csv"
+    mtime = path.stat().st_mtime_ns
+    # same size: only the content hash tells the files apart
+    path.write_text(path.read_text().replace("Ana", "Rui"))
+    os.utime(path, ns=(mtime, mtime + 10**9))
+    monkeypatch.setattr(raw_dataset, "_parsed", {})
+    assert load(raw_dir, tmp_path).loc[0, "client_name"] == "Rui"
+
+
+def test_a_cache_of_another_format_is_stale(raw_dir, tmp_path):
+    load(raw_dir, tmp_path)
+    path = raw_dir / "clients_raw.csv"
+    manifest = json.loads((tmp_path / "cache" / "clients.json").read_text())
+    assert raw_dataset.cache_is_fresh(path, manifest)
+    assert not raw_dataset.cache_is_fresh(path, {**manifest, "format": "other"})
+    assert not raw_dataset.cache_is_fresh(path, {**manifest, "size": manifest["size"] + 1})
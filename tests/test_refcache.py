@@ -0,0 +1,77 @@
+import pytest
+
+import refcache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(refcache.time, "monotonic", clock)
+    return clock
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = refcache.TTLCache(maxsize=4, ttl=10)
+    cache.put(("region",), ["North"])
+    clock.now += 10
+    assert cache.get(("region",)) == (True, ["North"])
+    clock.now += 0.5
+    assert cache.get(("region",)) == (False, None)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = refcache.TTLCache(maxsize=2, ttl=60)
+    cache.put(("a",), 1)
+    cache.put(("b",), 2)
+    cache.get(("a",))
+    cache.put(("c",), 3)
+    assert cache.get(("b",)) == (False, None)
+    assert cache.get(("a",)) == (True, 1)
+    assert cache.get(("c",)) == (True, 3)
+
+
+def test_invalidate_drops_only_the_given_kinds(clock):
+    cache = refcache.TTLCache()
+    cache.put(("roster", "North"), ["T1"])
+    cache.put(("roster", "South"), ["T2"])
+    cache.put(("region",), ["North", "South"])
+    cache.invalidate(refcache.INVALIDATES["technician"])
+    assert cache.get(("roster", "North"))[0] is False
+    assert cache.get(("roster", "South"))[0] is False
+    assert cache.get(("region",)) == (True, ["North", "South"])
+
+
+def test_get_or_load_loads_once(clock):
+    cache = refcache.TTLCache()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return ["North"]
+
+    assert cache.get_or_load(("region",), load) == ["North"]
+    assert cache.get_or_load(("region",), load) == ["North"]
+    assert len(loads) == 1
+
+
+def test_load_overlapping_an_invalidation_is_not_stored(clock):
+    cache = refcache.TTLCache()
+
+    def load():
+        # a change is notified while the old value is being read
+        cache.invalidate(["region"])
+        return ["stale"]
+
+    assert cache.get_or_load(("region",), load) == ["stale"]
+    assert cache.get(("region",)) == (False, None)
+    assert cache.get_or_load(("region",), lambda: ["fresh"]) == ["fresh"]
+    assert cache.get(("region",)) == (True, ["fresh"])
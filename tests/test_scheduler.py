@@ -0,0 +1,50 @@
+import pytest
+
+import scheduler
+
+
+class RecordingConnection:
+    def __init__(self, fail_on=None):
+        self.statements = []
+        self.fail_on = fail_on
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+        if self.fail_on and self.fail_on in sql:
+            raise RuntimeError("insert failed")
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_publish_truncates_once_then_inserts_in_order():
+    conn = RecordingConnection()
+    scheduler.publish(conn, "public", ["region", "person", "technician"])
+
+    assert conn.statements[0] == "TRUNCATE public.region, public.person, public.technician;"
+    assert not any(s.startswith("DELETE FROM public.region") for s in conn.statements)
+    inserts = [s.split()[2] for s in conn.statements if s.startswith("INSERT")]
+    assert inserts == ["public.region", "public.person", "public.technician"]
+    assert "FROM public_stage.technician;" in conn.statements[3]
+    assert conn.commits == 1
+
+
+def test_publish_rolls_back_when_an_insert_fails():
+    conn = RecordingConnection(fail_on="INSERT INTO public.person")
+    with pytest.raises(RuntimeError):
+        scheduler.publish(conn, "public", ["region", "person"])
+    assert (conn.commits, conn.rollbacks) == (0, 1)
@@ -0,0 +1,69 @@
+import pytest
+
+import schema
+
+SQL = """
+-- a comment, with (parentheses); and a semicolon
+CREATE TABLE Region (
+    region_name VARCHAR(100) PRIMARY KEY
+);
+CREATE TABLE Person (
+    person_id VARCHAR(50) PRIMARY KEY,
+    email VARCHAR(100) UNIQUE,
+    manager_id VARCHAR(50) REFERENCES Person(person_id)
+);
+CREATE TABLE Technician (
+    person_id VARCHAR(50) PRIMARY KEY REFERENCES Person(person_id) ON DELETE CASCADE,
+    region_name VARCHAR(100) REFERENCES Region
+);
+CREATE TABLE Bills (
+    bills_id VARCHAR(50),
+    amount NUMERIC(10,2),
+    issue_date DATE NOT NULL,
+    technician_id VARCHAR(50) REFERENCES Technician(person_id),
+    PRIMARY KEY (bills_id, issue_date)
+) PARTITION BY RANGE (issue_date);
+"""
+
+
+@pytest.fixture
+def tables(tmp_path):
+    path = tmp_path / "schema.sql"
+    path.write_text(SQL)
+    return schema.parse_schema(path)
+
+
+def test_parse_schema(tables):
+    bills = tables["bills"]
+    assert bills["columns"] == ["bills_id", "amount", "issue_date", "technician_id"]
+    assert bills["primary_key"] == ["bills_id", "issue_date"]
+    assert bills["references"] == {"technician_id": "technician"}
+    assert bills["types"]["amount"] == "NUMERIC(10,2)"
+    assert bills["partition_key"] == "issue_date"
+    assert set(bills["not_null"]) == {"bills_id", "issue_date"}
+    assert tables["person"]["unique"] == ["email"]
+    assert tables["technician"]["references"] == {"person_id": "person", "region_name": "region"}
+    # a REFERENCES clause without a column points at the parent's primary key
+    assert tables["technician"]["reference_columns"] == {"person_id": "person_id", "region_name": "region_name"}
+
+
+def test_load_waves_put_parents_first_and_ignore_self_references(tables):
+    waves = schema.load_waves(["bills", "technician", "person", "region"], tables)
+    assert [sorted(wave) for wave in waves] == [["person", "region"], ["technician"], ["bills"]]
+    assert schema.load_order(["bills", "technician", "person", "region"], tables)[-1] == "bills"
+
+
+def test_load_waves_only_wait_for_tables_being_loaded(tables):
+    assert schema.load_waves(["bills"], tables) == [["bills"]]
+
+
+def test_load_waves_reject_a_cycle():
+    tables = {"a": {"references": {"b_id": "b"}}, "b": {"references": {"a_id": "a"}}}
+    with pytest.raises(ValueError, match="cycle"):
+        schema.load_waves(["a", "b"], tables)
+
+
+def test_the_real_schema_loads_in_foreign_key_order():
+    order = schema.load_order(list(schema.TABLES))
+    for table in order:
+        assert all(order.index(parent) < order.index(table) for parent in schema.dependencies(table))
@@ -0,0 +1,112 @@
+import asyncio
+import json
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import service
+
+
+class Writer:
+    def __init__(self):
+        self.data = b""
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def serve_bytes(request, service_=None):
+    """The (status, body) of every response the service writes for the raw `request`."""
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(request)
+        reader.feed_eof()
+        writer = Writer()
+        await (service_ or service.ElectrogridService(None, "")).handle(reader, writer)
+        assert writer.closed
+        return writer.data
+
+    responses = []
+    for response in asyncio.run(run()).split(b"HTTP/1.1 ")[1:]:
+        head, _, body = response.partition(b"\r\n\r\n")
+        responses.append((int(head.split()[0]), json.loads(body)))
+    return responses
+
+
+def test_to_json_serializes_dates_and_decimals():
+    assert json.dumps({"d": date(2025, 3, 1), "n": Decimal("12.50")}, default=service.to_json) == \
+        '{"d": "2025-03-01", "n": 12.5}'
+    with pytest.raises(TypeError):
+        service.to_json(object())
+
+
+def test_parse_date():
+    assert service.parse_date({"date_from": "2025-03-01"}, "date_from") == date(2025, 3, 1)
+    assert service.parse_date({}, "date_from") is None
+    with pytest.raises(service.RequestError) as error:
+        service.parse_date({"date_from": "March"}, "date_from")
+    assert error.value.status == 400
+
+
+def test_unknown_path_and_wrong_method():
+    assert serve_bytes(
+        b"GET /nothing HTTP/1.1\r\n\r\n"
+        b"DELETE /clients HTTP/1.1\r\nConnection: close\r\n\r\n"
+    ) == [
+        (404, {"error": "GET /nothing is not supported"}),
+        (405, {"error": "DELETE /clients is not supported"}),
+    ]
+
+
+def test_invalid_requests_are_rejected_before_the_database():
+    body = b"{not json"
+    responses = serve_bytes(
+        b"POST /clients HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body)
+        + b"GET /clients HTTP/1.1\r\n\r\n"
+        + b"GET /meter-checks?limit=ten HTTP/1.1\r\n\r\n"
+        + b"GET /meter-checks?after_date=2025-03-01 HTTP/1.1\r\n\r\n"
+        + b"POST /clients HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]"
+    )
+    assert responses == [
+        (400, {"error": "request body is not valid JSON"}),
+        (400, {"error": "phone is required"}),
+        (400, {"error": "limit must be a number"}),
+        (400, {"error": "after_date and after_id go together"}),
+        (400, {"error": 'expected {"clients": [{"name", "email", "phone", "address"}, ...]}'}),
+    ]
+
+
+def test_large_body_closes_the_connection():
+    responses = serve_bytes(
+        b"POST /clients HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % (service.MAX_BODY + 1)
+        + b"GET /health HTTP/1.1\r\n\r\n"
+    )
+    assert responses == [(413, {"error": "request body too large"})]
+
+
+def test_reference_listener_clears_the_cache_and_retries_after_any_error(monkeypatch):
+    attempts = []
+
+    async def connect(conninfo, autocommit=False):
+        attempts.append(conninfo)
+        if len(attempts) == 1:
+            raise RuntimeError("unexpected")
+        raise asyncio.CancelledError()
+
+    monkeypatch.setattr(service.psycopg.AsyncConnection, "connect", connect)
+    monkeypatch.setattr(service.refcache, "RECONNECT_DELAY", 0)
+    reference = service.ReferenceData(None, "dbname=test")
+    reference.cache.put(("region",), ["Porto"])
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(reference.listen())
+    assert len(attempts) == 2
+    assert reference.cache.get(("region",)) == (False, None)
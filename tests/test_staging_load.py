@@ -0,0 +1,80 @@
+import re
+
+import pytest
+
+import staging_load
+from cleaning import SPECS
+
+
+class RecordingCursor:
+    rowcount = 0
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, sql, params=None):
+        self.statements.append(sql)
+
+    def fetchone(self):
+        return (0,)
+
+
+def test_text_sql_strips_and_treats_pandas_na_strings_as_null():
+    sql = staging_load.text_sql('r."email"')
+    assert sql.startswith('NULLIF(btrim(CASE WHEN r."email" = ANY(ARRAY[')
+    assert all(f"'{value}'" in sql for value in staging_load.NA_VALUES)
+    assert sql.endswith(f"ELSE r.\"email\" END, {staging_load.WHITESPACE}), '')")
+
+
+@pytest.mark.parametrize("spec, expected", [
+    ({"kind": "id"}, "t"),
+    ({"kind": "category", "case": "title"}, "initcap(t)"),
+    ({"kind": "category", "case": "upper"}, "upper(t)"),
+    ({"kind": "phone"}, r"NULLIF(right(regexp_replace(t, '\D', '', 'g'), 9), '')::BIGINT"),
+])
+def test_column_sql(spec, expected):
+    assert staging_load.column_sql(spec, "t") == expected
+
+
+def test_numbers_are_checked_before_the_cast_and_rounded():
+    sql = staging_load.column_sql({"kind": "number", "decimals": 2}, "t")
+    assert re.fullmatch(r"round\(CASE WHEN t ~ '.+' THEN t::NUMERIC END, 2\)", sql)
+
+
+def test_dates_are_only_cast_once_their_parts_are_valid():
+    sql = staging_load.column_sql({"kind": "date"}, "t")
+    assert sql.startswith("CASE WHEN length(t) = 10")
+    assert sql.endswith("THEN t::DATE END END")
+    with pytest.raises(ValueError, match="only reads"):
+        staging_load.column_sql({"kind": "date", "format": "%d/%m/%Y"}, "t")
+
+
+def test_late_kinds_stay_text_until_typed():
+    specs = SPECS["connections"]["columns"]
+    assert staging_load.typed_sql(specs["connection_id"], "connection_id") == "c.connection_id"
+    assert staging_load.typed_sql(specs["install_date"], "install_date").endswith("THEN c.install_date::DATE END END")
+
+
+def test_value_checks_follow_the_declared_types():
+    checks = staging_load.value_checks("bills", {"amount": "a", "client_id": "c", "issue_date": "d"})
+    assert checks == [("abs(a) >= 1e8", "value_out_of_range"), ("length(c) > 50", "value_too_long")]
+
+
+def test_cleaned_sql_ranks_the_sources_and_splits_the_skills():
+    sql = staging_load.cleaned_sql("electrogrid_raw", staging_load.SOURCES["person"])
+    selects = sql.split("\nUNION ALL\n")
+    assert [re.search(r"(\d+) AS priority", s).group(1) for s in selects] == ["0", "1"]
+    assert "FROM electrogrid_raw.clients r OFFSET 0" in selects[0]
+    skills = staging_load.cleaned_sql("electrogrid_raw", staging_load.SOURCES["technician_skill"])
+    assert "regexp_split_to_table(t.skills, ',') WITH ORDINALITY" in skills
+
+
+def test_insert_checked_checks_in_reason_order():
+    cur = RecordingCursor()
+    staging_load.insert_checked(cur, "electrogrid", "connections")
+    statement = cur.statements[0]
+    reasons = re.findall(r"THEN '(\w+)'", statement)
+    assert reasons[:2] == ["missing_value", "duplicate_key"]
+    assert reasons.index("unknown_client_id") < reasons.index("value_too_long") < reasons.index("duplicate_meter_serial")
+    assert "INSERT INTO electrogrid.load_rejects" in statement
+    assert "INSERT INTO electrogrid.connections (connection_id," in statement
@@ -0,0 +1,27 @@
+import pandas as pd
+
+import streaming
+
+
+def chunks(rows, size):
+    frame = pd.DataFrame(rows, columns=["bill_id", "client_id"])
+    return (frame.iloc[i:i + size] for i in range(0, len(frame), size))
+
+
+def test_distinct_values_across_chunks():
+    rows = [("B1", "C2"), ("B2", None), ("B3", "C1"), ("B4", "C2")]
+    assert streaming.distinct_values(chunks(rows, 1), "client_id")["client_id"].tolist() == ["C1", "C2"]
+
+
+def test_stream_table_keeps_the_first_row_of_a_key_before_filtering():
+    # B1's first row has an unknown client: it is dropped, and so is its later duplicate
+    rows = [("B1", "C9"), ("B2", "C1"), ("B1", "C1"), ("B3", "C1"), ("B2", "C1")]
+    inserted = []
+
+    def insert(cur, table, df):
+        inserted.append((table, df["bill_id"].tolist()))
+
+    total = streaming.stream_table(None, chunks(rows, 2), "bills", lambda chunk: chunk, "bill_id",
+                                   {"client_id": {"C1"}}, insert)
+    assert total == 2
+    assert inserted == [("bills", ["B2"]), ("bills", ["B3"])]
@@ -0,0 +1,160 @@
+import pandas as pd
+
+import raw_dataset
+from cleaning import clean
+from streaming import distinct_values
+
+
+# Read, clean, and transform the data
+#
+# One function per database table. Each takes the raw data directory and
+# returns a DataFrame whose columns match the table, so the loader can run the
+# transforms in any order (or in separate processes) and load the results.
+# Raw files come from raw_dataset, which parses each of them once per process,
+# and the column rules for every table live in cleaning.SPECS.
+
+
+# ------------------------------------Lookup tables-------------------------------------#
+
+def build_region(csv_dir):
+    return clean(raw_dataset.load("technicians", csv_dir), "region")
+
+
+def build_connection_type(csv_dir):
+    return clean(raw_dataset.load("connections", csv_dir), "connection_type")
+
+
+def build_status(csv_dir):
+    return clean(raw_dataset.load("connections", csv_dir), "status")
+
+
+def build_service_type(csv_dir, chunksize=None):
+    """Distinct service types. With `chunksize` only that column is read, in chunks."""
+    if chunksize is None:
+        raw = raw_dataset.load("service_orders", csv_dir)
+    else:
+        raw = distinct_values(
+            raw_dataset.read_chunks("service_orders", chunksize, ['service_type'], csv_dir), 'service_type'
+        )
+    return clean(raw, "service_type")
+
+
+# ------------------------------------Person and Client---------------------------------#
+
+def build_person(csv_dir):
+    client_person_df = clean(raw_dataset.load("clients", csv_dir), "client_person")
+    tech_df = clean(raw_dataset.load("technicians", csv_dir), "technician_person")
+
+    person_df = pd.concat([client_person_df, tech_df], ignore_index=True)
+    return person_df.drop_duplicates(subset=['person_id'], keep='first')
+
+
+def build_client(csv_dir):
+    return clean(raw_dataset.load("clients", csv_dir), "client")
+
+
+# -------------------------- SERVICE ORDERS ----------------------------------------------#
+
+def clean_service_orders(df_raw):
+    """Clean raw service orders (a whole file or one chunk of it). FK filtering is left to the caller."""
+    return clean(df_raw, "service_orders")
+
+
+def build_service_orders(csv_dir):
+    df_service_orders = clean_service_orders(raw_dataset.load("service_orders", csv_dir))
+    return df_service_orders[df_service_orders['client_id'].isin(build_client(csv_dir)['person_id'])]
+
+
+#-----------------------------------Bills--------------------------------------------------------#
+
+def clean_bills(df_raw):
+    """Clean raw bills (a whole file or one chunk of it). FK filtering is left to the caller."""
+    return clean(df_raw, "bills")
+
+
+def build_bills(csv_dir):
+    df_bills = clean_bills(raw_dataset.load("bills", csv_dir))
+    return df_bills[df_bills['client_id'].isin(build_client(csv_dir)['person_id'])]
+
+
+#-------------------------------------Connections---------------------------------------------#
+
+def build_connections(csv_dir):
+    df_connnections = clean(raw_dataset.load("connections", csv_dir), "connections")
+    return df_connnections[df_connnections['client_id'].isin(build_client(csv_dir)['person_id'])]
+
+
+# ------------------------------------Technician_Skills and Skills------------------#
+
+def build_technician_skill(csv_dir):
+    raw_tdf = raw_dataset.load("technicians", csv_dir)
+
+    # Split the comma-separated skills and explode into one row per skill
+    skills = raw_tdf[["technician_id", "skills"]].assign(skills=raw_tdf["skills"].str.split(","))
+    return clean(skills.explode("skills", ignore_index=True), "technician_skill")
+
+
+def build_skills(csv_dir):
+    # Separate df for unique skills
+    df_technician_skill = build_technician_skill(csv_dir)
+    return pd.DataFrame({"skill_name": df_technician_skill["skill_name"].drop_duplicates()})
+
+
+# ------------------------------------Technicians-----------------------------------------#
+
+def build_technician(csv_dir):
+    return clean(raw_dataset.load("technicians", csv_dir), "technician")
+
+
+# ------------------------------------Meter_Check-----------------------------------------#
+
+meter_check_data = [
+    ('CH001', 'MTR1000', 'T001', '2024-03-12', 'overload detected'),
+    ('CH002', 'MTR1001', 'T002', '2024-07-28', '42 kwh'),
+    ('CH003', 'MTR1002', 'T003', '2024-11-05', 'calibration needed'),
+    ('CH004', 'MTR1003', 'T004', '2024-05-17', '57 kwh'),
+    ('CH005', 'MTR1004', 'T005', '2024-09-14', 'display faulty'),
+    ('CH006', 'MTR1005', 'T006', '2024-02-08', '23 kwh'),
+    ('CH007', 'MTR1006', 'T007', '2024-12-30', 'communication error'),
+    ('CH008', 'MTR1007', 'T008', '2024-06-21', '68 kwh'),
+    ('CH009', 'MTR1008', 'T009', '2024-04-03', 'voltage spike'),
+    ('CH010', 'MTR1009', 'T010', '2024-10-11', '19 kwh'),
+    ('CH011', 'MTR1010', 'T011', '2024-08-25', 'meter replacement'),
+    ('CH012', 'MTR1011', 'T012', '2024-01-15', '76 kwh'),
+    ('CH013', 'MTR1012', 'T013', '2024-07-07', 'sensor failure'),
+    ('CH014', 'MTR1013', 'T014', '2024-03-29', '34 kwh'),
+    ('CH015', 'MTR1014', 'T015', '2024-12-12', 'battery low'),
+    ('CH016', 'MTR1015', 'T016', '2024-05-05', '89 kwh'),
+    ('CH017', 'MTR1016', 'T017', '2024-09-18', 'wiring issue'),
+    ('CH018', 'MTR1017', 'T018', '2024-02-22', '12 kwh'),
+    ('CH019', 'MTR1018', 'T019', '2024-11-08', 'reset required'),
+    ('CH020', 'MTR1019', 'T020', '2024-06-14', '95 kwh')]
+
+
+def build_meter_check(csv_dir):
+    return pd.DataFrame(
+        meter_check_data,
+        columns=["check_id", "meter_serial", "technician_id", "check_date", "meter_read"]
+    )
+
+
+TRANSFORMS = {
+    "region": build_region,
+    "connection_type": build_connection_type,
+    "status": build_status,
+    "service_type": build_service_type,
+    "person": build_person,
+    "client": build_client,
+    "technician": build_technician,
+    "skills": build_skills,
+    "technician_skill": build_technician_skill,
+    "connections": build_connections,
+    "meter_check": build_meter_check,
+    "bills": build_bills,
+    "service_orders": build_service_orders,
+}
+
+
+def build(table, csv_dir):
+    """Run the transform for one table."""
+    return TRANSFORMS[table](csv_dir)